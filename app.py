@@ -1,6 +1,8 @@
 # ─── Standard library imports ─────────────
 import os
 import re
+import atexit
+import threading
 import sqlite3
 import time
 from datetime import datetime, timedelta
@@ -32,6 +34,22 @@ NOTION_VIOLATION_URL = os.getenv("NOTION_VIOLATION_URL")
 DB_PATH = os.getenv("SCORES_DB_PATH", "scores.db")
 # ─── Scoreboard Top-N ─────────────
 TOP_N = int(os.getenv("TOP_N", "5"))
+# メモリ上のスコアボードを events と照合し直す間隔（分）
+LIVE_SCOREBOARD_RECONCILE_MIN = int(os.getenv("LIVE_SCOREBOARD_RECONCILE_MIN", "60"))
+# message イベントの分類ワーカー数（0 ならリスナーで同期処理）・キュー上限・再試行回数
+MESSAGE_WORKERS = int(os.getenv("MESSAGE_WORKERS", "4"))
+MESSAGE_QUEUE_SIZE = int(os.getenv("MESSAGE_QUEUE_SIZE", "500"))
+MESSAGE_MAX_ATTEMPTS = int(os.getenv("MESSAGE_MAX_ATTEMPTS", "3"))
+# pending_messages に残った分を積み直す間隔（秒）
+MESSAGE_SWEEP_SEC = int(os.getenv("MESSAGE_SWEEP_SEC", "30"))
+# Socket Mode の接続を確認して受信中の区間（ingest_windows）を延ばす間隔（秒）。daily_import はこの区間の外だけを取り直す
+INGEST_HEARTBEAT_SEC = int(os.getenv("INGEST_HEARTBEAT_SEC", "60"))
+# 違反・ポジティブFB・回答を 1 回の LLM 呼び出しで判定する（失敗時は判定ごとの呼び出しにフォールバック）。既定はオフ
+LLM_COMBINED = os.getenv("LLM_COMBINED", "0").lower() in ("1", "true", "yes")
+# 判定ごとに呼ぶ場合に、違反・ポジティブFB・回答の LLM 判定を同時に投げる投機モード（追加のトークンを消費する）
+LLM_SPECULATIVE = os.getenv("LLM_SPECULATIVE", "0").lower() in ("1", "true", "yes")
+# 夜間レポート（集計・グラフ・アップロード）用のスケジューラスレッド数
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "2"))
 
 # openai, clf env assignment
 import openai
@@ -45,12 +63,22 @@ clf.MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor
 from slack_sdk.errors import SlackApiError
 
 # ─── Utils imports ─────────────
 from utils.constants import WEIGHTS
-from utils.slack_helpers import resolve_user, resolve_channel, humanize_mentions
+from utils.slack_helpers import (
+    resolve_user,
+    resolve_channel,
+    mention_ids,
+    humanize_mentions,
+    new_web_client,
+    directory,
+    slack_api_stats,
+)
 from utils.classifier import (
+    analyze_message,
     classify_text,
     detect_positive_feedback,
     is_likely_answer,
@@ -58,19 +86,33 @@ from utils.classifier import (
     RULES_MAP,
 )
 from utils.db import (
+    get_conn,
+    exit_on_signals,
     update_score,
     record_event,
     is_positive_reaction,
     cache_positive_reaction,
     mark_reaction_scored,
+    live_scoreboard,
+    rebuild_live_scoreboard,
+    purge_pending_messages,
+    upsert_slack_post,
+    delete_slack_post,
+    open_ingest_window,
+    touch_ingest_window,
 )
+from utils.message_pipeline import MessagePipeline
+from utils.thread_parents import ThreadParentCache
+from utils.speculative import Check, run_chain
+from utils.prefilter import prefilter
+from utils import speculative, llm_client, llm_usage
 from utils.llm_judge import judge_positive_reaction, apply_all_positive_reactions
-from utils.scoring import fetch_user_counts, compute_score
+from utils.scoring import fetch_user_counts, fetch_leaderboards, compute_score
 from publish_master_upsert import publish_today_only, publish_all_periods
-from utils.scoring import fetch_user_counts
 from violation_trends import main as run_violation_trends
 from publish_user_metrics import main as publish_user_metrics
 import daily_import
+from utils.charts import start_pool as start_chart_pool
 
 if not all(
     [SLACK_BOT_TOKEN, SLACK_APP_TOKEN, ADMIN_CHANNEL, QUESTION_CHANNEL, BOT_DEV_CHANNEL]
@@ -79,7 +121,11 @@ if not all(
     exit(1)
 
 # ─── Bolt アプリ初期化 ─────────────────────────────────
-app = App(token=SLACK_BOT_TOKEN)
+# app.client もレート制限・single-flight 付きの共有クライアントにする
+# （環境変数の SLACK_BOT_TOKEN と client を両方渡すと Bolt が起動時に警告を出すが、token は同じもの）
+app = App(client=new_web_client(SLACK_BOT_TOKEN))
+# 質問チャンネルのスレッド親（回答判定用）。slack_posts → API の順に引く
+thread_parents = ThreadParentCache(app.client)
 
 
 # ─── ガイドライン違反通知関数 ────────────────────────────────────────
@@ -87,11 +133,14 @@ app = App(token=SLACK_BOT_TOKEN)
 def notify_violation(
     user: str, text: str, channel: str, ts: str, rules: list[int] | None = None
 ):
-    username = resolve_user(user)
+    # 名前解決は通知を組み立てるここで行う（permalink の取得中にバックグラウンドで引いておく）
+    directory.prefetch(user_ids=[user, *mention_ids(text)], channel_ids=[channel])
     try:
         link = app.client.chat_getPermalink(channel=channel, message_ts=ts)["permalink"]
     except SlackApiError:
         link = None
+    username = resolve_user(user)
+    text = humanize_mentions(text)
     alert = f"<!channel> :rotating_light: *ガイドライン違反検知！*\n"
     alert += f"User: {username}\nText: {text}\n"
     # 違反規約番号＋本文を追加
@@ -117,14 +166,15 @@ def notify_violation(
 
 # ─── ランキング用ブロック生成 ─────────────────────────────────
 def build_scoreboard_blocks(
-    period_name: str, since: datetime = None, until: datetime = None
+    period_name: str, since: datetime = None, until: datetime = None, rows=None
 ):
-    # ── fetch_user_counts で集計 ───────────────────────────────────
-    db_path = DB_PATH
-    since_ts = since.timestamp() if since else 0.0
-    until_ts = until.timestamp() if until else time.time()
-    # 返り値: [(user_id, posts, reactions, answers, positive_fb, violations, score), ...]
-    rows = fetch_user_counts(db_path, since_ts, until_ts, limit=TOP_N)
+    # ── fetch_user_counts で集計（fetch_leaderboards で集計済みなら rows を渡す） ──────
+    if rows is None:
+        db_path = DB_PATH
+        since_ts = since.timestamp() if since else 0.0
+        until_ts = until.timestamp() if until else time.time()
+        # 返り値: [(user_id, posts, reactions, answers, positive_fb, violations, score), ...]
+        rows = fetch_user_counts(db_path, since_ts, until_ts, limit=TOP_N)
 
     if since and until:
         # Explicit date-range specified by user (YYYYMMDD-YYYYMMDD)
@@ -139,10 +189,10 @@ def build_scoreboard_blocks(
     else:
         # Cumulative over all time
         # 全期間用に、DBの最古イベント日時と現在時刻を取得
-        cur_db = sqlite3.connect(DB_PATH).cursor()
-        cur_db.execute("SELECT MIN(ts_epoch) FROM events")
-        min_ts = cur_db.fetchone()[0] or 0.0
-        cur_db.connection.close()
+        min_ts = (
+            get_conn(DB_PATH).execute("SELECT MIN(ts_epoch) FROM events").fetchone()[0]
+            or 0.0
+        )
         start_dt = datetime.fromtimestamp(min_ts)
         end_dt = datetime.now()
         start_str = start_dt.strftime("%Y/%m/%d %H:%M")
@@ -168,8 +218,8 @@ def build_scoreboard_blocks(
         )
         return blocks
 
+    # <@uid> は Slack 側で表示名に置き換わるので、ここでは名前を引かない
     for i, (uid, posts, reacts, answers, pf, vio, score) in enumerate(rows, start=1):
-        uname = resolve_user(uid)
         text = (
             # f"*{i}.* @{uname}  *Score: {score:.1f}*\n"
             f"*{i}.* <@{uid}>  *Score: {score:.1f}*\n"
@@ -230,7 +280,38 @@ def handle_message(event, client):
     # logger.info(f"🔍 handle_message event: ts={event.get('ts')}, subtype={event.get('subtype')}, text={event.get('text')}")  # debug
     if event.get("bot_id"):
         return
+    chan_id = event.get("channel")
+    if chan_id == ADMIN_CHANNEL:
+        return
+    # 保存してキューに積むだけで戻り、分類は message_pipeline のワーカーで行う
+    event_ts = event.get("event_ts") or event.get("ts")
+    if not message_pipeline.submit(chan_id, event_ts, event):
+        logger.info(f"duplicate message event ignored: channel={chan_id} ts={event_ts}")
+
+
+# slack_posts に保存する message の subtype（参加・退出などのシステムメッセージは除く）
+_POST_SUBTYPES = (None, "message_changed", "thread_broadcast", "file_share")
+
+
+def process_message(event):
+    """message イベント 1 件の分類・記録・通知（message_pipeline のワーカーから呼ばれる）"""
     subtype = event.get("subtype")
+    # 削除イベント（返信のあるスレッド親の削除は tombstone への編集として届く）は slack_posts から消すだけ
+    deleted_ts = event.get("deleted_ts")
+    if (
+        subtype == "message_changed"
+        and event.get("message", {}).get("subtype") == "tombstone"
+    ):
+        deleted_ts = event["message"].get("ts")
+    if subtype == "message_deleted" or deleted_ts:
+        if deleted_ts:
+            delete_slack_post(event.get("channel"), deleted_ts)
+            thread_parents.invalidate(event.get("channel"), deleted_ts)
+            logger.info(
+                f"message deleted: channel={event.get('channel')} ts={deleted_ts}"
+            )
+        return
+
     # 編集イベントの場合
     if subtype == "message_changed":
         ev = event.get("message", {})
@@ -238,27 +319,94 @@ def handle_message(event, client):
         user_id = ev.get("user")
         chan_id = event.get("channel")
         ts = ev.get("message", {}).get("ts")
+        post = ev
     else:
         raw_text = event.get("text", "")
         user_id = event.get("user")
         chan_id = event.get("channel")
         ts = event.get("ts")
+        post = event
+
+    # 受信した投稿は slack_posts にも保存する（夜間のパイプラインとスレッド親の参照で共有）。
+    # 編集ならスレッド親のキャッシュから捨て、次の参照で保存し直した本文を使う
+    if subtype in _POST_SUBTYPES and user_id and post.get("ts"):
+        upsert_slack_post(post["ts"], chan_id, user_id, raw_text, post.get("thread_ts"))
+        if subtype == "message_changed":
+            thread_parents.invalidate(chan_id, post["ts"])
+
+    # ログには ID をそのまま出し、名前は通知を組み立てるとき（notify_violation）に引く
+    # 判定チェーン: 違反 → ポジティブFB → （質問チャンネルのスレッド返信なら）回答。
+    # 先の判定が決着したら後ろは使わない。LLM_COMBINED なら analyze_message の 1 回で全判定し、
+    # そうでなければ判定ごとに呼ぶ（LLM_SPECULATIVE なら全判定を同時に実行する）
+    is_thread_reply = (
+        chan_id == QUESTION_CHANNEL
+        and event.get("thread_ts")
+        and event["thread_ts"] != ts
+    )
 
-    if chan_id == ADMIN_CHANNEL:
-        return
+    def fetch_parent():
+        return thread_parents.get(chan_id, event["thread_ts"])
+
+    if LLM_COMBINED:
+        # 1 回の LLM 呼び出しで全判定（自己返信なら回答判定はしない）
+        parent = fetch_parent() if is_thread_reply else {}
+        parent_user = parent.get("user")
+        ask_answer = is_thread_reply and user_id != parent_user
+        analysis = run_chain(
+            [
+                Check(
+                    "analysis",
+                    lambda: analyze_message(
+                        raw_text, parent.get("text", "") if ask_answer else None
+                    ),
+                    lambda r: True,
+                )
+            ]
+        )["analysis"]
+        checks_done = {
+            "violation": {
+                "violation": analysis["violation"],
+                "rules": analysis["rules"],
+            },
+            "positive_feedback": analysis["positive_feedback"],
+            "answer": (parent_user, bool(analysis["is_answer"])),
+        }
+    else:
 
-    text = humanize_mentions(raw_text)
-    cname = resolve_channel(chan_id)
-    uname = resolve_user(user_id)
+        def answer_check():
+            # 親投稿の作者と同じなら自己返信として LLM 判定しない
+            parent = fetch_parent()
+            parent_user = parent.get("user")
+            is_answer = user_id != parent_user and is_likely_answer(
+                parent.get("text", ""), raw_text
+            )
+            return parent_user, is_answer
+
+        checks = [
+            Check(
+                "violation",
+                lambda: classify_text(raw_text),
+                lambda r: r.get("violation"),
+            ),
+            Check(
+                "positive_feedback", lambda: detect_positive_feedback(raw_text), bool
+            ),
+        ]
+        if is_thread_reply:
+            checks.append(Check("answer", answer_check, lambda r: True))
+        checks_done = run_chain(checks, speculative=LLM_SPECULATIVE)
+
+    # ここから先は events・スコア・通知の副作用なので、失敗しても再処理しない（重複記録・二重通知を防ぐ）
+    message_pipeline.mark_committed()
 
     # 1. ガイドライン違反検知
-    result = classify_text(raw_text)
+    result = checks_done["violation"]
     if result.get("violation"):
         rules = result.get("rules", [])
         # ルールIDリストをカンマ区切り文字列に
         rules_str = ",".join(str(n) for n in rules) if rules else None
         logger.info(
-            f"message classify_text in #{cname} by @{uname} (ts={ts}): '{text}' -> {result}"
+            f"message classify_text in {chan_id} by {user_id} (ts={ts}): '{raw_text}' -> {result}"
         )
         record_event(
             user_id=user_id,
@@ -266,77 +414,71 @@ def handle_message(event, client):
             ts_epoch=ts,
             violation_rule=rules_str,
         )
-        notify_violation(user_id, text, chan_id, ts, rules)
+        notify_violation(user_id, raw_text, chan_id, ts, rules)
         update_score(user_id, violation=True)
-        # logger.info(f"score updated: user=@{uname} field=violation channel=#{cname} ts={ts}")
+        # logger.info(f"score updated: user={user_id} field=violation channel={chan_id} ts={ts}")
         logger.info(
-            f"score updated: user=@{uname} field=violation channel=#{cname} ts={ts}{f' rules={rules}' if rules else ''}"
+            f"score updated: user={user_id} field=violation channel={chan_id} ts={ts}{f' rules={rules}' if rules else ''}"
         )
         return
 
     # 2. ポジティブフィードバック検出
-    targets = detect_positive_feedback(raw_text)
+    targets = checks_done["positive_feedback"]
     if targets:
-        name_list = [resolve_user(uid) for uid in set(targets)]
         logger.info(
-            f"positive feedback detected in #{cname}: targets={name_list} text='{text}'"
+            f"positive feedback detected in {chan_id}: targets={sorted(set(targets))} text='{raw_text}'"
         )
         for tgt in set(targets):
             if tgt != user_id:
                 record_event(tgt, "positive_feedback", ts_epoch=ts)
                 update_score(tgt, positive_feedback=True)
-                tname = resolve_user(tgt)
                 logger.info(
-                    f"score updated: user=@{tname} field=positive_feedback channel=#{cname} ts={ts}"
+                    f"score updated: user={tgt} field=positive_feedback channel={chan_id} ts={ts}"
                 )
         return
 
     # 3. スレッド返信の回答判定（親投稿の作者と同じなら自己返信としてpost扱い）
-    if (
-        chan_id == QUESTION_CHANNEL
-        and event.get("thread_ts")
-        and event["thread_ts"] != ts
-    ):
+    if is_thread_reply:
         logger.info(
-            f"message classify_text in #{cname} by @{uname} (ts={ts}) (thread reply): '{text}' -> {result}"
+            f"message classify_text in {chan_id} by {user_id} (ts={ts}) (thread reply): '{raw_text}' -> {result}"
         )
-        parent_ts = event["thread_ts"]
-        try:
-            parent = app.client.conversations_replies(
-                channel=chan_id, ts=parent_ts, limit=1
-            )["messages"][0]
-            parent_user = parent.get("user")
-        except SlackApiError:
-            parent_user = None
+        parent_user, is_answer = checks_done["answer"]
 
         logger.info(
-            f"thread reply in #{cname} by @{uname} (ts={ts}), parent_author={parent_user}"
+            f"thread reply in {chan_id} by {user_id} (ts={ts}), parent_author={parent_user}"
         )
         # 自己返信ならpost、それ以外は回答 or post
-        # if user_id != parent_user and is_likely_answer(raw_text):
-        if user_id != parent_user and is_likely_answer(
-            parent.get("text", ""), raw_text
-        ):
+        if is_answer:
             record_event(user_id, "answer", ts_epoch=ts)
             update_score(user_id, answer=True)
             logger.info(
-                f"score updated: user=@{uname} field=answer channel=#{cname} ts={ts}"
+                f"score updated: user={user_id} field=answer channel={chan_id} ts={ts}"
             )
         else:
             record_event(user_id, "post", ts_epoch=ts)
             update_score(user_id, post=True)
             logger.info(
-                f"score updated: user=@{uname} field=post channel=#{cname} ts={ts}"
+                f"score updated: user={user_id} field=post channel={chan_id} ts={ts}"
             )
         return
 
     # 4. 通常投稿
     logger.info(
-        f"message classify_text in #{cname} by @{uname} (ts={ts}): '{text}' -> {result}"
+        f"message classify_text in {chan_id} by {user_id} (ts={ts}): '{raw_text}' -> {result}"
     )
     record_event(user_id, "post", ts_epoch=ts)
     update_score(user_id, post=True)
-    logger.info(f"score updated: user=@{uname} field=post channel=#{cname} ts={ts}")
+    logger.info(f"score updated: user={user_id} field=post channel={chan_id} ts={ts}")
+
+
+# 分類ワーカー（__main__ で start() する）
+message_pipeline = MessagePipeline(
+    process_message,
+    workers=MESSAGE_WORKERS,
+    max_queue=MESSAGE_QUEUE_SIZE,
+    max_attempts=MESSAGE_MAX_ATTEMPTS,
+)
+atexit.register(message_pipeline.stop)
 
 
 # ─── リアクション追加ハンドラ ─────────────────────────
@@ -359,10 +501,6 @@ def handle_reaction(event, client):
     if reactor_id == author_id:  # セルフリアクションは無視
         return
 
-    author_name = resolve_user(author_id)
-    reactor_name = resolve_user(reactor_id)
-    chan_name = resolve_channel(chan_id)
-
     # logger.info(f"handle_reaction: author_id={author_id}, reactor_id={reactor_id}, reaction={reaction}, ts_epoch={ts_epoch}")  # Debug
 
     # 1. すべてのリアクションをDB eventsに記録（加点せず記録のみ！）
@@ -377,19 +515,19 @@ def handle_reaction(event, client):
     # 2. POSITIVE_REACTIONS またはポジティブとしてキャッシュ済みにマッチしたときのみ加点（マッチしなかったものは日次でLLMよる判定と判定結果に基づいた加点を行う）
     if reaction in POSITIVE_REACTIONS:
         update_score(author_id, reaction=True)
-        mark_reaction_scored(evt_id)
+        mark_reaction_scored(evt_id, user_id=author_id, ts_epoch=ts_epoch)
         logger.info(
-            f"reaction_added: {reactor_name} reacted '{reaction}' to {author_name}'s message in #{chan_name} (ts={ts}); counted as reaction (STATIC POSITIVE)"
+            f"reaction_added: {reactor_id} reacted '{reaction}' to {author_id}'s message in {chan_id} (ts={ts}); counted as reaction (STATIC POSITIVE)"
         )
     elif is_positive_reaction(reaction):
         update_score(author_id, reaction=True)
-        mark_reaction_scored(evt_id)
+        mark_reaction_scored(evt_id, user_id=author_id, ts_epoch=ts_epoch)
         logger.info(
-            f"reaction_added: {reactor_name} reacted '{reaction}' to {author_name}'s message in #{chan_name} (ts={ts}); counted as reaction (CACHED POSITIVE)"
+            f"reaction_added: {reactor_id} reacted '{reaction}' to {author_id}'s message in {chan_id} (ts={ts}); counted as reaction (CACHED POSITIVE)"
         )
     else:  # ポジティブ未定義のreactionがきたらログに出すだけ。（即時LLM判定する場合はelse以下は不要）
         logger.info(
-            f"reaction_added: {reactor_name} reacted '{reaction}' to {author_name}'s message in #{chan_name} (ts={ts}); recorded only (will be judged in batch)"
+            f"reaction_added: {reactor_id} reacted '{reaction}' to {author_id}'s message in {chan_id} (ts={ts}); recorded only (will be judged in batch)"
         )
     """
     # ここからLLM判定スイッチ
@@ -401,12 +539,12 @@ def handle_reaction(event, client):
             cache_positive_reaction(reaction, is_pos)
         if is_pos:
             update_score(author_id, reaction=True)
-            logger.info(f"reaction_added (LLM): '{reaction}' judge:positive, {reactor_name} reacted '{reaction}' to {author_name}'s message in #{chan_name} (ts={ts}); counted as reaction")
+            logger.info(f"reaction_added (LLM): '{reaction}' judge:positive, {reactor_id} reacted '{reaction}' to {author_id}'s message in {chan_id} (ts={ts}); counted as reaction")
         else:
-            logger.info(f"reaction_added (LLM): '{reaction}' judge:not_positive, {reactor_name} reacted '{reaction}' to {author_name}'s message in #{chan_name} (ts={ts}); NOT counted as reaction")
+            logger.info(f"reaction_added (LLM): '{reaction}' judge:not_positive, {reactor_id} reacted '{reaction}' to {author_id}'s message in {chan_id} (ts={ts}); NOT counted as reaction")
     else:
         # LLM未使用: eventsへの記録のみ
-        logger.info(f"reaction_added: {reactor_name} reacted '{reaction}' to {author_name}'s message in #{chan_name} (ts={ts}); no LLM check (no score change)")
+        logger.info(f"reaction_added: {reactor_id} reacted '{reaction}' to {author_id}'s message in {chan_id} (ts={ts}); no LLM check (no score change)")
     """
 
 
@@ -417,6 +555,16 @@ def handle_reaction_removed(event, client):
     pass
 
 
+# ─── ユーザー名・チャンネル名の変更をディレクトリに反映 ─────────────
+@app.event("user_change")
+@app.event("team_join")
+@app.event("channel_rename")
+@app.event("channel_created")
+@app.event("group_rename")
+def handle_directory_change(event):
+    directory.on_event(event)
+
+
 # ─── /scoreboard コマンドハンドラ ──────────────────────
 @app.command("/scoreboard")
 def show_scoreboard(ack, body, respond):
@@ -429,7 +577,9 @@ def show_scoreboard(ack, body, respond):
     period_name, since, until = parse_period(body.get("text", ""))
     # print(f"[DEBUG] since={since} ({since.timestamp() if since else None}) until={until} ({until.timestamp() if until else None})")  ## Debug
     # blocks = build_scoreboard_blocks(period_name, since)
-    blocks = build_scoreboard_blocks(period_name, since, until)
+    # today / daily / weekly はメモリ上のスコアボードから返す（未構築なら SQL で集計）
+    rows = live_scoreboard.top((body.get("text") or "").strip().lower(), TOP_N)
+    blocks = build_scoreboard_blocks(period_name, since, until, rows=rows)
     respond(blocks=blocks)
     uname = resolve_user(body["user_id"])
     logger.info(f"/scoreboard executed: period={period_name} user=@{uname}")
@@ -457,6 +607,27 @@ def handle_apply_reactions(ack, body, respond, logger):
         logger.error(f"/apply_reactions failed: {e}")
 
 
+# ─── /llm_stats コマンドハンドラ ──────────────────────
+@app.command("/llm_stats")
+def show_llm_stats(ack, body, respond):
+    """/llm_stats [日数]: 直近の LLM 呼び出しを呼び出し元ごとに集計して表示（既定は 1 日）"""
+    ack()
+    user_chan = body.get("channel_id")
+    if user_chan != ADMIN_CHANNEL:
+        respond(f"このコマンドは <#{ADMIN_CHANNEL}> でのみ使用できます。")
+        return
+    arg = (body.get("text") or "").strip()
+    days = int(arg) if arg.isdigit() and int(arg) > 0 else 1
+    since = time.time() - days * 86400
+    respond(
+        llm_usage.format_summary(
+            llm_usage.summary(since), f"LLM 利用状況（過去 {days} 日）"
+        )
+    )
+    uname = resolve_user(body["user_id"])
+    logger.info(f"/llm_stats executed: days={days} user=@{uname}")
+
+
 # ─── 定期ジョブ設定 ─────────────────────────────────
 def post_periodic(period_name, since, channel=ADMIN_CHANNEL):
     blocks = build_scoreboard_blocks(period_name, since)
@@ -464,83 +635,231 @@ def post_periodic(period_name, since, channel=ADMIN_CHANNEL):
     logger.info(f"periodic post: period={period_name}")
 
 
-scheduler = BackgroundScheduler()
+# グラフ描画プロセスはスケジューラのスレッドを立てる前に fork しておく
+start_chart_pool()
+# 重いレポートジョブは "reports" に分け、ランキング投稿などの軽いジョブを待たせない
+scheduler = BackgroundScheduler(
+    executors={
+        "default": ThreadPoolExecutor(10),
+        "reports": ThreadPoolExecutor(REPORT_JOB_WORKERS),
+    }
+)
 scheduler.add_job(
     lambda: post_periodic("日次", datetime.now() - timedelta(days=1)),
     "cron",
     hour=0,
     minute=0,
 )
+
+
+# 9:00 の定期ランキング投稿: (期間名, 起点, 投稿日か, 投稿先)
+PERIODIC_POSTS = [
+    (
+        "週間",
+        lambda now: now - timedelta(days=7),
+        lambda now: now.weekday() == 0,
+        ADMIN_CHANNEL,
+    ),
+    (
+        "月間",
+        lambda now: now - relativedelta(months=1),
+        lambda now: now.day == 1,
+        ADMIN_CHANNEL,
+    ),
+    # 「今月の貢献者紹介」機能
+    (
+        "月間",
+        lambda now: now - relativedelta(months=1),
+        lambda now: now.day == 1,
+        BOT_DEV_CHANNEL,
+    ),
+    (
+        "四半期",
+        lambda now: now - relativedelta(months=3),
+        lambda now: now.day == 1 and now.month in (1, 4, 7, 10),
+        ADMIN_CHANNEL,
+    ),
+    (
+        "半期",
+        lambda now: now - relativedelta(months=6),
+        lambda now: now.day == 1 and now.month in (1, 7),
+        ADMIN_CHANNEL,
+    ),
+    (
+        "年間",
+        lambda now: now - relativedelta(years=1),
+        lambda now: now.day == 1 and now.month == 1,
+        ADMIN_CHANNEL,
+    ),
+]
+
+
+def post_periodic_batch():
+    """
+    同じ時刻に重なる定期ランキング投稿（週間・月間・四半期・半期・年間）を、
+    fetch_leaderboards の 1 回の集計でまとめて行う。
+    """
+    now = datetime.now()
+    due = [
+        (name, since(now), channel)
+        for name, since, is_due, channel in PERIODIC_POSTS
+        if is_due(now)
+    ]
+    if not due:
+        return
+    # 同じ期間を複数チャンネルに投稿する場合（月間）も集計は 1 回にする
+    periods = {name: (since.timestamp(), now.timestamp()) for name, since, _ in due}
+    boards = fetch_leaderboards(
+        DB_PATH,
+        [(name, since, until) for name, (since, until) in periods.items()],
+        limit=TOP_N,
+    )
+    for name, since, channel in due:
+        blocks = build_scoreboard_blocks(name, since, rows=boards[name])
+        app.client.chat_postMessage(channel=channel, blocks=blocks)
+        logger.info(f"periodic post: period={name} channel={channel}")
+
+
+scheduler.add_job(post_periodic_batch, "cron", hour=9, minute=0)
+scheduler.add_job(apply_all_positive_reactions, "cron", hour=0, minute=10)
+
+
+def scheduled_publish_today():
+    try:
+        publish_today_only()
+    except Exception:
+        logger.exception("scheduled_publish_today でエラーが発生しました")
+
+
+# scheduler.add_job(publish_today_only, 'cron', minute=0)
+scheduler.add_job(scheduled_publish_today, "cron", minute=10)
+scheduler.add_job(publish_all_periods, "cron", hour=0, minute=0, executor="reports")
 scheduler.add_job(
-    lambda: post_periodic("週間", datetime.now() - timedelta(days=7)),
-    "cron",
-    day_of_week="mon",
-    hour=9,
-    minute=0,
-)
-scheduler.add_job(
-    lambda: post_periodic("月間", datetime.now() - relativedelta(months=1)),
+    run_violation_trends,
     "cron",
-    day=1,
-    hour=9,
+    hour=0,
     minute=0,
+    id="violation_trends",
+    executor="reports",
 )
-# 「今月の貢献者紹介」機能
 scheduler.add_job(
-    lambda: post_periodic(
-        "月間", datetime.now() - relativedelta(months=1), channel=BOT_DEV_CHANNEL
-    ),
+    publish_user_metrics,
     "cron",
-    day=1,
-    hour=9,
-    minute=0,
+    hour=0,
+    minute=30,
+    id="publish_user_metrics",
+    executor="reports",
 )
 scheduler.add_job(
-    lambda: post_periodic("四半期", datetime.now() - relativedelta(months=3)),
+    daily_import.main,
     "cron",
-    month="1,4,7,10",
-    day=1,
-    hour=9,
+    hour=5,
     minute=0,
+    id="daily_import",
+    executor="reports",
 )
 scheduler.add_job(
-    lambda: post_periodic("半期", datetime.now() - relativedelta(months=6)),
-    "cron",
-    month="1,7",
-    day=1,
-    hour=9,
-    minute=0,
+    rebuild_live_scoreboard,
+    "interval",
+    minutes=LIVE_SCOREBOARD_RECONCILE_MIN,
+    id="live_scoreboard_reconcile",
 )
 scheduler.add_job(
-    lambda: post_periodic("年間", datetime.now() - relativedelta(years=1)),
-    "cron",
-    month="1",
-    day=1,
-    hour=9,
-    minute=0,
+    message_pipeline.sweep,
+    "interval",
+    seconds=MESSAGE_SWEEP_SEC,
+    id="message_pipeline_sweep",
 )
-scheduler.add_job(apply_all_positive_reactions, "cron", hour=0, minute=10)
+scheduler.add_job(purge_pending_messages, "cron", hour=4, minute=0)
 
 
-def scheduled_publish_today():
-    try:
-        publish_today_only()
-    except Exception:
-        logger.exception("scheduled_publish_today でエラーが発生しました")
+# ─── 受信中の区間の記録（daily_import の取り直し範囲を決める） ─────────────
+# Socket Mode の同じセッションが接続している間だけ区間を延ばす。切断したら区間を閉じ、
+# 再接続（新しいセッション）で新しい区間を開くので、切れていた間は daily_import が取り直す
+socket_handler = None
+_live = {"window": None, "session": None}
+_live_lock = threading.Lock()
+
+
+def track_live_window():
+    """INGEST_HEARTBEAT_SEC ごとに呼ぶ。接続中なら区間を延ばし（なければ開き）、切断中なら何もしない"""
+    if socket_handler is None:
+        return
+    client = socket_handler.client
+    session = client.session_id() if client.is_connected() else None
+    with _live_lock:
+        if session is None or session != _live["session"]:
+            _live["window"], _live["session"] = None, session
+        if session is None:
+            return
+        if _live["window"] is None:
+            _live["window"] = open_ingest_window("live")
+        else:
+            touch_ingest_window(_live["window"])
+
+
+def close_live_window(*_):
+    """Socket Mode の切断時に呼ぶ。以降は再接続するまで区間を延ばさない"""
+    with _live_lock:
+        _live["window"] = None
 
 
-# scheduler.add_job(publish_today_only, 'cron', minute=0)
-scheduler.add_job(scheduled_publish_today, "cron", minute=10)
-scheduler.add_job(publish_all_periods, "cron", hour=0, minute=0)
-scheduler.add_job(run_violation_trends, "cron", hour=0, minute=0, id="violation_trends")
 scheduler.add_job(
-    publish_user_metrics, "cron", hour=0, minute=30, id="publish_user_metrics"
+    track_live_window,
+    "interval",
+    seconds=INGEST_HEARTBEAT_SEC,
+    id="ingest_heartbeat",
 )
-scheduler.add_job(daily_import.main, "cron", hour=5, minute=0, id="daily_import")
+atexit.register(track_live_window)
+
+
+def log_classification_stats():
+    """判定チェーンの LLM 呼び出し数・トークン数（投機モードで捨てた分を含む）とキャッシュのヒット率を日次でログに出す"""
+    logger.info(
+        f"classification stats (speculative={LLM_SPECULATIVE}): {speculative.stats()}"
+    )
+    logger.info(f"llm_cache stats: {clf.cache_stats()}")
+    logger.info(f"prefilter stats: {prefilter.stats()}")
+    logger.info(f"OpenAI client stats: {llm_client.stats()}")
+    logger.info(f"Slack directory stats: {directory.stats()}")
+    logger.info(f"Slack API client stats: {slack_api_stats()}")
+    logger.info(f"thread parent cache stats: {thread_parents.stats()}")
+    if clf.LLM_BATCH_ENABLED:
+        logger.info(f"classify batch stats: {clf.batch_stats()}")
+
+
+scheduler.add_job(log_classification_stats, "cron", hour=23, minute=59)
+
+
+def post_llm_stats_daily():
+    """過去 24 時間の LLM 利用状況を運営チャネルに投稿する"""
+    text = llm_usage.format_summary(
+        llm_usage.summary(time.time() - 86400), "LLM 利用状況（過去 24 時間）"
+    )
+    app.client.chat_postMessage(channel=ADMIN_CHANNEL, text=text)
+    logger.info("periodic post: llm stats")
+
+
+scheduler.add_job(post_llm_stats_daily, "cron", hour=23, minute=55)
+scheduler.add_job(llm_usage.purge, "cron", hour=4, minute=10)
+scheduler.add_job(clf.evict_cache, "cron", hour=4, minute=5)
+scheduler.add_job(directory.warm, "cron", hour=3, minute=50, id="slack_directory_warm")
+scheduler.add_job(directory.evict, "interval", hours=1, id="slack_directory_evict")
 scheduler.start()
 
 if __name__ == "__main__":
-    import db_init
-
-    handler = SocketModeHandler(app, SLACK_APP_TOKEN)
-    handler.start()
+    import migrate
+
+    migrate.migrate(DB_PATH)
+    # systemctl stop / docker stop でも書き込みキューを排出してから終了する
+    exit_on_signals()
+    rebuild_live_scoreboard()
+    # 保存済みの名前で即座に引けるようにしてから、全件の取り直しはバックグラウンドで行う
+    directory.load()
+    scheduler.add_job(directory.warm, id="slack_directory_warm_startup")
+    message_pipeline.start()
+    # 前回の停止時に処理しきれなかったメッセージを拾う
+    message_pipeline.sweep()
+    socket_handler = SocketModeHandler(app, SLACK_APP_TOKEN)
+    socket_handler.client.on_close_listeners.append(close_live_window)
+    socket_handler.start()
@@ -0,0 +1,166 @@
+"""
+Micro-benchmark: events/sec of the Slack handler DB write path.
+
+Replays a synthetic burst of message/reaction events from several threads
+(like Bolt's listener thread pool) and compares
+  - legacy: one sqlite3.connect/commit/close per helper call
+  - pooled: utils.db helpers, DB_WRITE_MODE=sync (group commit, caller waits)
+  - async : utils.db helpers, DB_WRITE_MODE=async (write-behind, flushed at end)
+
+Usage:
+    python -m benchmarks.bench_db_writes --events 5000 --threads 8
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import migrate
+import utils.db as db
+
+
+def legacy_record_event(db_path, user_id, event_type, ts_epoch, reaction_name=None):
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO events (user_id, reactor_id, type, reaction_name, ts_epoch, violation_rule) VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, None, event_type, reaction_name, ts_epoch, None),
+    )
+    event_id = cur.lastrowid
+    conn.commit()
+    conn.close()
+    return event_id
+
+
+def legacy_update_score(db_path, user_id, field):
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute("INSERT OR IGNORE INTO user_scores(user_id) VALUES(?)", (user_id,))
+    cur.execute(
+        f"UPDATE user_scores SET {field} = {field} + 1 WHERE user_id = ?", (user_id,)
+    )
+    conn.commit()
+    conn.close()
+
+
+def legacy_is_positive_reaction(db_path, reaction_name):
+    conn = sqlite3.connect(db_path)
+    row = conn.execute(
+        "SELECT is_positive FROM reaction_judgement WHERE reaction_name = ?",
+        (reaction_name,),
+    ).fetchone()
+    conn.close()
+    return None if row is None else bool(row[0])
+
+
+def legacy_mark_reaction_scored(db_path, event_id):
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE events SET scored=1 WHERE id=?", (event_id,))
+    conn.commit()
+    conn.close()
+
+
+def legacy_handle(db_path, i):
+    user = f"U{i % 50:04d}"
+    if i % 3 == 0:
+        evt_id = legacy_record_event(db_path, user, "reaction", time.time(), "pray")
+        if legacy_is_positive_reaction(db_path, "pray"):
+            legacy_update_score(db_path, user, "reaction_count")
+            legacy_mark_reaction_scored(db_path, evt_id)
+    else:
+        legacy_record_event(db_path, user, "post", time.time())
+        legacy_update_score(db_path, user, "post_count")
+
+
+def pooled_handle(db_path, i):
+    user = f"U{i % 50:04d}"
+    if i % 3 == 0:
+        evt_id = db.record_event(user, "reaction", time.time(), reaction_name="pray")
+        if db.is_positive_reaction("pray"):
+            db.update_score(user, reaction=True)
+            db.mark_reaction_scored(evt_id)
+    else:
+        db.record_event(user, "post", time.time())
+        db.update_score(user, post=True)
+
+
+def run_burst(handler, db_path, n_events, n_threads, finish=None):
+    """n_events 件を n_threads スレッドで処理し、events/sec を返す"""
+    counter = iter(range(n_events))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            handler(db_path, i)
+
+    threads = [threading.Thread(target=worker) for _ in range(n_threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if finish:
+        finish()
+    return n_events / (time.perf_counter() - start)
+
+
+def fresh_db(tmpdir, name):
+    path = os.path.join(tmpdir, name)
+    migrate.migrate(path)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "INSERT INTO reaction_judgement (reaction_name, is_positive, last_checked_ts) VALUES ('pray', 1, 0)"
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=3000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+    # 1 件ごとの INSERT ログを抑止
+    logging.getLogger("utils.db").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        legacy_path = fresh_db(tmpdir, "legacy.db")
+        legacy = run_burst(legacy_handle, legacy_path, args.events, args.threads)
+
+        db.DB_WRITE_MODE = "sync"
+        db.DB_PATH = fresh_db(tmpdir, "pooled.db")
+        pooled = run_burst(pooled_handle, db.DB_PATH, args.events, args.threads)
+        db.close_all()
+
+        db.DB_WRITE_MODE = "async"
+        db._writer.max_latency = 0.02
+        db.DB_PATH = fresh_db(tmpdir, "async.db")
+        write_behind = run_burst(
+            pooled_handle, db.DB_PATH, args.events, args.threads, db.flush_writes
+        )
+        stats = db.write_stats()
+        db.close_all()
+
+    print(f"events={args.events} threads={args.threads}")
+    print(f"  legacy (connect per call): {legacy:10.1f} events/sec")
+    print(f"  pooled (sync commit)     : {pooled:10.1f} events/sec")
+    print(f"  write-behind (async)     : {write_behind:10.1f} events/sec")
+    print(
+        f"  speedup pooled / async   : {pooled / legacy:.2f}x / {write_behind / legacy:.2f}x"
+    )
+    print(
+        f"  writer: avg batch={stats['avg_batch']:.1f} max batch={stats['max_batch']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Latency/throughput benchmark: micro-batched violation classification.
+
+Sends a burst of distinct messages through utils.classifier.classify_text from
+several threads (like the message pipeline workers) against a local stub
+OpenAI server (benchmarks/stubs.py), and compares
+  - per-message: one LLM call per message (LLM_BATCH=0)
+  - batched    : MicroBatcher with the given max batch sizes (LLM_BATCH=1)
+
+Reports messages/sec, per-message latency p50/p95, LLM calls and prompt tokens.
+
+Usage:
+    python -m benchmarks.bench_llm_batching --messages 200 --threads 16 --batch 4 8 16
+"""
+
+import argparse
+import logging
+import statistics
+import threading
+import time
+
+import openai
+
+import utils.classifier as clf
+from benchmarks.stubs import StubOpenAI
+
+
+def run_burst(n_messages, n_threads):
+    latencies = []
+    lock = threading.Lock()
+    it = iter(range(n_messages))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(it, None)
+            if i is None:
+                return
+            # 1 割を違反にし、同じ文面にならないよう番号を入れる
+            text = f"投稿 {i}: " + (
+                "spam の宣伝です" if i % 10 == 0 else "明日の輪講の資料を共有します"
+            )
+            started = time.perf_counter()
+            result = clf.classify_text(text)
+            elapsed = time.perf_counter() - started
+            assert result["violation"] == (i % 10 == 0), (text, result)
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(n_threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "throughput": n_messages / wall,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--batch", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--wait-ms", type=float, default=50)
+    parser.add_argument("--base-ms", type=float, default=300, help="stub API latency")
+    args = parser.parse_args()
+    # 1 件ごとの LLM・HTTP ログを抑止
+    logging.getLogger().setLevel(logging.WARNING)
+
+    stub = StubOpenAI(base_ms=args.base_ms).start()
+    openai.api_key = "stub"
+    openai.base_url = stub.base_url
+    clf.LLM_CACHE_ENABLED = False
+    clf.prefilter.enabled = False
+
+    rows = []
+    try:
+        for batch in [None] + args.batch:
+            clf.LLM_BATCH_ENABLED = batch is not None
+            if batch is not None:
+                clf.LLM_BATCH_MAX = batch
+                clf.LLM_BATCH_WAIT_MS = args.wait_ms
+                clf._batcher = None
+            stub.reset()
+            r = run_burst(args.messages, args.threads)
+            r.update(
+                label="per-message" if batch is None else f"batched (max {batch})",
+                calls=sum(stub.calls.values()),
+                prompt_tokens=stub.prompt_tokens,
+                completion_tokens=stub.completion_tokens,
+            )
+            rows.append(r)
+    finally:
+        stub.stop()
+
+    print(
+        f"messages={args.messages} threads={args.threads} "
+        f"stub latency={args.base_ms:.0f}ms+tokens batch wait={args.wait_ms:.0f}ms"
+    )
+    base = rows[0]
+    for r in rows:
+        print(
+            f"  {r['label']:<18}: {r['throughput']:7.1f} msg/s  "
+            f"p50={r['p50'] * 1000:6.0f}ms p95={r['p95'] * 1000:6.0f}ms  "
+            f"calls={r['calls']:4d}  prompt tokens={r['prompt_tokens']:7d} "
+            f"({r['prompt_tokens'] / base['prompt_tokens']:.0%})  "
+            f"completion tokens={r['completion_tokens']:6d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: per-user daily series for publish_user_metrics.
+
+Builds a synthetic events DB with benchmarks/generate_workload.py (default 1M
+events over 200 days) and compares
+  - loop : fetch_daily_count per day x user x metric (the previous main loop)
+  - bulk : fetch_daily_series (one query + NumPy binning)
+for the "all" period and TOP_N users, and checks both give the same series.
+
+Usage:
+    python -m benchmarks.bench_user_metrics --events 1000000 --days 200
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import utils.db as db
+from benchmarks.generate_workload import generate
+
+
+def build_db(path, n_events, n_days, n_users, seed=0):
+    """n_days 日分に n_events 件のイベントを持つ DB を合成データ生成器で作る"""
+    end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    generate(path, n_events, n_users, days=n_days, seed=seed, end=end, posts=False)
+    return end - timedelta(days=n_days), end - timedelta(days=1)
+
+
+def loop_series(pum, user_ids, dates):
+    """変更前の main() と同じ、日 × ユーザー × メトリクスごとの COUNT(*)"""
+    data = {m[0]: {uid: [] for uid in user_ids} for m in pum.METRICS}
+    for d in dates:
+        we = d + timedelta(days=1)
+        for uid in user_ids:
+            for metric, _ in pum.METRICS:
+                if metric != "score":
+                    data[metric][uid].append(pum.fetch_daily_count(uid, metric, d, we))
+        for uid in user_ids:
+            data["score"][uid].append(
+                pum.compute_score(
+                    {
+                        "posts": data["post"][uid][-1],
+                        "reactions": data["reaction"][uid][-1],
+                        "answers": data["answer"][uid][-1],
+                        "positive_fb": data["positive_feedback"][uid][-1],
+                        "violations": data["violation"][uid][-1],
+                    }
+                )
+            )
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=200)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+    logging.getLogger("migrate").setLevel(logging.WARNING)
+
+    import publish_user_metrics as pum
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "metrics.db")
+        t0 = time.perf_counter()
+        start, end = build_db(path, args.events, args.days, args.users)
+        print(f"built {args.events} events in {time.perf_counter() - t0:.1f}s")
+        pum.DB_PATH = path
+
+        dates = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        # 活動量の多い順に上位ユーザーを選ぶ
+        user_ids = [
+            r[0]
+            for r in db.get_conn(path).execute(
+                "SELECT user_id FROM user_scores ORDER BY post_count DESC LIMIT ?",
+                (args.top,),
+            )
+        ]
+
+        t0 = time.perf_counter()
+        loop = loop_series(pum, user_ids, dates)
+        loop_sec = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        bulk = pum.fetch_daily_series(user_ids, dates)
+        bulk_sec = time.perf_counter() - t0
+        db.close_all()
+
+    same = all(
+        np.allclose(loop[m][uid], bulk[m][uid])
+        for m, _ in pum.METRICS
+        for uid in user_ids
+    )
+    queries = len(dates) * len(user_ids) * (len(pum.METRICS) - 1)
+    print(f"days={len(dates)} users={len(user_ids)} loop queries={queries}")
+    print(f"  loop (fetch_daily_count) : {loop_sec:8.3f}s")
+    print(f"  bulk (fetch_daily_series): {bulk_sec:8.3f}s")
+    print(f"  speedup                  : {loop_sec / bulk_sec:8.1f}x")
+    print(f"  identical series         : {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Regression check: every hot read query on `events` must use an index.
+
+Runs the real query helpers (scoring, db, publish_user_metrics,
+violation_trends) against a temporary DB filled by generate_workload.py,
+captures the SQL they execute and asserts via EXPLAIN QUERY PLAN that no step on `events` is a
+full table scan. Exits with status 1 on regression, so it can gate CI.
+
+Usage:
+    python -m benchmarks.check_query_plans            # temporary DB
+    python -m benchmarks.check_query_plans --events 1M
+    python -m benchmarks.check_query_plans --db scores.db
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import migrate
+import utils.db as db
+from benchmarks.generate_workload import generate, parse_count
+
+
+def hot_queries(db_path):
+    """(名前, 実行関数) のリスト。実際の集計ヘルパーをそのまま呼ぶ"""
+    from utils.scoring import fetch_user_counts
+    import publish_user_metrics as pum
+    import violation_trends as vt
+
+    pum.DB_PATH = db_path
+    end = datetime.now()
+    start = end - timedelta(days=7)
+    since, until = start.timestamp(), end.timestamp()
+    users = [f"U{i:06d}" for i in range(5)]
+    return [
+        ("fetch_user_counts", lambda: fetch_user_counts(db_path, since, until)),
+        ("get_unjudged_reactions", db.get_unjudged_reactions),
+        ("get_unscored_positive_reactions", db.get_unscored_positive_reactions),
+        ("get_all_start", pum.get_all_start),
+        (
+            "fetch_daily_count(post)",
+            lambda: pum.fetch_daily_count(users[0], "post", start, end),
+        ),
+        (
+            "fetch_daily_count(reaction)",
+            lambda: pum.fetch_daily_count(users[0], "reaction", start, end),
+        ),
+        (
+            "fetch_time_of_day_counts(answer)",
+            lambda: pum.fetch_time_of_day_counts(users, "answer", start, end),
+        ),
+        (
+            "fetch_time_of_day_counts(reaction)",
+            lambda: pum.fetch_time_of_day_counts(users, "reaction", start, end),
+        ),
+        ("fetch_violation_counts(all)", lambda: vt.fetch_violation_counts(db_path)),
+        (
+            "fetch_violation_counts(since)",
+            lambda: vt.fetch_violation_counts(db_path, since),
+        ),
+        (
+            "fetch_time_series_counts",
+            lambda: vt.fetch_time_series_counts(db_path, since),
+        ),
+        (
+            "fetch_weekday_hour_heatmap",
+            lambda: vt.fetch_weekday_hour_heatmap(db_path, since),
+        ),
+    ]
+
+
+def capture_sql(conn, fn):
+    """fn の実行中に conn 上で実行された SELECT 文（パラメータ展開済み）を返す"""
+    statements = []
+
+    def trace(sql):
+        if sql.lstrip().upper().startswith("SELECT"):
+            statements.append(sql)
+
+    conn.set_trace_callback(trace)
+    try:
+        fn()
+    finally:
+        conn.set_trace_callback(None)
+    return statements
+
+
+def full_scans(conn, sql):
+    """EXPLAIN QUERY PLAN のうち、events をインデックスなしで読む行を返す"""
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    bad = [
+        line
+        for line in plan
+        if re.match(r"(SCAN|SEARCH) events\b", line) and "INDEX" not in line
+    ]
+    return plan, bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--db",
+        help="check against an existing DB (pending migrations are applied first)",
+    )
+    parser.add_argument(
+        "--events",
+        type=parse_count,
+        default="2000",
+        help="size of the generated temporary DB (e.g. 100k, 1M)",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.getLogger("utils.db").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.db:
+            db_path = args.db
+            migrate.migrate(db_path)
+        else:
+            # プランナの判断が空テーブルに引きずられないよう、合成データを入れておく
+            db_path = os.path.join(tmpdir, "plans.db")
+            generate(db_path, args.events, n_users=40, days=90)
+        db.DB_PATH = db_path
+        conn = db.get_conn(db_path)
+
+        failures = 0
+        for name, fn in hot_queries(db_path):
+            statements = [s for s in capture_sql(conn, fn) if "events" in s]
+            if not statements:
+                print(f"FAIL {name}: no query on events was executed")
+                failures += 1
+                continue
+            for sql in statements:
+                plan, bad = full_scans(conn, sql)
+                status = "FAIL" if bad else "ok  "
+                print(f"{status} {name}: {' | '.join(plan)}")
+                if bad and args.verbose:
+                    print("     " + " ".join(sql.split()))
+                failures += bool(bad)
+        db.close_all()
+
+    if failures:
+        print(f"{failures} query plan(s) fall back to a full scan of events")
+        sys.exit(1)
+    print("all hot queries on events use an index")
+
+
+if __name__ == "__main__":
+    main()
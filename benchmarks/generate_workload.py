@@ -0,0 +1,380 @@
+"""
+Synthetic workload generator: fill a scores.db with production-shaped data.
+
+Generates, deterministically from --seed:
+  - users with a heavy-tailed (Zipf-like) activity distribution, some of
+    whom join partway through the period
+  - months of `events` with a realistic type mix, a diurnal and weekly
+    pattern (local time; production runs with TZ=Asia/Tokyo) and slow growth;
+    reactions carry reaction names (judged positive, judged negative or not
+    yet judged), violations carry rule numbers ("3" or "3,7") taken from
+    utils/guidelines.txt
+  - `slack_posts` for every message-type event (same user and ts as the
+    event, so train_prefilter.py can label them), with top-level posts and
+    thread replies; answers are replies to questions in the question channel
+  - `reaction_judgement`, `user_scores` and `import_state` consistent with the events
+
+Rows are bulk-loaded into a schema-only DB (migration 0001) and the remaining
+migrations are applied afterwards, so indexes, user_daily_counts and ANALYZE
+are built the same way they are on a production DB.
+
+Usage:
+    python -m benchmarks.generate_workload --db /tmp/1m.db --events 1M
+    python -m benchmarks.generate_workload --db /tmp/10m.db --events 10M --users 5000 --months 24
+    python -m benchmarks.check_query_plans --db /tmp/10m.db
+"""
+
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import migrate
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ["post", "reaction", "answer", "positive_feedback", "violation"]
+TYPE_MIX = [0.50, 0.34, 0.06, 0.07, 0.03]
+
+# ローカルタイムの時間帯ごとの相対的な投稿量（夜に山、明け方に谷）
+HOURLY = [
+    0.9, 0.5, 0.25, 0.12, 0.08, 0.1, 0.25, 0.5, 0.8, 1.0, 1.1, 1.1,
+    1.2, 1.1, 1.0, 1.0, 1.0, 1.05, 1.15, 1.35, 1.55, 1.7, 1.6, 1.3,
+]  # fmt: skip
+# 月〜日
+WEEKDAY = [1.1, 1.1, 1.05, 1.05, 1.0, 0.75, 0.8]
+
+# (リアクション名, 相対頻度, reaction_judgement の判定 1/0、None は未判定)
+REACTIONS = [
+    ("+1", 20, 1),
+    ("thumbsup", 10, 1),
+    ("pray", 14, 1),
+    ("heart", 8, 1),
+    ("tada", 6, 1),
+    ("clap", 6, 1),
+    ("raised_hands", 4, 1),
+    ("ok_hand", 3, 1),
+    ("100", 2, 1),
+    ("fire", 2, 1),
+    ("star-struck", 1.5, 1),
+    ("white_check_mark", 4, 0),
+    ("eyes", 6, 0),
+    ("joy", 4, 0),
+    ("sweat_smile", 2, 0),
+    ("thinking_face", 2, 0),
+    ("sob", 1, 0),
+    ("kami", 1, None),
+    ("sugoi", 1, None),
+    ("arigato", 1, None),
+    ("wakaru", 0.8, None),
+    ("naruhodo", 0.8, None),
+]
+
+CHANNELS = ["C_GENERAL", "C_QUESTION", "C_RANDOM", "C_SHARE"]
+CHANNEL_MIX = [0.35, 0.25, 0.25, 0.15]
+QUESTION_CHANNEL = "C_QUESTION"
+# 同じチャンネルの直近の投稿へのスレッド返信になる割合（answer は常に返信）
+REPLY_RATE = 0.3
+
+POST_TEXTS = [
+    "明日の輪講の資料を共有します。第{n}章です",
+    "第{n}回の講義動画、後半の説明がわかりやすかったです",
+    "課題{n}の締め切りは来週の金曜日ですね",
+    "もくもく会を{n}時から開きます。興味ある方はどうぞ",
+    "参考になった記事を貼っておきます（{n}）",
+    "環境構築で詰まったところをメモしました #{n}",
+]
+QUESTION_TEXTS = [
+    "課題{n}の提出方法を教えてください",
+    "第{n}回のコードで ImportError が出ます。どなたか解決策をご存じですか？",
+    "GPU のメモリ不足で学習が止まります（バッチサイズ {n}）。どうすればいいでしょう",
+    "最終課題のテーマ選びで迷っています。{n}件くらい候補があるのですが",
+]
+ANSWER_TEXTS = [
+    "提出フォームの URL は講義ページの下部にあります（{n}）",
+    "pip install -U で依存ライブラリを更新すると直りました。バージョン {n} 以降です",
+    "バッチサイズを半分にして勾配累積を {n} ステップにすると動きました",
+    "過去のスレッドにまとめがあります。{n}番目の投稿を見てください",
+]
+FEEDBACK_TEXTS = [
+    "<@{u}> さん、資料ありがとうございます！",
+    "<@{u}> 丁寧な解説、本当に助かりました",
+    "<@{u}> さんのおかげで解決しました。感謝です",
+]
+VIOLATION_TEXTS = [
+    "副業で月{n}万円稼げる方法を教えます。DM ください",
+    "限定セミナーの申込はこちら http://example.com/lp{n} 今だけ無料",
+    "この講義ほんとに意味ない。講師のレベル低すぎ {n}",
+    "フォロワー{n}人プレゼント企画、下のリンクから登録してね",
+]
+
+
+def parse_count(text: str) -> int:
+    """'100k' / '1M' / '10m' / '250000' を件数にする"""
+    m = re.fullmatch(r"\s*([\d.]+)\s*([kKmM]?)\s*", text)
+    if not m:
+        raise argparse.ArgumentTypeError(f"invalid count: {text!r}")
+    scale = {"": 1, "k": 1_000, "m": 1_000_000}[m.group(2).lower()]
+    return int(float(m.group(1)) * scale)
+
+
+def guideline_rules() -> list[int]:
+    path = os.path.join(os.path.dirname(migrate.__file__), "utils", "guidelines.txt")
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    rules = sorted({int(n) for n in re.findall(r"^\s*(\d+)\.", text, re.MULTILINE)})
+    return rules or [1]
+
+
+def _remove_db(path: str):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+class _Threads:
+    """チャンネルごとの直近のトップレベル投稿（スレッド返信の親）"""
+
+    def __init__(self, size=50):
+        self.recent = {ch: deque(maxlen=size) for ch in CHANNELS}
+
+    def parent(self, rng, channel):
+        recent = self.recent[channel]
+        return recent[int(rng.integers(len(recent)))] if recent else None
+
+    def add(self, channel, ts):
+        self.recent[channel].append(ts)
+
+
+def generate(
+    db_path: str,
+    n_events: int,
+    n_users: int = 1000,
+    days: int = 365,
+    seed: int = 0,
+    end: datetime = None,
+    posts: bool = True,
+) -> dict:
+    """
+    db_path（既存ならエラー）に合成データを作り、種別ごとの件数などを返す。
+    end: 期間の終わり（既定は今日の 0 時）。期間は end の days 日前から end まで。
+    """
+    if os.path.exists(db_path):
+        raise FileExistsError(db_path)
+    rng = np.random.default_rng(seed)
+    end = end or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    started = time.perf_counter()
+
+    migrations = migrate.discover()
+    migrate.migrate(db_path, migrations[:1])
+
+    # ユーザー: Zipf 風の活動量。3 割は期間の途中から参加する
+    user_ids = [f"U{i:06d}" for i in range(n_users)]
+    activity = 1.0 / np.arange(1, n_users + 1) ** 1.05
+    rng.shuffle(activity)
+    join_day = np.where(
+        rng.random(n_users) < 0.3, rng.integers(0, max(1, days), n_users), 0
+    )
+
+    # 日ごとの件数: 曜日 × ゆるやかな増加傾向
+    day_starts = [start + timedelta(days=d) for d in range(days)]
+    day_weight = np.array(
+        [
+            WEEKDAY[d.weekday()] * (0.7 + 0.6 * i / max(1, days - 1))
+            for i, d in enumerate(day_starts)
+        ]
+    )
+    per_day = rng.multinomial(n_events, day_weight / day_weight.sum())
+
+    hourly = np.array(HOURLY) / sum(HOURLY)
+    reaction_p = np.array([w for _, w, _ in REACTIONS])
+    reaction_p /= reaction_p.sum()
+    rules = guideline_rules()
+    rule_p = 1.0 / np.arange(1, len(rules) + 1) ** 0.8
+    rng.shuffle(rule_p)
+    rule_p /= rule_p.sum()
+    channel_p = np.array(CHANNEL_MIX)
+    positive = np.array([j == 1 for _, _, j in REACTIONS])
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous=OFF")
+    threads = _Threads()
+    counts = dict.fromkeys(EVENT_TYPES, 0)
+    n_posts = 0
+    last_day_ts = (end - timedelta(days=1)).timestamp()
+
+    for d, (day, n) in enumerate(zip(day_starts, per_day)):
+        if not n:
+            continue
+        active = activity * (join_day <= d)
+        active /= active.sum()
+        base = day.timestamp()
+        ts = np.sort(
+            base + rng.choice(24, n, p=hourly) * 3600 + rng.random(n) * 3600
+        ).round(6)
+        users = rng.choice(n_users, n, p=active)
+        types = rng.choice(len(EVENT_TYPES), n, p=TYPE_MIX)
+        reactors = rng.choice(n_users, n, p=active)
+        reactions = rng.choice(len(REACTIONS), n, p=reaction_p)
+        rule_a = rng.choice(len(rules), n, p=rule_p)
+        rule_b = rng.choice(len(rules), n, p=rule_p)
+        two_rules = rng.random(n) < 0.15
+        channels = rng.choice(len(CHANNELS), n, p=channel_p)
+        replies = rng.random(n) < REPLY_RATE
+        variants = rng.integers(0, 1 << 30, n)
+
+        event_rows, post_rows = [], []
+        for i in range(n):
+            t = float(ts[i])
+            user = user_ids[users[i]]
+            etype = EVENT_TYPES[types[i]]
+            counts[etype] += 1
+            if etype == "reaction":
+                r = reactions[i]
+                reactor = reactors[i]
+                if reactor == users[i]:
+                    reactor = (reactor + 1) % n_users
+                # 夜間バッチ前の直近 1 日分は未加点のまま
+                scored = int(positive[r] and t < last_day_ts)
+                event_rows.append(
+                    (user, user_ids[reactor], etype, REACTIONS[r][0], t, scored, None)
+                )
+                continue
+            rule = None
+            if etype == "violation":
+                a, b = rules[rule_a[i]], rules[rule_b[i]]
+                rule = f"{min(a, b)},{max(a, b)}" if two_rules[i] and a != b else str(a)
+            event_rows.append((user, None, etype, None, t, 0, rule))
+            if not posts:
+                continue
+
+            v = int(variants[i])
+            if etype == "answer":
+                channel = QUESTION_CHANNEL
+                parent = threads.parent(rng, channel)
+                text = ANSWER_TEXTS[v % len(ANSWER_TEXTS)].format(n=v % 97)
+            else:
+                channel = CHANNELS[channels[i]]
+                parent = threads.parent(rng, channel) if replies[i] else None
+                if etype == "violation":
+                    text = VIOLATION_TEXTS[v % len(VIOLATION_TEXTS)].format(n=v % 97)
+                elif etype == "positive_feedback":
+                    target = user_ids[reactors[i]]
+                    text = FEEDBACK_TEXTS[v % len(FEEDBACK_TEXTS)].format(u=target)
+                elif channel == QUESTION_CHANNEL and parent is None:
+                    text = QUESTION_TEXTS[v % len(QUESTION_TEXTS)].format(n=v % 97)
+                else:
+                    text = POST_TEXTS[v % len(POST_TEXTS)].format(n=v % 97)
+            if parent is None:
+                parent = t
+                threads.add(channel, t)
+            post_rows.append((t, channel, user, text, parent))
+
+        with conn:
+            conn.executemany(
+                "INSERT INTO events (user_id, reactor_id, type, reaction_name, ts_epoch, scored, violation_rule) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                event_rows,
+            )
+            conn.executemany(
+                "INSERT INTO slack_posts (ts, channel, user, text, thread_ts) VALUES (?, ?, ?, ?, ?)",
+                post_rows,
+            )
+        n_posts += len(post_rows)
+        if d % 30 == 29:
+            logger.info(f"{day:%Y-%m-%d}: {sum(counts.values()):,} events")
+
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO reaction_judgement (reaction_name, is_positive, last_checked_ts) VALUES (?, ?, ?)",
+            [(name, j, start.timestamp()) for name, _, j in REACTIONS if j is not None],
+        )
+        # 累計スコアは events から作る（record_event / mark_reaction_scored と同じ数え方）
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO user_scores
+                (user_id, post_count, reaction_count, answer_count, positive_feedback_count, violation_count)
+            SELECT user_id,
+                   SUM(type = 'post'),
+                   SUM(type = 'reaction' AND scored = 1),
+                   SUM(type = 'answer'),
+                   SUM(type = 'positive_feedback'),
+                   SUM(type = 'violation')
+            FROM events
+            GROUP BY user_id
+            """
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO import_state (key, last_ts) VALUES ('daily_import', ?)",
+            (end.timestamp(),),
+        )
+    conn.close()
+    loaded = time.perf_counter() - started
+
+    # インデックス・user_daily_counts・ANALYZE は本番と同じくマイグレーションで作る
+    migrate.migrate(db_path, migrations)
+    return {
+        "events": sum(counts.values()),
+        "by_type": counts,
+        "slack_posts": n_posts,
+        "users": n_users,
+        "start": start,
+        "end": end,
+        "load_sec": loaded,
+        "total_sec": time.perf_counter() - started,
+        "size_mb": os.path.getsize(db_path) / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", required=True, help="output path (must not exist)")
+    parser.add_argument(
+        "--events", type=parse_count, default="1M", help="e.g. 100k, 1M, 10M"
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--months", type=float, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--end", help="last day (YYYY-MM-DD, exclusive; default: today)"
+    )
+    parser.add_argument(
+        "--no-posts", dest="posts", action="store_false", help="skip slack_posts"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="overwrite an existing --db"
+    )
+    args = parser.parse_args()
+
+    if args.force:
+        _remove_db(args.db)
+    end = datetime.strptime(args.end, "%Y-%m-%d") if args.end else None
+    r = generate(
+        args.db,
+        args.events,
+        n_users=args.users,
+        days=max(1, round(args.months * 30.44)),
+        seed=args.seed,
+        end=end,
+        posts=args.posts,
+    )
+    print(
+        f"{args.db}: {r['events']:,} events, {r['slack_posts']:,} slack_posts, "
+        f"{r['users']:,} users, {r['start']:%Y-%m-%d} .. {r['end']:%Y-%m-%d}"
+    )
+    print("  " + "  ".join(f"{k}={v:,}" for k, v in r["by_type"].items()))
+    print(
+        f"  loaded in {r['load_sec']:.1f}s, with indexes/rollups {r['total_sec']:.1f}s, "
+        f"{r['size_mb']:.0f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""
+End-to-end load test: replay a synthetic Slack event stream into app.py.
+
+Stands up stub OpenAI / Slack Web API / Notion servers (benchmarks/stubs.py),
+points the bot at them and at a fresh temporary scores.db, imports app.py and
+calls its Bolt listeners (handle_message / handle_reaction) directly from
+several threads, as Bolt's listener pool would. The stream mixes ordinary
+posts, violations ("spam"), thank-you mentions, thread replies in
+QUESTION_CHANNEL and reaction_added events on earlier posts.
+
+Reports
+  - messages/sec (all message events classified and recorded)
+  - listener latency p50/p99 (time the Slack listener is blocked)
+  - end-to-end latency p50/p99 (listener entry -> classification finished)
+  - reaction handler latency p50/p99
+  - DB writer latency / batch size, pipeline and writer queue depth
+  - calls made to each stub
+
+Usage:
+    python -m benchmarks.load_test --messages 1000 --reactions 300 --listeners 8
+    python -m benchmarks.load_test --rate 50 --openai-ms 800 --openai-error-rate 0.05
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.stubs import StubNotion, StubOpenAI, StubSlack
+
+ADMIN_CHANNEL = "CADMIN"
+QUESTION_CHANNEL = "CQUESTION"
+BOT_DEV_CHANNEL = "CDEV"
+CHANNELS = ["CGENERAL", "CRANDOM", BOT_DEV_CHANNEL]
+# スレッド返信が集まる直近のスレッド数
+HOT_THREADS = 8
+REACTIONS = ["thumbsup", "+1", "heart", "tada", "eyes", "pray", "joy", "sweat_smile"]
+
+
+def make_events(n_messages, n_reactions, n_users, seed, slack):
+    """
+    再現可能な message / reaction_added イベント列を作る（シード固定）。
+    スレッド返信の親投稿は slack スタブに登録する（返信は直近のいくつかのスレッドに集中させる）。
+    """
+    rng = random.Random(seed)
+    users = [f"U{i:05d}" for i in range(n_users)]
+    base_ts = time.time() - 3600
+    messages = []
+    threads = []
+    for i in range(n_messages):
+        ts = f"{base_ts + i * 0.01:.6f}"
+        user = rng.choice(users)
+        kind = rng.random()
+        channel = rng.choice(CHANNELS)
+        event = {"type": "message", "user": user, "ts": ts, "event_ts": ts}
+        if kind < 0.10:
+            event["text"] = f"spam の宣伝です。今すぐ登録を！ #{i}"
+        elif kind < 0.20:
+            target = rng.choice([u for u in users if u != user])
+            event["text"] = f"<@{target}> さん、資料ありがとうございます！ #{i}"
+        elif kind < 0.35:
+            channel = QUESTION_CHANNEL
+            # 返信は直近の HOT_THREADS 本のスレッドに集まり、ときどき新しい質問が立つ
+            if not threads or rng.random() < 0.2:
+                parent_ts = f"{base_ts - 1000 - i:.6f}"
+                slack.add_message(
+                    channel,
+                    parent_ts,
+                    rng.choice(users),
+                    f"課題 {i} の提出方法を教えてください",
+                )
+                threads.append(parent_ts)
+            event["thread_ts"] = rng.choice(threads[-HOT_THREADS:])
+            event["text"] = f"提出フォームの URL は講義ページの下部にあります（{i}）"
+        else:
+            event["text"] = f"明日の輪講の資料を共有します。第 {i % 12 + 1} 章です"
+        event["channel"] = channel
+        messages.append(event)
+
+    stream = [("message", e) for e in messages]
+    for _ in range(n_reactions):
+        # まだ送っていない投稿へのリアクションにならないよう、後ろ側に差し込む
+        pos = rng.randrange(1, len(stream) + 1)
+        candidates = [e for kind, e in stream[:pos] if kind == "message"]
+        if not candidates:
+            continue
+        target = rng.choice(candidates[-50:])
+        reactor = rng.choice([u for u in users if u != target["user"]])
+        stream.insert(
+            pos,
+            (
+                "reaction",
+                {
+                    "type": "reaction_added",
+                    "user": reactor,
+                    "reaction": rng.choice(REACTIONS),
+                    "item_user": target["user"],
+                    "item": {
+                        "type": "message",
+                        "channel": target["channel"],
+                        "ts": target["ts"],
+                    },
+                    "event_ts": f"{time.time():.6f}",
+                },
+            ),
+        )
+    return stream
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def configure_env(args, db_path, openai_stub, slack_stub, notion_stub):
+    """app.py や utils の import 前に環境変数を設定する（モジュール定数は import 時に読まれる）"""
+    os.environ.update(
+        {
+            "SCORES_DB_PATH": db_path,
+            "SLACK_BOT_TOKEN": "xoxb-load-test",
+            "SLACK_APP_TOKEN": "xapp-load-test",
+            "ADMIN_CHANNEL": ADMIN_CHANNEL,
+            "QUESTION_CHANNEL": QUESTION_CHANNEL,
+            "BOT_DEV_CHANNEL": BOT_DEV_CHANNEL,
+            "SLACK_API_URL": slack_stub.base_url,
+            "NOTION_API_URL": notion_stub.url,
+            "NOTION_TOKEN": "ntn-load-test",
+            "OPENAI_API_KEY": "sk-load-test",
+            "OPENAI_BASE_URL": openai_stub.base_url,
+            "MESSAGE_WORKERS": str(args.workers),
+            "MESSAGE_QUEUE_SIZE": str(args.queue_size),
+            "DB_WRITE_MODE": args.db_write_mode,
+            "LLM_CACHE": "0",
+            "LLM_COMBINED": "1" if args.combined else "0",
+            "LLM_BATCH": "1" if args.batch else "0",
+            "CHART_WORKERS": "0",
+            "SLACK_RATE_LIMIT_SCALE": str(args.slack_rate_scale),
+        }
+    )
+
+
+def replay(app, stream, n_listeners, rate, submitted):
+    """
+    イベント列を n_listeners 本のスレッドから Bolt のリスナー関数に渡す。
+    rate > 0 なら i 番目のイベントを開始から i / rate 秒後に送る（オープンループ）。
+    submitted には message の ts ごとにリスナーへ渡した時刻を記録する。
+    """
+    listener, reaction = [], []
+    lock = threading.Lock()
+    it = iter(enumerate(stream))
+    start = time.perf_counter()
+
+    def worker():
+        while True:
+            with lock:
+                item = next(it, None)
+            if item is None:
+                return
+            i, (kind, event) = item
+            if rate > 0:
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            t0 = time.perf_counter()
+            if kind == "message":
+                submitted[event["ts"]] = t0
+                app.handle_message(event, app.app.client)
+            else:
+                app.handle_reaction(event, app.app.client)
+            elapsed = time.perf_counter() - t0
+            with lock:
+                (listener if kind == "message" else reaction).append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(n_listeners)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return listener, reaction, start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--reactions", type=int, default=300)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument(
+        "--listeners", type=int, default=8, help="Bolt listener threads"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="events/sec (0 = as fast as possible)"
+    )
+    parser.add_argument("--workers", type=int, default=4, help="MESSAGE_WORKERS")
+    parser.add_argument(
+        "--queue-size", type=int, default=500, help="MESSAGE_QUEUE_SIZE"
+    )
+    parser.add_argument("--db-write-mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--combined", action="store_true", help="LLM_COMBINED=1")
+    parser.add_argument("--batch", action="store_true", help="LLM_BATCH=1")
+    parser.add_argument("--openai-ms", type=float, default=300)
+    parser.add_argument("--openai-jitter-ms", type=float, default=100)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-error-status", type=int, default=500)
+    parser.add_argument("--slack-ms", type=float, default=20)
+    parser.add_argument("--notion-ms", type=float, default=50)
+    parser.add_argument(
+        "--slack-rate-scale",
+        type=float,
+        default=0,
+        help="SLACK_RATE_LIMIT_SCALE (0 disables the client-side Slack rate limiter)",
+    )
+    parser.add_argument(
+        "--cold",
+        action="store_true",
+        help="skip the Slack directory warm-up done at bot startup",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600, help="drain timeout (s)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    openai_stub = StubOpenAI(
+        base_ms=args.openai_ms,
+        jitter_ms=args.openai_jitter_ms,
+        error_rate=args.openai_error_rate,
+        error_status=args.openai_error_status,
+        seed=args.seed,
+    ).start()
+    slack_stub = StubSlack(
+        latency_ms=args.slack_ms,
+        users=[f"U{i:05d}" for i in range(args.users)],
+        channels=CHANNELS + [QUESTION_CHANNEL, ADMIN_CHANNEL],
+    ).start()
+    notion_stub = StubNotion(latency_ms=args.notion_ms).start()
+    tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(tmpdir.name, "scores.db")
+    configure_env(args, db_path, openai_stub, slack_stub, notion_stub)
+
+    import migrate
+
+    migrate.migrate(db_path)
+    import app
+    import utils.db as db
+    from utils.slack_helpers import slack_api_stats
+
+    # 1 件ごとのログを抑止（app.py が basicConfig で INFO にしている）
+    logging.getLogger().setLevel(logging.WARNING)
+    stream = make_events(
+        args.messages, args.reactions, args.users, args.seed, slack_stub
+    )
+
+    # app.py の起動処理と同じく、メモリ上のスコアボードを有効にする
+    db.rebuild_live_scoreboard()
+    if not args.cold:
+        # app.py の起動処理と同じく、ユーザー名・チャンネル名を一括取得しておく
+        app.directory.load()
+        app.directory.warm()
+
+    pipeline = app.message_pipeline
+    end_to_end = []
+    e2e_lock = threading.Lock()
+    submitted = {}
+    process_message = pipeline.handler
+
+    def timed_handler(event):
+        process_message(event)
+        done = time.perf_counter()
+        t0 = submitted.get(event.get("ts"))
+        if t0 is not None:
+            with e2e_lock:
+                end_to_end.append(done - t0)
+
+    pipeline.handler = timed_handler
+    pipeline.start()
+
+    depths, writer_depths = [], []
+    sampling = threading.Event()
+
+    def sampler():
+        while not sampling.wait(0.05):
+            depths.append(pipeline.depth())
+            writer_depths.append(db.write_stats()["queue_depth"])
+
+    threading.Thread(target=sampler, daemon=True).start()
+    for stub in (openai_stub, slack_stub, notion_stub):
+        stub.reset()
+
+    try:
+        listener, reaction, started = replay(
+            app, stream, args.listeners, args.rate, submitted
+        )
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline:
+            s = pipeline.stats()
+            if s["processed"] + s["failed"] >= s["received"] and not s["in_flight"]:
+                break
+            # 溢れて pending_messages に回った分は定期ジョブの代わりにここで積み直す
+            if s["overflowed"]:
+                pipeline.sweep()
+            time.sleep(0.05)
+        db.flush_writes()
+        wall = time.perf_counter() - started
+        sampling.set()
+        p = pipeline.stats()
+        w = db.write_stats()
+        report = {
+            "messages": p["processed"],
+            "failed": p["failed"],
+            "reactions": len(reaction),
+            "wall_sec": wall,
+            "messages_per_sec": p["processed"] / wall if wall else 0.0,
+            "listener_p50_ms": percentile(listener, 0.50) * 1000,
+            "listener_p99_ms": percentile(listener, 0.99) * 1000,
+            "end_to_end_p50_ms": percentile(end_to_end, 0.50) * 1000,
+            "end_to_end_p99_ms": percentile(end_to_end, 0.99) * 1000,
+            "reaction_p50_ms": percentile(reaction, 0.50) * 1000,
+            "reaction_p99_ms": percentile(reaction, 0.99) * 1000,
+            "db_write_avg_ms": w["avg_latency"] * 1000,
+            "db_write_avg_batch": w["avg_batch"],
+            "queue_depth_max": max(depths, default=0),
+            "queue_depth_avg": statistics.fmean(depths) if depths else 0.0,
+            "writer_depth_max": max(writer_depths, default=0),
+            "overflowed": p["overflowed"],
+            "openai_calls": dict(openai_stub.calls),
+            "openai_errors": openai_stub.errors,
+            "openai_prompt_tokens": openai_stub.prompt_tokens,
+            "slack_calls": dict(slack_stub.calls),
+            "slack_client": slack_api_stats(),
+            "notion_calls": dict(notion_stub.calls),
+        }
+    finally:
+        sampling.set()
+        pipeline.stop()
+        app.scheduler.shutdown(wait=False)
+        for stub in (openai_stub, slack_stub, notion_stub):
+            stub.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+    print(
+        f"events={len(stream)} (messages={args.messages} reactions={args.reactions}) "
+        f"listeners={args.listeners} workers={args.workers} "
+        f"rate={'max' if args.rate <= 0 else f'{args.rate:.0f}/s'} "
+        f"openai={args.openai_ms:.0f}ms+{args.openai_jitter_ms:.0f}ms "
+        f"errors={args.openai_error_rate:.0%}"
+    )
+    print(
+        f"  throughput    : {report['messages_per_sec']:7.1f} msg/s "
+        f"({report['messages']} done, {report['failed']} failed, {report['wall_sec']:.1f}s)"
+    )
+    for label, key in [
+        ("listener", "listener"),
+        ("end-to-end", "end_to_end"),
+        ("reaction", "reaction"),
+    ]:
+        print(
+            f"  {label:<14}: p50={report[key + '_p50_ms']:7.1f}ms "
+            f"p99={report[key + '_p99_ms']:7.1f}ms"
+        )
+    print(
+        f"  db writes     : avg latency={report['db_write_avg_ms']:.1f}ms "
+        f"avg batch={report['db_write_avg_batch']:.1f} "
+        f"max writer depth={report['writer_depth_max']}"
+    )
+    print(
+        f"  message queue : max depth={report['queue_depth_max']} "
+        f"avg depth={report['queue_depth_avg']:.1f} overflowed={report['overflowed']}"
+    )
+    print(
+        f"  openai calls  : {report['openai_calls']} "
+        f"(errors injected={report['openai_errors']})"
+    )
+    print(f"  slack calls   : {report['slack_calls']}")
+    limited, flight = (
+        report["slack_client"]["rate_limit"],
+        report["slack_client"]["single_flight"],
+    )
+    print(
+        f"  slack client  : throttled={limited['throttled']} ({limited['wait_sec']:.1f}s) "
+        f"429={limited['rate_limited']} coalesced={flight['shared']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
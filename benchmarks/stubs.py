@@ -0,0 +1,476 @@
+"""
+Local stub servers for the OpenAI, Slack Web and Notion APIs (benchmarks/load tests).
+
+Each stub is a ThreadingHTTPServer on 127.0.0.1 with a random port, counts calls
+per endpoint, and adds a configurable latency. Point the bot at them with
+OPENAI_BASE_URL / SLACK_API_URL / NOTION_API_URL (see .env.example).
+
+StubOpenAI
+    Chat completions latency is modelled as base + per prompt token + per
+    completion token, so that batching (fewer calls, shared system prompt) shows
+    up the way it would against the real API. A post is a "violation" when it
+    contains the word "spam". Answers the prompts in utils/classifier.py and
+    utils/llm_judge.py:
+      - classify_texts    (numbered posts, JSON {"1": [], "2": [3]})
+      - analyze_message   (JSON object with violation/rules/positive_feedback/is_answer)
+      - detect_positive_feedback (JSON list of mentioned user IDs)
+      - classify_text / is_likely_answer / judge_positive_reaction (Yes/No)
+    Embeddings return deterministic unit vectors derived from the input text.
+    error_rate/error_status inject 5xx or 429 (with retry-after) responses.
+
+StubSlack
+    auth.test, users.info, users.list / conversations.list (paginated over
+    the users / channels given to the constructor), conversations.info,
+    chat.getPermalink, chat.postMessage, conversations.replies and
+    conversations.history (paginated, oldest/latest; both over the messages
+    registered with add_message) and "ok" for everything else. rate_limits={"users.info": 20}
+    returns 429 with retry-after once a method exceeds that many calls/second.
+
+StubNotion
+    Blocks children (GET/PATCH), block DELETE, database query, page create/update.
+
+Usage:
+    openai_stub = StubOpenAI(base_ms=300).start()
+    openai.base_url = openai_stub.base_url
+    ...
+    openai_stub.stop()
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+def _tokens(text: str) -> int:
+    # 日本語混じりの文章のおおよそのトークン数
+    return max(1, len(text) // 2)
+
+
+class _StubServer:
+    """ルーティング・レイテンシ・呼び出し回数の集計をまとめた共通部分"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self._server = None
+
+    def route(self, method: str, path: str, body: dict) -> tuple[int, dict, dict]:
+        """(status, JSON body, 追加ヘッダー) を返す"""
+        raise NotImplementedError
+
+    def endpoint(self, method: str, path: str) -> str:
+        """呼び出し回数を数えるときのキー"""
+        return f"{method} {path}"
+
+    def _dispatch(self, method: str, path: str, body: dict):
+        with self.lock:
+            self.calls[self.endpoint(method, path)] += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self.route(method, path, body)
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length).decode("utf-8") if length else ""
+                if "json" in (self.headers.get("Content-Type") or ""):
+                    body = json.loads(raw) if raw else {}
+                else:
+                    # Slack SDK はフォーム形式でも送る
+                    body = dict(parse_qsl(raw))
+                body.update(parse_qsl(url.query))
+                status, payload, headers = stub._dispatch(self.command, url.path, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class StubOpenAI(_StubServer):
+    def __init__(
+        self,
+        base_ms=300.0,
+        prompt_token_ms=0.02,
+        completion_token_ms=4.0,
+        jitter_ms=0.0,
+        error_rate=0.0,
+        error_status=500,
+        embedding_dim=64,
+        seed=0,
+    ):
+        super().__init__()
+        self.base_ms = base_ms
+        self.prompt_token_ms = prompt_token_ms
+        self.completion_token_ms = completion_token_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.embedding_dim = embedding_dim
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/v1/"
+
+    def endpoint(self, method, path):
+        return path.rsplit("/v1/", 1)[-1]
+
+    def reset(self):
+        super().reset()
+        with self.lock:
+            self.prompt_tokens = self.completion_tokens = self.errors = 0
+
+    def reply(self, body: dict) -> str:
+        prompt = body["messages"][-1]["content"]
+        posts = re.findall(r"\[(\d+)\]\n```(.*?)```", prompt, re.DOTALL)
+        if posts:
+            return json.dumps({i: [3] if "spam" in text else [] for i, text in posts})
+        quoted = re.findall(r"```(.*?)```", prompt, re.DOTALL)
+        post = quoted[0] if quoted else ""
+        mentioned = list(dict.fromkeys(re.findall(r"<@([A-Z0-9]+)>", post)))
+        thanks = "ありがとう" in post
+        if '"violation"' in prompt:
+            result = {
+                "violation": "spam" in post,
+                "rules": [3] if "spam" in post else [],
+                "positive_feedback": mentioned if thanks else [],
+            }
+            if '"is_answer"' in prompt:
+                result["is_answer"] = len(post) >= 20
+            return json.dumps(result, ensure_ascii=False)
+        if "JSONリスト" in prompt:
+            return json.dumps(mentioned if thanks else [])
+        if "spam" in post:
+            return "Yes\n3"
+        if "違反" in prompt:
+            return "No"
+        return "Yes"
+
+    def _delay(self, prompt_tokens: int, completion_tokens: int) -> float:
+        ms = (
+            self.base_ms
+            + prompt_tokens * self.prompt_token_ms
+            + completion_tokens * self.completion_token_ms
+        )
+        if self.jitter_ms:
+            with self.lock:
+                ms += self._rng.uniform(0, self.jitter_ms)
+        return ms / 1000
+
+    def _error(self):
+        with self.lock:
+            if not self.error_rate or self._rng.random() >= self.error_rate:
+                return None
+            self.errors += 1
+        headers = {"retry-after": "0.1"} if self.error_status == 429 else {}
+        return (
+            self.error_status,
+            {"error": {"message": "stub error", "type": "server_error"}},
+            headers,
+        )
+
+    def _chat(self, body: dict):
+        content = self.reply(body)
+        prompt_tokens = sum(_tokens(m["content"]) for m in body["messages"])
+        completion_tokens = _tokens(content)
+        time.sleep(self._delay(prompt_tokens, completion_tokens))
+        with self.lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _vector(self, text: str) -> list[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        rng = random.Random(digest)
+        v = [rng.gauss(0, 1) for _ in range(self.embedding_dim)]
+        norm = sum(x * x for x in v) ** 0.5
+        return [x / norm for x in v]
+
+    def _embeddings(self, body: dict):
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        prompt_tokens = sum(_tokens(t) for t in texts)
+        time.sleep(self._delay(prompt_tokens, 0))
+        with self.lock:
+            self.prompt_tokens += prompt_tokens
+        return {
+            "object": "list",
+            "model": body.get("model", "stub"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": self._vector(t)}
+                for i, t in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    def handle(self, body: dict) -> dict:
+        """chat.completions 1 回分の応答（エラー注入なし）"""
+        return self._chat(body)
+
+    def route(self, method, path, body):
+        error = self._error()
+        if error:
+            return error
+        if path.endswith("/chat/completions"):
+            return 200, self._chat(body), {}
+        if path.endswith("/embeddings"):
+            return 200, self._embeddings(body), {}
+        return 404, {"error": {"message": f"unknown path {path}"}}, {}
+
+
+class StubSlack(_StubServer):
+    def __init__(
+        self,
+        latency_ms=20.0,
+        rate_limits: dict = None,
+        users: list = (),
+        channels: list = (),
+    ):
+        super().__init__(latency_ms)
+        self.rate_limits = rate_limits or {}
+        # users.list / conversations.list で返す ID
+        self.users = list(users)
+        self.channels = list(channels)
+        self.rate_limited = Counter()
+        self.posted = []
+        self._parents = {}
+        self._windows = {}
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/api/"
+
+    def endpoint(self, method, path):
+        return path.rsplit("/", 1)[-1]
+
+    def add_message(self, channel: str, ts: str, user: str, text: str):
+        """conversations.replies / conversations.history で返す親投稿を登録する"""
+        with self.lock:
+            self._parents[(channel, ts)] = {
+                "type": "message",
+                "ts": ts,
+                "user": user,
+                "text": text,
+            }
+
+    @staticmethod
+    def _user(uid: str) -> dict:
+        profile = {"display_name": f"user-{uid}", "real_name": f"User {uid}"}
+        return {"id": uid, "name": uid.lower(), "profile": profile}
+
+    @staticmethod
+    def _page(items: list, body: dict) -> tuple[list, dict]:
+        """cursor（開始位置）と limit でページ分けする"""
+        start = int(body.get("cursor") or 0)
+        end = start + int(body.get("limit") or 100)
+        return items[start:end], {"next_cursor": str(end) if end < len(items) else ""}
+
+    def _over_limit(self, api: str) -> bool:
+        limit = self.rate_limits.get(api)
+        if not limit:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            started, count = self._windows.get(api, (now, 0))
+            if now - started >= 1.0:
+                started, count = now, 0
+            self._windows[api] = (started, count + 1)
+            if count + 1 > limit:
+                self.rate_limited[api] += 1
+                return True
+        return False
+
+    def route(self, method, path, body):
+        api = self.endpoint(method, path)
+        if self._over_limit(api):
+            return 429, {"ok": False, "error": "ratelimited"}, {"Retry-After": "1"}
+        if api == "auth.test":
+            return (
+                200,
+                {"ok": True, "user_id": "UBOT", "bot_id": "BBOT", "team_id": "T0"},
+                {},
+            )
+        if api == "users.info":
+            return 200, {"ok": True, "user": self._user(body.get("user", "U0"))}, {}
+        if api == "users.list":
+            members, meta = self._page(self.users, body)
+            return (
+                200,
+                {
+                    "ok": True,
+                    "members": [self._user(u) for u in members],
+                    "response_metadata": meta,
+                },
+                {},
+            )
+        if api == "conversations.list":
+            channels, meta = self._page(self.channels, body)
+            return (
+                200,
+                {
+                    "ok": True,
+                    "channels": [
+                        {"id": c, "name": f"ch-{c.lower()}"} for c in channels
+                    ],
+                    "response_metadata": meta,
+                },
+                {},
+            )
+        if api == "conversations.info":
+            cid = body.get("channel", "C0")
+            return (
+                200,
+                {"ok": True, "channel": {"id": cid, "name": f"ch-{cid.lower()}"}},
+                {},
+            )
+        if api == "chat.getPermalink":
+            link = f"https://stub.slack.com/archives/{body.get('channel')}/p{body.get('message_ts', '').replace('.', '')}"
+            return 200, {"ok": True, "permalink": link}, {}
+        if api == "chat.postMessage":
+            with self.lock:
+                self.posted.append(body)
+            return (
+                200,
+                {
+                    "ok": True,
+                    "channel": body.get("channel"),
+                    "ts": f"{time.time():.6f}",
+                },
+                {},
+            )
+        if api == "conversations.replies":
+            with self.lock:
+                parent = self._parents.get((body.get("channel"), body.get("ts")))
+            return (
+                200,
+                {"ok": True, "messages": [parent] if parent else [], "has_more": False},
+                {},
+            )
+        if api == "conversations.history":
+            oldest = float(body.get("oldest") or 0)
+            latest = float(body.get("latest") or "inf")
+            with self.lock:
+                messages = sorted(
+                    (
+                        m
+                        for (channel, ts), m in self._parents.items()
+                        if channel == body.get("channel")
+                        and oldest < float(ts) < latest
+                    ),
+                    key=lambda m: float(m["ts"]),
+                    reverse=True,
+                )
+            page, meta = self._page(messages, body)
+            return (
+                200,
+                {"ok": True, "messages": page, "response_metadata": meta},
+                {},
+            )
+        return 200, {"ok": True}, {}
+
+
+class StubNotion(_StubServer):
+    def __init__(self, latency_ms=50.0):
+        super().__init__(latency_ms)
+
+    def endpoint(self, method, path):
+        # ID を除いてエンドポイントごとに数える
+        parts = [
+            p for p in path.split("/") if p and not re.fullmatch(r"[0-9a-f-]{20,}", p)
+        ]
+        return f"{method} /" + "/".join(parts)
+
+    def route(self, method, path, body):
+        obj_id = str(uuid.uuid4())
+        if path.endswith("/children"):
+            if method == "GET":
+                return (
+                    200,
+                    {
+                        "object": "list",
+                        "results": [],
+                        "has_more": False,
+                        "next_cursor": None,
+                    },
+                    {},
+                )
+            return (
+                200,
+                {"object": "list", "results": [{"object": "block", "id": obj_id}]},
+                {},
+            )
+        if "/databases/" in path and path.endswith("/query"):
+            return (
+                200,
+                {
+                    "object": "list",
+                    "results": [],
+                    "has_more": False,
+                    "next_cursor": None,
+                },
+                {},
+            )
+        if "/blocks/" in path and method == "DELETE":
+            return 200, {"object": "block", "id": obj_id, "archived": True}, {}
+        if path.rstrip("/").endswith("/pages") or "/pages/" in path:
+            return 200, {"object": "page", "id": obj_id, "properties": {}}, {}
+        return 200, {"object": "unknown", "id": obj_id}, {}
@@ -1,6 +1,5 @@
 import os
 import time
-import sqlite3
 import logging
 
 logging.basicConfig(
@@ -11,8 +10,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 from datetime import datetime, timezone
-from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
+from utils.db import get_conn, fetch_ingest_windows, open_ingest_window
+from utils.slack_helpers import new_web_client
 from pipelines import process_faq, process_trend_topics, process_info_requests
 from publishers import (
     post_faq_to_slack,
@@ -30,9 +30,16 @@ DEV_CH = os.environ["BOT_DEV_CHANNEL"]  # bot-dev
 DB_PATH = os.getenv("SCORES_DB_PATH", "scores.db")
 
 MAX_RETRIES = 3
-RATE_LIMIT_SLEEP = 1.2  # per‐call spacing
+# 投稿・編集・削除は bot が受信時に slack_posts へ書き込むので、ここでは bot が受信していなかった
+# 区間（停止中など。ingest_windows の隙間）だけを取り直す。呼び出し間隔は共有のレート制限に任せる。
+# 取り直す区間の前後に重ねる秒数（起動直後の接続待ちの分。重複は INSERT OR IGNORE で捨てる）
+GAP_OVERLAP_SEC = 120
+# 最後のハートビートからこの秒数以内なら、bot は今も受信中とみなす
+LIVE_GRACE_SEC = 180
+# 取り直す区間より前に立ったスレッドでも、この日数以内のものは返信を取り直す
+REPLY_LOOKBACK_DAYS = 7
 
-slack = WebClient(token=SLACK_TOKEN)
+slack = new_web_client(SLACK_TOKEN)
 
 
 def get_max_post_ts(db):
@@ -50,14 +57,6 @@ def get_max_post_ts(db):
 def get_last_import_ts(db):
     """前回の取得時刻を返す（なければ None）"""
     cur = db.cursor()
-    cur.execute(
-        """
-      CREATE TABLE IF NOT EXISTS import_state (
-        key TEXT PRIMARY KEY,
-        last_ts REAL
-      )
-    """
-    )
     cur.execute("SELECT last_ts FROM import_state WHERE key = 'daily_import'")
     row = cur.fetchone()
     return row[0] if row else None
@@ -76,8 +75,8 @@ def update_last_import_ts(db, ts):
     db.commit()
 
 
-def fetch_threads(channel: str, oldest_ts: float):
-    """指定 channel で thread_ts==ts の“親スレッド”のみ差分取得"""
+def fetch_threads(channel: str, oldest_ts: float, latest_ts: float = None):
+    """指定 channel で thread_ts==ts の“親スレッド”のみ差分取得（latest_ts 指定時はそれより前まで）"""
     cursor = None
     all_msgs = []
     while True:
@@ -85,7 +84,11 @@ def fetch_threads(channel: str, oldest_ts: float):
         while True:
             try:
                 resp = slack.conversations_history(
-                    channel=channel, oldest=oldest_ts, limit=50, cursor=cursor
+                    channel=channel,
+                    oldest=oldest_ts,
+                    latest=latest_ts,
+                    limit=50,
+                    cursor=cursor,
                 )
                 break
             except SlackApiError as e:
@@ -99,7 +102,6 @@ def fetch_threads(channel: str, oldest_ts: float):
                     continue
                 else:
                     raise
-        time.sleep(RATE_LIMIT_SLEEP)
         all_msgs.extend(resp["messages"])
         cursor = resp.get("response_metadata", {}).get("next_cursor")
         if not cursor:
@@ -133,7 +135,6 @@ def fetch_replies(channel: str, thread_ts: str):
                 logging.warning(f"Failed fetching replies for {thread_ts}: {e}")
                 return []
 
-    time.sleep(RATE_LIMIT_SLEEP)
     # 先頭は質問なので除外、bot_message も除外
     return [
         (m["ts"], channel, m.get("user", ""), m.get("text", "").strip(), thread_ts)
@@ -152,9 +153,9 @@ def import_posts(db, entries):
     db.commit()
 
 
-def fetch_and_import(db, channel, oldest_ts):
+def fetch_and_import(db, channel, oldest_ts, latest_ts=None):
     # 1) 親スレッド取得＋インサート
-    threads = fetch_threads(channel, oldest_ts)
+    threads = fetch_threads(channel, oldest_ts, latest_ts)
     logging.info(f"{channel}: fetched {len(threads)} threads since {oldest_ts}")
     import_posts(db, threads)
 
@@ -163,19 +164,79 @@ def fetch_and_import(db, channel, oldest_ts):
         replies = fetch_replies(channel, thread_ts)
         if replies:
             import_posts(db, replies)
+    return [thread_ts for *_, thread_ts in threads]
 
 
-def fetch_threads_only(db, channel, oldest_ts):
+def fetch_threads_only(db, channel, oldest_ts, latest_ts=None):
     """親スレッドのみ取得してインサート（replies は取得しない）"""
-    threads = fetch_threads(channel, oldest_ts)
+    threads = fetch_threads(channel, oldest_ts, latest_ts)
     logging.info(
         f"{channel}: fetched {len(threads)} threads since {oldest_ts} (threads only)"
     )
     import_posts(db, threads)
 
 
+def missed_ranges(since: float, until: float) -> list[tuple[float, float]]:
+    """
+    [since, until] のうち ingest_windows（bot の受信・過去の取り直し）で覆われていない区間。
+    前後に GAP_OVERLAP_SEC ずつ重ねて返す。bot が受信中なら直近の区間は隙間に含めない
+    """
+    gaps, cursor = [], since
+    for started_at, last_seen in fetch_ingest_windows(since):
+        if started_at > cursor:
+            gaps.append((cursor, min(started_at, until)))
+        cursor = max(cursor, last_seen)
+        if cursor >= until:
+            break
+    if cursor < until - LIVE_GRACE_SEC:
+        gaps.append((cursor, until))
+    return [
+        (max(since, start - GAP_OVERLAP_SEC), min(until, end + GAP_OVERLAP_SEC))
+        for start, end in gaps
+        if end > start
+    ]
+
+
+def fetch_recent_thread_ts(db, channel, since, until):
+    """slack_posts にある [since, until) に立ったスレッドの thread_ts"""
+    cur = db.cursor()
+    cur.execute(
+        "SELECT ts FROM slack_posts WHERE channel = ? AND ts >= ? AND ts < ? AND thread_ts = ts",
+        (channel, since, until),
+    )
+    return [f"{r[0]:.6f}" for r in cur.fetchall()]
+
+
+def reconcile(db, since: float, until: float) -> int:
+    """
+    bot が受信していなかった区間だけ conversations.history で取り直し、取り直した範囲を記録する。
+    区間中に付いた、それ以前に立ったスレッドへの返信も REPLY_LOOKBACK_DAYS 日分取り直す
+    （区間中の編集・削除は取り直さない）。取り直した区間数を返す
+    """
+    gaps = missed_ranges(since, until)
+    for oldest, latest in gaps:
+        logging.info(
+            f"Reconciling missed range {datetime.fromtimestamp(oldest)} - {datetime.fromtimestamp(latest)}"
+        )
+        # bot-qa-dev の質問と回答
+        fetched = set(fetch_and_import(db, QUESTION_CH, oldest, latest))
+        # bot-dev の一般投稿（トレンド候補） - 親スレッドのみ取得
+        fetch_threads_only(db, DEV_CH, oldest, latest)
+        older = fetch_recent_thread_ts(
+            db, QUESTION_CH, oldest - REPLY_LOOKBACK_DAYS * 86400, oldest
+        )
+        for thread_ts in older:
+            if thread_ts not in fetched:
+                fetched.add(thread_ts)
+                import_posts(db, fetch_replies(QUESTION_CH, thread_ts))
+    if not gaps:
+        logging.info("No missed ranges since last import; nothing to fetch")
+    open_ingest_window("daily_import", since, until)
+    return len(gaps)
+
+
 def main():
-    db = sqlite3.connect(DB_PATH)
+    db = get_conn(DB_PATH)
 
     # 前回時刻取得
     last_ts = get_last_import_ts(db)
@@ -183,14 +244,10 @@ def main():
 
     if last_ts is None:
         logging.warning("No previous import timestamp found. Exiting without fetching.")
-        db.close()
         return
 
-    # bot-qa-dev の質問と回答
-    fetch_and_import(db, QUESTION_CH, last_ts)
-
-    # bot-dev の一般投稿（トレンド候補） - 親スレッドのみ取得
-    fetch_threads_only(db, DEV_CH, last_ts)
+    # bot が受信していなかった区間だけ取り直す
+    reconcile(db, last_ts, time.time())
 
     # 分類パイプライン呼び出し（import_stateを更新する前に実行）
     processing_occurred = False
@@ -218,7 +275,6 @@ def main():
     else:
         logging.info("No processing occurred, import_state not updated")
 
-    db.close()
     logging.info("Daily import complete")
 
 
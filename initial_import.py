@@ -1,7 +1,7 @@
 import os, time, sqlite3, logging
 from dotenv import load_dotenv
-from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
+from utils.slack_helpers import new_web_client
 
 MAX_RETRIES = 3
 
@@ -12,7 +12,7 @@ DEV_CH = os.environ["BOT_DEV_CHANNEL"]  # bot-dev・bot-qa-dev を指定
 DB_PATH = "scores.db"
 
 logging.basicConfig(level=logging.INFO)
-slack = WebClient(token=SLACK_TOKEN)
+slack = new_web_client(SLACK_TOKEN)
 
 
 def fetch_all_threads(channel: str, oldest_ts: float = 0.0):
@@ -40,7 +40,6 @@ def fetch_all_threads(channel: str, oldest_ts: float = 0.0):
                     continue
                 else:
                     raise
-        time.sleep(1.2)
         all_msgs += resp["messages"]
         cursor = resp.get("response_metadata", {}).get("next_cursor")
         if not cursor:
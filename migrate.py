@@ -0,0 +1,272 @@
+"""
+スキーママイグレーション。
+
+migrations/NNNN_<name>.py を番号順に適用し、適用済みの番号を schema_version に記録する。
+各マイグレーションモジュールは以下を定義できる（いずれも任意）:
+
+  upgrade(conn) : テーブル追加・カラム追加・データ移行など。1 トランザクションで実行
+  INDEXES       : [(インデックス名, テーブル, カラム), ...]
+                  稼働中の DB でも書き込みを長く止めないよう、1 本ずつ別トランザクションで作成
+  ANALYZE       : 適用後に ANALYZE するテーブル名のリスト
+
+Usage:
+    python migrate.py                  # SCORES_DB_PATH に未適用分を適用
+    python migrate.py --db other.db
+    python migrate.py --status         # 適用済み / 未適用の一覧
+    python migrate.py --dry-run        # DB のコピーに適用し、各ステップの所要時間を表示
+"""
+
+import argparse
+import glob
+import importlib.util
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+DB_PATH = os.getenv("SCORES_DB_PATH", "scores.db")
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+
+_FILE_RE = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+
+class Migration:
+    def __init__(self, version: int, name: str, path: str):
+        self.version = version
+        self.name = name
+        self.path = path
+        self._module = None
+
+    @property
+    def module(self):
+        if self._module is None:
+            spec = importlib.util.spec_from_file_location(
+                f"migrations.m{self.version:04d}_{self.name}", self.path
+            )
+            self._module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self._module)
+        return self._module
+
+    @property
+    def label(self) -> str:
+        return f"{self.version:04d}_{self.name}"
+
+
+def discover(migrations_dir: str = MIGRATIONS_DIR) -> list[Migration]:
+    """migrations/ 配下のマイグレーションを番号順に返す（番号の重複はエラー）"""
+    found = {}
+    for path in sorted(glob.glob(os.path.join(migrations_dir, "*.py"))):
+        m = _FILE_RE.match(os.path.basename(path))
+        if not m:
+            continue
+        version = int(m.group(1))
+        if version in found:
+            raise RuntimeError(
+                f"Duplicate migration version {version}: {found[version].path}, {path}"
+            )
+        found[version] = Migration(version, m.group(2), path)
+    return [found[v] for v in sorted(found)]
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """トランザクションを明示的に制御する接続（BEGIN/COMMIT は自前で発行）"""
+    conn = sqlite3.connect(
+        db_path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version     INTEGER PRIMARY KEY,
+            name        TEXT    NOT NULL,
+            applied_at  REAL    NOT NULL,
+            duration    REAL    NOT NULL
+        )
+    """
+    )
+    return conn
+
+
+def applied_versions(conn: sqlite3.Connection) -> set[int]:
+    return {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+
+
+def pending(conn: sqlite3.Connection, migrations: list[Migration] = None):
+    migrations = discover() if migrations is None else migrations
+    done = applied_versions(conn)
+    return [m for m in migrations if m.version not in done]
+
+
+def _in_transaction(conn: sqlite3.Connection, fn):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        fn()
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def apply_migration(conn: sqlite3.Connection, migration: Migration) -> list:
+    """
+    1 つのマイグレーションを適用し、[(ステップ名, 秒), ...] を返す。
+    途中で失敗しても schema_version には記録されないので、再実行で続きから適用される
+    （インデックスは IF NOT EXISTS で作るため、作成済みの分は飛ばされる）。
+    """
+    mod = migration.module
+    steps = []
+    started = time.perf_counter()
+
+    upgrade = getattr(mod, "upgrade", None)
+    if upgrade is not None:
+        t0 = time.perf_counter()
+        _in_transaction(conn, lambda: upgrade(conn))
+        steps.append(("upgrade", time.perf_counter() - t0))
+
+    for name, table, columns in getattr(mod, "INDEXES", []):
+        t0 = time.perf_counter()
+        _in_transaction(
+            conn,
+            lambda: conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+            ),
+        )
+        steps.append((f"index {name}", time.perf_counter() - t0))
+
+    for table in getattr(mod, "ANALYZE", []):
+        t0 = time.perf_counter()
+        conn.execute(f"ANALYZE {table}")
+        steps.append((f"analyze {table}", time.perf_counter() - t0))
+
+    conn.execute(
+        "INSERT INTO schema_version (version, name, applied_at, duration) VALUES (?, ?, ?, ?)",
+        (migration.version, migration.name, time.time(), time.perf_counter() - started),
+    )
+    return steps
+
+
+def migrate(db_path: str = DB_PATH, migrations: list[Migration] = None) -> list:
+    """
+    未適用のマイグレーションをすべて適用する。適用したマイグレーションのリストを返す。
+    """
+    conn = connect(db_path)
+    try:
+        todo = pending(conn, migrations)
+        for m in todo:
+            steps = apply_migration(conn, m)
+            total = sum(sec for _, sec in steps)
+            logger.info(f"Applied migration {m.label} to {db_path} in {total:.2f}s")
+        if not todo:
+            logger.info(f"{db_path} is up to date")
+        return todo
+    finally:
+        conn.close()
+
+
+def dry_run(db_path: str = DB_PATH, migrations: list[Migration] = None) -> list:
+    """
+    DB を一時ファイルにコピーして未適用分を適用し、ステップごとの所要時間を返す。
+    本番 DB には触れない（コピーは SQLite backup API で取るので稼働中でもよい）。
+    """
+    tmpdir = tempfile.mkdtemp(prefix="migrate-dry-run-")
+    copy_path = os.path.join(tmpdir, os.path.basename(db_path) or "copy.db")
+    try:
+        t0 = time.perf_counter()
+        if os.path.exists(db_path):
+            src = sqlite3.connect(db_path)
+            dst = sqlite3.connect(copy_path)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+                src.close()
+        copy_sec = time.perf_counter() - t0
+
+        conn = connect(copy_path)
+        try:
+            report = []
+            for m in pending(conn, migrations):
+                report.append((m, apply_migration(conn, m)))
+        finally:
+            conn.close()
+        _print_dry_run(db_path, copy_sec, report)
+        return report
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def _print_dry_run(db_path: str, copy_sec: float, report: list):
+    size = os.path.getsize(db_path) if os.path.exists(db_path) else 0
+    print(
+        f"dry-run on a copy of {db_path} ({size / 1e6:.1f} MB, copied in {copy_sec:.2f}s)"
+    )
+    if not report:
+        print("  no pending migrations")
+        return
+    grand = 0.0
+    for m, steps in report:
+        total = sum(sec for _, sec in steps)
+        grand += total
+        print(f"  {m.label}: {total:.2f}s")
+        for step, sec in steps:
+            print(f"    {step:<48} {sec:8.2f}s")
+    print(f"estimated total: {grand:.2f}s")
+
+
+def print_status(db_path: str = DB_PATH):
+    conn = connect(db_path)
+    try:
+        done = {
+            row[0]: row[1:]
+            for row in conn.execute(
+                "SELECT version, applied_at, duration FROM schema_version"
+            )
+        }
+    finally:
+        conn.close()
+    for m in discover():
+        if m.version in done:
+            applied_at, duration = done[m.version]
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(applied_at))
+            print(f"  [x] {m.label}  (applied {when}, {duration:.2f}s)")
+        else:
+            print(f"  [ ] {m.label}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations to scores.db")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite DB path")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="apply pending migrations to a copy and report the time each step takes",
+    )
+    group.add_argument("--status", action="store_true", help="list migrations")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        dry_run(args.db)
+    elif args.status:
+        print_status(args.db)
+    else:
+        migrate(args.db)
+
+
+if __name__ == "__main__":
+    main()
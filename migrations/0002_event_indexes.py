@@ -0,0 +1,19 @@
+"""
+events の集計クエリ用カバリングインデックス。
+いずれも参照カラムをすべて含むので、テーブル本体を読まずに集計できる。
+"""
+
+# (インデックス名, テーブル, カラム) — ランナーが 1 本ずつ別トランザクションで作成する
+INDEXES = [
+    # fetch_user_counts / MIN(ts_epoch): 期間で絞ってユーザー×種別を集計
+    ("idx_events_ts_type_user", "events", "ts_epoch, type, user_id, scored"),
+    # get_unscored_positive_reactions / get_unjudged_reactions
+    ("idx_events_type_scored_reaction", "events", "type, scored, reaction_name"),
+    # fetch_daily_count / fetch_time_of_day_counts: ユーザー単位の日次・時間帯集計
+    ("idx_events_user_type_ts", "events", "user_id, type, ts_epoch, scored"),
+    # violation_trends: 違反ルール別・時系列の集計
+    ("idx_events_type_ts_rule", "events", "type, ts_epoch, violation_rule"),
+]
+
+# インデックス作成後に統計情報を更新する
+ANALYZE = ["events"]
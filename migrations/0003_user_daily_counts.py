@@ -0,0 +1,98 @@
+"""
+ユーザー×日ごとのイベント件数ロールアップ user_daily_counts。
+events への INSERT / UPDATE / DELETE をトリガーで差分反映するので、record_event・
+mark_reaction_scored・apply_reaction_scores・手動の DB 操作のいずれでも常に events と一致する。
+
+day はローカルタイム（TZ=Asia/Tokyo）の 'YYYY-MM-DD'。fetch_user_counts の日境界と揃えるため、
+DB に書き込むプロセスと集計するプロセスは同じ TZ で動かすこと。
+"""
+
+# 1 イベントが各カラムに寄与する件数（reaction は加点済み scored=1 のみ数える）
+_COUNTS = {
+    "posts": "{r}.type = 'post'",
+    "reactions_scored": "({r}.type = 'reaction' AND {r}.scored = 1)",
+    "answers": "{r}.type = 'answer'",
+    "positive_fb": "{r}.type = 'positive_feedback'",
+    "violations": "{r}.type = 'violation'",
+}
+_DAY = "date({r}.ts_epoch, 'unixepoch', 'localtime')"
+_WHEN = (
+    "{r}.ts_epoch IS NOT NULL "
+    "AND {r}.type IN ('post', 'reaction', 'answer', 'positive_feedback', 'violation')"
+)
+
+
+def _apply(r: str, sign: str) -> str:
+    """行 r（NEW / OLD）の寄与を sign（+ / -）で user_daily_counts に反映する UPSERT"""
+    cols = ", ".join(_COUNTS)
+    values = ", ".join(f"{sign}({expr.format(r=r)})" for expr in _COUNTS.values())
+    updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in _COUNTS)
+    return f"""
+        INSERT INTO user_daily_counts (day, user_id, {cols})
+        SELECT {_DAY.format(r=r)}, {r}.user_id, {values}
+        WHERE {_WHEN.format(r=r)}
+        ON CONFLICT(day, user_id) DO UPDATE SET {updates};
+    """
+
+
+def upgrade(conn):
+    conn.execute(
+        """
+    CREATE TABLE IF NOT EXISTS user_daily_counts (
+        day               TEXT    NOT NULL,  -- ローカル日付 'YYYY-MM-DD'
+        user_id           TEXT    NOT NULL,
+        posts             INTEGER NOT NULL DEFAULT 0,
+        reactions_scored  INTEGER NOT NULL DEFAULT 0,
+        answers           INTEGER NOT NULL DEFAULT 0,
+        positive_fb       INTEGER NOT NULL DEFAULT 0,
+        violations        INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, user_id)
+    ) WITHOUT ROWID
+    """
+    )
+
+    conn.execute(
+        f"""
+    CREATE TRIGGER IF NOT EXISTS trg_events_daily_insert
+    AFTER INSERT ON events
+    BEGIN
+        {_apply("NEW", "+")}
+    END
+    """
+    )
+    conn.execute(
+        f"""
+    CREATE TRIGGER IF NOT EXISTS trg_events_daily_update
+    AFTER UPDATE OF user_id, type, ts_epoch, scored ON events
+    BEGIN
+        {_apply("OLD", "-")}
+        {_apply("NEW", "+")}
+    END
+    """
+    )
+    conn.execute(
+        f"""
+    CREATE TRIGGER IF NOT EXISTS trg_events_daily_delete
+    AFTER DELETE ON events
+    BEGIN
+        {_apply("OLD", "-")}
+    END
+    """
+    )
+
+    # 既存イベントからの初期集計（同じトランザクション内なので、並行する INSERT と二重計上しない）
+    cols = ", ".join(_COUNTS)
+    sums = ", ".join(f"SUM({expr.format(r='e')})" for expr in _COUNTS.values())
+    conn.execute("DELETE FROM user_daily_counts")
+    conn.execute(
+        f"""
+    INSERT INTO user_daily_counts (day, user_id, {cols})
+    SELECT {_DAY.format(r='e')}, e.user_id, {sums}
+    FROM events AS e
+    WHERE {_WHEN.format(r='e')}
+    GROUP BY 1, 2
+    """
+    )
+
+
+ANALYZE = ["user_daily_counts"]
@@ -0,0 +1,29 @@
+"""
+受信した message イベントの作業キュー pending_messages。
+リスナーは保存だけして即座に戻り、分類はワーカーが行う。処理前に落ちても起動時に拾い直せる。
+"""
+
+
+def upgrade(conn):
+    conn.execute(
+        """
+    CREATE TABLE IF NOT EXISTS pending_messages (
+        id           INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel      TEXT    NOT NULL,
+        event_ts     TEXT    NOT NULL,               -- Slack の event_ts（再送時も同じ値）
+        event        TEXT    NOT NULL,               -- message イベントの JSON
+        status       TEXT    NOT NULL DEFAULT 'pending',  -- 'pending','done','failed'
+        attempts     INTEGER NOT NULL DEFAULT 0,
+        received_at  REAL    NOT NULL,
+        finished_at  REAL,
+        error        TEXT,
+        UNIQUE (channel, event_ts)
+    )
+    """
+    )
+
+
+INDEXES = [
+    # 未処理分の拾い直し（受信順）
+    ("idx_pending_messages_status", "pending_messages", "status, id"),
+]
@@ -0,0 +1,28 @@
+"""
+LLM 判定結果のキャッシュ llm_cache。
+key は 判定種別・モデル名・ガイドラインのハッシュ・正規化した入力テキストのハッシュなので、
+guidelines.txt や OPENAI_MODEL を変えると自動的に別キーになる（古い行は LRU / TTL で消える）。
+"""
+
+
+def upgrade(conn):
+    conn.execute(
+        """
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        key         TEXT    PRIMARY KEY,
+        kind        TEXT    NOT NULL,   -- 'classify', 'feedback', 'answer', 'analyze'
+        result      TEXT    NOT NULL,   -- 判定結果の JSON
+        created_at  REAL    NOT NULL,
+        last_used   REAL    NOT NULL,
+        hits        INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """
+    )
+
+
+INDEXES = [
+    # LRU での削除
+    ("idx_llm_cache_last_used", "llm_cache", "last_used"),
+    # TTL での削除
+    ("idx_llm_cache_created_at", "llm_cache", "created_at"),
+]
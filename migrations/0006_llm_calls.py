@@ -0,0 +1,32 @@
+"""
+LLM API 呼び出しの記録 llm_calls。utils/llm_client.py が 1 呼び出し（再試行を含む）ごとに 1 行書く。
+/llm_stats と日次サマリーで、どの処理（違反判定・FAQ 要約・RAG など）がトークンと時間を使っているかを集計する。
+"""
+
+
+def upgrade(conn):
+    conn.execute(
+        """
+    CREATE TABLE IF NOT EXISTS llm_calls (
+        id                  INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts                  REAL    NOT NULL,
+        func                TEXT    NOT NULL,   -- 呼び出し元 (例: 'classifier.analyze_message')
+        model               TEXT,
+        prompt_tokens       INTEGER NOT NULL DEFAULT 0,
+        completion_tokens   INTEGER NOT NULL DEFAULT 0,
+        latency             REAL    NOT NULL,   -- 再試行を含めた所要時間（秒）
+        attempts            INTEGER NOT NULL DEFAULT 1,
+        outcome             TEXT    NOT NULL    -- 'ok', 'error', 'unavailable', 'short_circuit'
+    )
+    """
+    )
+
+
+INDEXES = [
+    # 期間集計（/llm_stats・日次サマリー）をテーブルを読まずに済ませる。古い行の削除にも使う
+    (
+        "idx_llm_calls_ts_func",
+        "llm_calls",
+        "ts, func, model, outcome, prompt_tokens, completion_tokens, latency",
+    ),
+]
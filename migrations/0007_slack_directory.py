@@ -0,0 +1,29 @@
+"""
+Slack のユーザー名・チャンネル名のディレクトリ slack_users / slack_channels。
+utils/slack_directory.py が users.list / conversations.list と user_change などのイベントで更新し、
+再起動時はここから読み込んで、名前解決のための users.info / conversations.info 呼び出しを省く。
+"""
+
+
+def upgrade(conn):
+    conn.execute(
+        """
+    CREATE TABLE IF NOT EXISTS slack_users (
+        user_id     TEXT    PRIMARY KEY,
+        name        TEXT    NOT NULL,   -- display_name → real_name → name の順で最初に空でないもの
+        is_bot      INTEGER NOT NULL DEFAULT 0,
+        deleted     INTEGER NOT NULL DEFAULT 0,
+        updated_at  REAL    NOT NULL
+    ) WITHOUT ROWID
+    """
+    )
+    conn.execute(
+        """
+    CREATE TABLE IF NOT EXISTS slack_channels (
+        channel_id  TEXT    PRIMARY KEY,
+        name        TEXT    NOT NULL,
+        is_archived INTEGER NOT NULL DEFAULT 0,
+        updated_at  REAL    NOT NULL
+    ) WITHOUT ROWID
+    """
+    )
@@ -0,0 +1,21 @@
+"""
+slack_posts の (channel, ts) を一意にする。
+bot が受信したメッセージをその場で書き込み、日次・初回インポートと同じ投稿を重ねないため
+（INSERT OR IGNORE が効くようになる）。スレッド親の参照（utils/thread_parents.py）にも使う。
+"""
+
+
+def upgrade(conn):
+    # 重複分は最初に取り込んだ行（extracted_items.post_ids が参照している id）を残す
+    conn.execute(
+        """
+    DELETE FROM slack_posts
+    WHERE id NOT IN (SELECT MIN(id) FROM slack_posts GROUP BY channel, ts)
+    """
+    )
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_slack_posts_channel_ts ON slack_posts (channel, ts)"
+    )
+
+
+ANALYZE = ["slack_posts"]
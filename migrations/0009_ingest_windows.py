@@ -0,0 +1,24 @@
+"""
+slack_posts への取り込みが済んでいる時間帯 ingest_windows。
+bot は起動中の区間（source='live'）を定期的に延ばし、daily_import はその隙間（停止中など）だけを
+conversations.history で取り直して、取り直した区間（source='daily_import'）も記録する。
+"""
+
+
+def upgrade(conn):
+    conn.execute(
+        """
+    CREATE TABLE IF NOT EXISTS ingest_windows (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        source      TEXT    NOT NULL,   -- 'live'（bot が受信）/ 'daily_import'（API で取り直し）
+        started_at  REAL    NOT NULL,
+        last_seen   REAL    NOT NULL    -- live は INGEST_HEARTBEAT_SEC ごとに更新
+    )
+    """
+    )
+
+
+INDEXES = [
+    # fetch_ingest_windows: 指定時刻以降に終わった区間
+    ("idx_ingest_windows_last_seen", "ingest_windows", "last_seen, started_at"),
+]
@@ -10,10 +10,10 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
-import sqlite3
 from datetime import datetime, timedelta
 from notion_client import Client
-from utils.scoring import fetch_user_counts, compute_score
+from utils.db import get_conn
+from utils.scoring import fetch_user_counts, fetch_leaderboards, compute_score
 from utils.slack_helpers import resolve_user
 
 # Set up logger for this module
@@ -28,11 +28,13 @@ NOTION_PAGE_ID = os.getenv(
 )  # 画像埋め込みやタイムスタンプ追記用のページID
 # NOTION_UPDATED_BLOCK_ID = os.getenv("NOTION_UPDATED_BLOCK_ID")  # 最終更新日を入力するブロックから取得したプレースホルダーブロックのID
 SLACK_WORKSPACE_URL = os.getenv("SLACK_WORKSPACE_URL")
+# Notion API のベース URL（負荷試験ではスタブサーバーに向ける）
+NOTION_API_URL = os.getenv("NOTION_API_URL", "https://api.notion.com")
 TOP_N = int(os.getenv("TOP_N", "5"))
 
 
 # Notion クライアント初期化
-notion = Client(auth=NOTION_TOKEN)
+notion = Client(auth=NOTION_TOKEN, base_url=NOTION_API_URL)
 
 
 def clear_timestamp_block():
@@ -40,7 +42,7 @@ def clear_timestamp_block():
     Delete existing '最終更新:' paragraph blocks under the target page.
     """
     # Retrieve current children blocks
-    url = f"https://api.notion.com/v1/blocks/{NOTION_PAGE_ID}/children?page_size=100"
+    url = f"{NOTION_API_URL}/v1/blocks/{NOTION_PAGE_ID}/children?page_size=100"
     res = notion.blocks.children.list(block_id=NOTION_PAGE_ID, page_size=100)
     for child in res.get("results", []):
         # Identify timestamp paragraphs by checking type and text content
@@ -219,9 +221,24 @@ def publish_all_periods():
         hour=0, minute=0, second=0, microsecond=0
     )
     end_yesterday = start_yesterday + timedelta(days=1)
-    rows = fetch_user_counts(
-        DB_PATH, start_yesterday.timestamp(), end_yesterday.timestamp(), limit=TOP_N
+    start_week = now - timedelta(days=7)
+    start_month = now - timedelta(days=30)
+    first_ts = (
+        get_conn(DB_PATH).execute("SELECT MIN(ts_epoch) FROM events").fetchone()[0] or 0
     )
+    # 4 期間をまとめて 1 回の読み出しで集計する
+    until_ts = end_yesterday.timestamp()
+    boards = fetch_leaderboards(
+        DB_PATH,
+        [
+            ("昨日", start_yesterday.timestamp(), until_ts),
+            ("週間", start_week.timestamp(), until_ts),
+            ("月間", start_month.timestamp(), until_ts),
+            ("全期間", first_ts, until_ts),
+        ],
+        limit=TOP_N,
+    )
+    rows = boards["昨日"]
     yesterday_str = start_yesterday.strftime("%Y-%m-%d")
     for idx, (
         user_id,
@@ -249,10 +266,7 @@ def publish_all_periods():
     logger.info("✅ 昨日のランキングを Notion DB に upsert しました。")
 
     # 先週 (過去7日)
-    start_week = now - timedelta(days=7)
-    rows = fetch_user_counts(
-        DB_PATH, start_week.timestamp(), end_yesterday.timestamp(), limit=TOP_N
-    )
+    rows = boards["週間"]
     week_since = start_week.strftime("%Y-%m-%d")
     week_until = yesterday_str
     for idx, (
@@ -281,10 +295,7 @@ def publish_all_periods():
     logger.info("✅ 週間ランキングを Notion DB に upsert しました。")
 
     # 先月 (過去30日)
-    start_month = now - timedelta(days=30)
-    rows = fetch_user_counts(
-        DB_PATH, start_month.timestamp(), end_yesterday.timestamp(), limit=TOP_N
-    )
+    rows = boards["月間"]
     month_since = start_month.strftime("%Y-%m-%d")
     month_until = yesterday_str
     for idx, (
@@ -313,14 +324,9 @@ def publish_all_periods():
     logger.info("✅ 月間ランキングを Notion DB に upsert しました。")
 
     # 全期間: use earliest event timestamp as since
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT MIN(ts_epoch) FROM events")
-    first_ts = cur.fetchone()[0] or 0
-    conn.close()
     since_str = datetime.fromtimestamp(first_ts).strftime("%Y-%m-%d")
     until_str = yesterday_str
-    rows = fetch_user_counts(DB_PATH, first_ts, end_yesterday.timestamp(), limit=TOP_N)
+    rows = boards["全期間"]
     for idx, (
         user_id,
         posts,
@@ -15,15 +15,13 @@ load_dotenv()  # カレントディレクトリの .env を読み込む
 import os
 import subprocess
 import requests
-import sqlite3
 from datetime import datetime, timedelta
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.ticker import MaxNLocator
-import japanize_matplotlib
 import boto3
 from botocore.exceptions import BotoCoreError, ClientError
+from utils.db import get_conn
+from utils.charts import ChartSpec, render, render_all, save_png
+from utils.constants import WEIGHTS
 from utils.scoring import compute_score, fetch_user_counts
 from utils.slack_helpers import resolve_user
 from publish_master_upsert import update_timestamp_block
@@ -47,6 +45,8 @@ S3_KEY_PREFIX = os.getenv("S3_KEY_PREFIX", "").strip("/")
 HOST_URL = os.getenv("HOST_URL")
 NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 NOTION_PAGE_ID = os.getenv("NOTION_PAGE_ID")
+# Notion API のベース URL（負荷試験ではスタブサーバーに向ける）
+NOTION_API_URL = os.getenv("NOTION_API_URL", "https://api.notion.com")
 
 # 期間定義: (ファイル名用キー, 表示ラベル, 日数)
 PERIODS = [
@@ -82,9 +82,7 @@ def get_yesterday_mid():
 
 def get_all_start():
     """DB の最古イベント ts_epoch を datetimeで返す"""
-    conn = sqlite3.connect(DB_PATH)
-    row = conn.execute("SELECT MIN(ts_epoch) FROM events").fetchone()
-    conn.close()
+    row = get_conn(DB_PATH).execute("SELECT MIN(ts_epoch) FROM events").fetchone()
     if row and row[0]:
         # 日付を00:00に揃えて返す
         return datetime.fromtimestamp(row[0]).replace(
@@ -143,7 +141,7 @@ def append_paragraph_to_notion(page_id: str, text: str):
     """
     Notionページに段落テキストを追加
     """
-    url = f"https://api.notion.com/v1/blocks/{page_id}/children"
+    url = f"{NOTION_API_URL}/v1/blocks/{page_id}/children"
     data = {
         "children": [
             {
@@ -161,7 +159,7 @@ def append_paragraph_to_notion(page_id: str, text: str):
 
 def clear_page_children(page_id: str):
     """Notionページの子ブロックをすべて削除"""
-    url = f"https://api.notion.com/v1/blocks/{page_id}/children?page_size=100"
+    url = f"{NOTION_API_URL}/v1/blocks/{page_id}/children?page_size=100"
     res = requests.get(url, headers=HEADERS)
     res.raise_for_status()
     for child in res.json().get("results", []):
@@ -170,7 +168,7 @@ def clear_page_children(page_id: str):
         if block_type in ("child_database", "synced_block"):
             continue
         # それ以外のブロックを削除
-        del_url = f"https://api.notion.com/v1/blocks/{child['id']}"
+        del_url = f"{NOTION_API_URL}/v1/blocks/{child['id']}"
         requests.delete(del_url, headers=HEADERS).raise_for_status()
 
 
@@ -206,7 +204,7 @@ def append_image_grid_to_notion(page_id: str, blocks: list[tuple[str, str]]):
         "type": "column_list",
         "column_list": {"children": columns},
     }
-    url = f"https://api.notion.com/v1/blocks/{page_id}/children"
+    url = f"{NOTION_API_URL}/v1/blocks/{page_id}/children"
     res = requests.patch(url, headers=HEADERS, json={"children": [column_list]})
     # payload = {"children": [column_list]}  # Debug
     # logger.debug(f"[DEBUG] PATCH to {url} payload:\n{json.dumps(payload, ensure_ascii=False, indent=2)}")  # Debug
@@ -222,7 +220,7 @@ def fetch_daily_count(
     指定ユーザー・メトリクスの start_dt <= ts_epoch < end_dt の件数を返す。
     reaction は scored=1 でフィルタ。
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_conn(DB_PATH)
     if metric == "reaction":
         sql = (
             "SELECT COUNT(*) FROM events "
@@ -237,9 +235,59 @@ def fetch_daily_count(
             "AND ts_epoch>=? AND ts_epoch<?"
         )
         args = (user_id, metric, start_dt.timestamp(), end_dt.timestamp())
-    cnt = conn.execute(sql, args).fetchone()[0]
-    conn.close()
-    return cnt
+    return conn.execute(sql, args).fetchone()[0]
+
+
+# (metric, user, day) 配列の metric 軸の並び（score を除く METRICS と同順）
+COUNT_METRICS = ["post", "reaction", "answer", "positive_feedback", "violation"]
+SCORE_WEIGHTS = np.array(
+    [
+        WEIGHTS["post"],
+        WEIGHTS["reaction"],
+        WEIGHTS["answer"],
+        WEIGHTS["positive_feedback"],
+        WEIGHTS["violation"],
+    ]
+)
+
+
+def fetch_daily_series(user_ids: list, dates: list) -> dict:
+    """
+    user_ids × dates（各日 00:00 の datetime）の日別件数とスコアを 1 クエリでまとめて求める。
+    日次ロールアップ user_daily_counts を (metric, user, day) の NumPy 配列に展開し、
+    スコアは WEIGHTS との内積で出す。
+
+    :return: {metric: {user_id: [日ごとの値, ...]}}（METRICS の全キー。fetch_daily_count のループと同じ値）
+    """
+    # 期間・ユーザーが空なら空の系列を返す（dates[0] や空の IN () を避ける）
+    if not dates or not user_ids:
+        return {
+            metric: {uid: [0] * len(dates) for uid in user_ids}
+            for metric in ("score", *COUNT_METRICS)
+        }
+    day_index = {d.strftime("%Y-%m-%d"): i for i, d in enumerate(dates)}
+    user_index = {uid: i for i, uid in enumerate(user_ids)}
+    sql = f"""
+        SELECT day, user_id, posts, reactions_scored, answers, positive_fb, violations
+        FROM user_daily_counts
+        WHERE day >= ? AND day <= ?
+          AND user_id IN ({",".join("?" for _ in user_ids)})
+    """
+    args = [dates[0].strftime("%Y-%m-%d"), dates[-1].strftime("%Y-%m-%d"), *user_ids]
+    rows = get_conn(DB_PATH).execute(sql, args).fetchall()
+
+    counts = np.zeros((len(COUNT_METRICS), len(user_ids), len(dates)), dtype=np.int64)
+    if rows:
+        user_idx = np.fromiter((user_index[r[1]] for r in rows), np.intp, len(rows))
+        day_idx = np.fromiter((day_index[r[0]] for r in rows), np.intp, len(rows))
+        values = np.array([r[2:] for r in rows], dtype=np.int64)  # (行, metric)
+        np.add.at(counts, (slice(None), user_idx, day_idx), values.T)
+    scores = np.tensordot(SCORE_WEIGHTS, counts, axes=1)  # (user, day)
+
+    data = {"score": {uid: scores[i].tolist() for i, uid in enumerate(user_ids)}}
+    for m, metric in enumerate(COUNT_METRICS):
+        data[metric] = {uid: counts[m, i].tolist() for i, uid in enumerate(user_ids)}
+    return data
 
 
 def fetch_time_of_day_counts(user_ids, metric, start_dt, end_dt):
@@ -248,8 +296,7 @@ def fetch_time_of_day_counts(user_ids, metric, start_dt, end_dt):
     """
     # Initialize zero grid
     grid = np.zeros((7, 24), dtype=int)
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    cur = get_conn(DB_PATH).cursor()
     # Build SQL for reaction metric
     if metric == "reaction":
         sql = """
@@ -273,7 +320,6 @@ def fetch_time_of_day_counts(user_ids, metric, start_dt, end_dt):
         args = [metric, start_dt.timestamp(), end_dt.timestamp()] + user_ids
     cur.execute(sql, args)
     rows = cur.fetchall()
-    conn.close()
     for (ts,) in rows:
         dt = datetime.fromtimestamp(ts, tz=None)
         # convert to local
@@ -284,51 +330,51 @@ def fetch_time_of_day_counts(user_ids, metric, start_dt, end_dt):
     return grid
 
 
+def metric_trends_spec(
+    key: str, label: str, dates: list, data: dict, user_ids: list
+) -> ChartSpec:
+    """
+    折れ線グラフの描画指示を作る（ユーザー名の解決はここで行い、描画はワーカーに任せる）
+    """
+    return ChartSpec(
+        "metric_trends",
+        {
+            "key": key,
+            "label": label,
+            "dates": dates,
+            "metrics": METRICS,
+            "series": {m: [data[m][uid] for uid in user_ids] for m, _ in METRICS},
+            "user_labels": [resolve_user(uid) for uid in user_ids],
+        },
+    )
+
+
+def heatmap_spec(
+    key: str, label: str, start_dt: datetime, end_dt: datetime, user_ids: list
+) -> ChartSpec:
+    """
+    ヒートマップの描画指示を作る
+    """
+    heat_metrics = ["post", "reaction", "answer", "positive_feedback"]
+    panels = [
+        (
+            f"{METRICS_DICT[metric]}ヒートマップ (曜日vs時間帯)({label})",
+            fetch_time_of_day_counts(user_ids, metric, start_dt, end_dt),
+        )
+        for metric in heat_metrics
+    ]
+    return ChartSpec("metric_heatmaps", {"panels": panels})
+
+
 def plot_metric_trends(
     key: str, label: str, dates: list, data: dict, user_ids: list
 ) -> str:
     """
     折れ線グラフを描画して保存する共通関数
     """
-    fig, axes = plt.subplots(len(METRICS), 1, figsize=(12, 6 * len(METRICS)))
-    marker_styles = ["o", "s", "^", "D", "v", "P", "X"]
-    for ax, (metric, text) in zip(axes, METRICS):
-        for idx, uid in enumerate(user_ids):
-            marker = marker_styles[idx % len(marker_styles)]
-            ax.plot(dates, data[metric][uid], marker=marker, label=resolve_user(uid))
-        ax.set_title(f"{text} の推移 ({label})", fontsize=24)
-        if key == "all":
-            # For long full-period plots, use up to 15 tick labels
-            days = len(dates)
-            interval = max(1, days // 15)
-            ax.xaxis.set_major_locator(mdates.DayLocator(interval=interval))
-            ax.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d"))
-        else:
-            ax.xaxis.set_major_locator(mdates.DayLocator())
-            ax.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d"))
-        ax.tick_params(axis="x", rotation=45, labelsize=14)
-        ax.tick_params(axis="y", labelsize=14)
-        ax.grid(axis="y")
-        if metric != "score":
-            ax.set_ylim(bottom=0)
-            ax.yaxis.set_major_locator(MaxNLocator(integer=True))
-        # clamp x-axis to exact data range to remove extra padding
-        ax.set_xlim(dates[0], dates[-1])
-        handles, labels = ax.get_legend_handles_labels()
-        ax.legend(
-            handles,
-            labels,
-            loc="upper center",
-            ncol=len(handles),
-            # bbox_to_anchor=(0.5, 0.98), fontsize='medium')
-            bbox_to_anchor=(0.5, 0.98),
-            fontsize=14,
-        )
-
-    plt.tight_layout()
+    png = render(metric_trends_spec(key, label, dates, data, user_ids))
     out_path = os.path.join(OUT_DIR, f"metrics_{key}_{datetime.now():%Y%m%d%H%M%S}.png")
-    plt.savefig(out_path)
-    plt.close(fig)
+    save_png(png, out_path)
     print(f"[{key}] Saved Metrics Plots: {out_path}")
     return out_path
 
@@ -339,41 +385,9 @@ def plot_heatmap_for_period(
     """
     ヒートマップを描画して保存し、パスを返す共通関数
     """
-    heat_metrics = ["post", "reaction", "answer", "positive_feedback"]
-    fig_hm, axes_h = plt.subplots(
-        len(heat_metrics),
-        1,
-        figsize=(8, 5 * len(heat_metrics)),
-        constrained_layout=True,
-    )
-    for idx, metric in enumerate(heat_metrics):
-        grid = fetch_time_of_day_counts(user_ids, metric, start_dt, end_dt)
-        ax_h = axes_h[idx]
-        im = ax_h.imshow(grid, aspect="auto", cmap="Reds")
-        ax_h.set_title(
-            f"{METRICS_DICT[metric]}ヒートマップ (曜日vs時間帯)({label})", fontsize=18
-        )
-        ax_h.set_yticks(np.arange(7))
-        ax_h.set_yticklabels(["月", "火", "水", "木", "金", "土", "日"], fontsize=12)
-        ax_h.set_xticks(np.arange(24))
-        ax_h.set_xticklabels([f"{h}:00" for h in range(24)], rotation=45, fontsize=10)
-        ax_h.set_xticks(np.arange(-0.5, 24, 1), minor=True)
-        ax_h.set_yticks(np.arange(-0.5, 7, 1), minor=True)
-        ax_h.grid(which="minor", color="gray", linestyle="-", linewidth=0.5)
-        ax_h.grid(False, which="major")
-        for (y, x), val in np.ndenumerate(grid):
-            ax_h.text(
-                x, y, str(val), ha="center", va="center", fontsize=10, color="black"
-            )
-    cbar = fig_hm.colorbar(
-        im, ax=axes_h, orientation="horizontal", fraction=0.01, pad=0.01, location="top"
-    )
-    cbar.ax.xaxis.set_ticks_position("top")
-    cbar.ax.xaxis.set_label_position("top")
-    cbar.set_label("件数", fontsize=12)
+    png = render(heatmap_spec(key, label, start_dt, end_dt, user_ids))
     hm_path = os.path.join(OUT_DIR, f"heatmap_{key}_{datetime.now():%Y%m%d%H%M%S}.png")
-    plt.savefig(hm_path)
-    plt.close(fig_hm)
+    save_png(png, hm_path)
     print(f"[{key}] Saved Metrics Heatmaps: {hm_path}")
     return hm_path
 
@@ -403,6 +417,7 @@ def main():
     )
     # これから埋め込む画像とキャプションをまとめるリスト（3列×2行のグリッド用）
     to_embed_blocks: list[tuple[str, str]] = []
+    specs, labels = [], []
 
     for key, label, period_days in PERIODS:
         # 終端：昨日 00:00
@@ -421,33 +436,25 @@ def main():
             dates.append(d)
             d += timedelta(days=1)
 
-        # データ構造初期化
-        data = {m[0]: {uid: [] for uid in user_ids} for m in METRICS}
-
-        # 日別カウント＆スコア計算
-        for d in dates:
-            ws = d
-            we = d + timedelta(days=1)
-            for uid in user_ids:
-                for metric, _ in METRICS:
-                    if metric != "score":
-                        cnt = fetch_daily_count(uid, metric, ws, we)
-                        data[metric][uid].append(cnt)
-            # score は最後にまとめて
-            for uid in user_ids:
-                params = {
-                    "posts": data["post"][uid][-1],
-                    "reactions": data["reaction"][uid][-1],
-                    "answers": data["answer"][uid][-1],
-                    "positive_fb": data["positive_feedback"][uid][-1],
-                    "violations": data["violation"][uid][-1],
-                }
-                data["score"][uid].append(compute_score(params))
-
-        # 折れ線グラフを作成し、パスを得る
-        out_path = plot_metric_trends(key, label, dates, data, user_ids)
-        # ヒートマップを作成し、パスを得る
-        hm_path = plot_heatmap_for_period(key, label, start_dt, end_dt, user_ids)
+        # 日別カウント＆スコア計算（全ユーザー・全メトリクスを 1 クエリで）
+        data = fetch_daily_series(user_ids, dates)
+
+        # 折れ線グラフとヒートマップの描画指示（描画は全期間まとめて並列に行う）
+        specs.append(metric_trends_spec(key, label, dates, data, user_ids))
+        specs.append(heatmap_spec(key, label, start_dt, end_dt, user_ids))
+        labels.append((key, label))
+
+    pngs = render_all(specs)
+    stamp = f"{datetime.now():%Y%m%d%H%M%S}"
+    for i, (key, label) in enumerate(labels):
+        out_path = save_png(
+            pngs[2 * i], os.path.join(OUT_DIR, f"metrics_{key}_{stamp}.png")
+        )
+        print(f"[{key}] Saved Metrics Plots: {out_path}")
+        hm_path = save_png(
+            pngs[2 * i + 1], os.path.join(OUT_DIR, f"heatmap_{key}_{stamp}.png")
+        )
+        print(f"[{key}] Saved Metrics Heatmaps: {hm_path}")
 
         # --- 古いリモートファイルを削除 (新しいアップロード前) ---
         # try:
@@ -3,9 +3,9 @@ import re
 import sqlite3
 import time
 from datetime import datetime, timedelta, timezone
-from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from notion_client import Client as NotionClient
+from utils.slack_helpers import new_web_client
 import json
 import logging
 
@@ -30,6 +30,8 @@ ADMIN_CHANNEL = os.getenv("ADMIN_CHANNEL")
 NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 NOTION_TREND_PAGE_ID = os.getenv("NOTION_TREND_PAGE_ID")
 NOTION_TREND_URL = os.getenv("NOTION_TREND_URL")
+# Notion API のベース URL（負荷試験ではスタブサーバーに向ける）
+NOTION_API_URL = os.getenv("NOTION_API_URL", "https://api.notion.com")
 
 
 # ─── Database path ─────────────
@@ -37,7 +39,7 @@ DB_PATH = os.getenv("SCORES_DB_PATH", "scores.db")
 
 
 def post_faq_to_slack(db, slack_token=SLACK_BOT_TOKEN, channel=ADMIN_CHANNEL):
-    client = WebClient(token=slack_token)
+    client = new_web_client(slack_token)
     cur = db.cursor()
     cur.execute(
         "SELECT id, title, answer, source_url, created_at FROM extracted_items ORDER BY id"
@@ -99,7 +101,7 @@ def post_faq_to_slack(db, slack_token=SLACK_BOT_TOKEN, channel=ADMIN_CHANNEL):
 
 
 def post_trends_to_slack(db, slack_token=SLACK_BOT_TOKEN, channel=ADMIN_CHANNEL):
-    client = WebClient(token=slack_token)
+    client = new_web_client(slack_token)
     cur = db.cursor()
     cur.execute(
         "SELECT label, topic_text, size, created_at FROM trend_topics ORDER BY size DESC, created_at DESC"
@@ -160,7 +162,7 @@ def post_info_requests_to_slack(db, slack_token=SLACK_BOT_TOKEN, channel=ADMIN_C
     """
     Post recent information requests to Slack.
     """
-    client = WebClient(token=slack_token)
+    client = new_web_client(slack_token)
     cur = db.cursor()
     # Fetch top 5 info requests by most requested items (size)
     cur.execute(
@@ -535,7 +537,7 @@ def notion_upsert_all(db, notion_token=NOTION_TOKEN, page_id=NOTION_TREND_PAGE_I
         )
         return
 
-    notion = NotionClient(auth=notion_token)
+    notion = NotionClient(auth=notion_token, base_url=NOTION_API_URL)
 
     # 1. Clear existing content
     clear_notion_page(notion, page_id)
@@ -0,0 +1,170 @@
+"""
+違反判定の前段フィルタ（utils/prefilter.py）の学習とオフライン評価。
+
+slack_posts の本文と events の violation 記録から学習し、ホールドアウトで
+「違反の再現率」と「LLM に送らずに済む投稿の割合（LLM 呼び出し削減率）」を
+しきい値ごとに評価する。目標再現率を満たす最大のしきい値を成果物に保存する。
+
+Usage:
+    python train_prefilter.py                       # 学習して models/prefilter.joblib に保存
+    python train_prefilter.py --target-recall 0.99
+    python train_prefilter.py --evaluate            # 保存済みモデルを現在の DB で評価のみ
+"""
+
+import os
+import json
+import time
+import argparse
+import logging
+
+import joblib
+import numpy as np
+from dotenv import load_dotenv
+from sklearn.model_selection import train_test_split
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+from utils.db import get_conn
+from utils.classifier import GUIDELINES_HASH
+from utils.prefilter import (
+    PREFILTER_MODEL_PATH,
+    build_pipeline,
+    load_dataset,
+    make_scorer,
+)
+
+DB_PATH = os.getenv("SCORES_DB_PATH", "scores.db")
+# 違反がこれより少ないと学習しない
+MIN_POSITIVES = 20
+REPORT_THRESHOLDS = [0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.7]
+
+
+def evaluate(risk: np.ndarray, labels: np.ndarray, threshold: float) -> dict:
+    """risk >= threshold の投稿だけ LLM に送るとしたときの再現率と削減率"""
+    forwarded = risk >= threshold
+    positives = int(labels.sum())
+    caught = int((forwarded & (labels == 1)).sum())
+    return {
+        "threshold": threshold,
+        "recall": caught / positives if positives else 1.0,
+        "missed": positives - caught,
+        "llm_calls_saved": float(1.0 - forwarded.mean()) if len(labels) else 0.0,
+        "forwarded": int(forwarded.sum()),
+    }
+
+
+def pick_threshold(risk: np.ndarray, labels: np.ndarray, target_recall: float):
+    """再現率 target_recall を満たす最大のしきい値（違反の risk の分位点）"""
+    pos = np.sort(risk[labels == 1])
+    # 下から (1 - target_recall) の割合までは取りこぼしてよい
+    allowed_misses = int(np.floor(len(pos) * (1.0 - target_recall)))
+    return float(pos[allowed_misses])
+
+
+def report(risk, labels, chosen: float) -> dict:
+    rows = [evaluate(risk, labels, t) for t in REPORT_THRESHOLDS]
+    rows.append(dict(evaluate(risk, labels, chosen), chosen=True))
+    rows.sort(key=lambda r: r["threshold"])
+    print(
+        f"\n{len(labels)} messages, {int(labels.sum())} violations "
+        f"({labels.mean():.2%})"
+    )
+    print(f"{'threshold':>10} {'recall':>8} {'missed':>7} {'LLM calls saved':>16}")
+    for r in rows:
+        mark = "  <- chosen" if r.get("chosen") else ""
+        print(
+            f"{r['threshold']:>10.4f} {r['recall']:>8.2%} {r['missed']:>7} "
+            f"{r['llm_calls_saved']:>16.2%}{mark}"
+        )
+    return {"n": len(labels), "positives": int(labels.sum()), "rows": rows}
+
+
+def score_time(pipeline, texts, n=1000) -> float:
+    """1 投稿あたりの推論時間（秒）。ボットと同じ make_scorer で測る"""
+    risk = make_scorer(pipeline)
+    sample = texts[:n] or [""]
+    started = time.perf_counter()
+    for t in sample:
+        risk(t)
+    return (time.perf_counter() - started) / len(sample)
+
+
+def train(db_path: str, out_path: str, target_recall: float, test_size: float):
+    texts, labels = load_dataset(get_conn(db_path))
+    if labels.sum() < MIN_POSITIVES:
+        raise SystemExit(
+            f"Only {int(labels.sum())} labelled violations in slack_posts; "
+            f"need at least {MIN_POSITIVES} to train the prefilter"
+        )
+    x_train, x_test, y_train, y_test = train_test_split(
+        texts, labels, test_size=test_size, stratify=labels, random_state=0
+    )
+    pipeline = build_pipeline()
+    started = time.perf_counter()
+    pipeline.fit(x_train, y_train)
+    logger.info(
+        f"Trained on {len(x_train)} messages in {time.perf_counter() - started:.1f}s"
+    )
+
+    risk = pipeline.predict_proba(x_test)[:, 1]
+    threshold = pick_threshold(risk, y_test, target_recall)
+    rep = report(risk, y_test, threshold)
+    per_message = score_time(pipeline, x_test)
+    print(f"scoring time: {per_message * 1e6:.0f} us/message")
+
+    artifact = {
+        "pipeline": pipeline,
+        "threshold": threshold,
+        "target_recall": target_recall,
+        "trained_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "guidelines_hash": GUIDELINES_HASH,
+        "report": rep,
+    }
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    joblib.dump(artifact, out_path)
+    report_path = os.path.splitext(out_path)[0] + ".report.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {k: v for k, v in artifact.items() if k != "pipeline"}
+            | {"scoring_time_us": per_message * 1e6},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    logger.info(f"Saved prefilter to {out_path} (report: {report_path})")
+
+
+def evaluate_saved(db_path: str, model_path: str):
+    """保存済みモデルを現在の DB 全体で評価する（学習に使った投稿も含む点に注意）"""
+    artifact = joblib.load(model_path)
+    if artifact.get("guidelines_hash") != GUIDELINES_HASH:
+        logger.warning("guidelines.txt has changed since the prefilter was trained")
+    texts, labels = load_dataset(get_conn(db_path))
+    risk = artifact["pipeline"].predict_proba(texts)[:, 1]
+    report(risk, labels, artifact["threshold"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train / evaluate the prefilter")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--out", default=PREFILTER_MODEL_PATH)
+    parser.add_argument("--target-recall", type=float, default=0.98)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument(
+        "--evaluate", action="store_true", help="evaluate the saved model only"
+    )
+    args = parser.parse_args()
+    if args.evaluate:
+        evaluate_saved(args.db, args.out)
+    else:
+        train(args.db, args.out, args.target_recall, args.test_size)
+
+
+if __name__ == "__main__":
+    main()
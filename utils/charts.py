@@ -0,0 +1,341 @@
+"""
+グラフ描画ステージ。
+
+各ジョブはまず描画に必要なデータだけを持つ ChartSpec を組み立て、render_all() で
+プロセスプールに渡して PNG バイト列を受け取る。描画は pyplot を使わず
+Figure + FigureCanvasAgg のオブジェクト指向 API だけで行うので、グローバル状態を共有せず
+スケジューラのスレッドやプロセス間で安全に並列化できる。
+"""
+
+import io
+import os
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+import numpy as np
+import japanize_matplotlib  # noqa: F401  日本語フォント設定（ワーカープロセスでも読み込まれる）
+import matplotlib.dates as mdates
+import matplotlib.ticker as ticker
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+logger = logging.getLogger(__name__)
+
+# 描画プロセス数（0 なら呼び出し元スレッドで順に描画）
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+WEEKDAY_LABELS = ["月", "火", "水", "木", "金", "土", "日"]
+
+
+@dataclass
+class ChartSpec:
+    """
+    1 枚のグラフの描画指示。kind は RENDERERS のキー、params は描画関数の引数
+    （プロセス間で受け渡すので、リスト・辞書・NumPy 配列・datetime などの pickle 可能な値だけにする）。
+    """
+
+    kind: str
+    params: dict = field(default_factory=dict)
+
+
+def _png(fig: Figure, **savefig_kwargs) -> bytes:
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", **savefig_kwargs)
+    return buf.getvalue()
+
+
+def _new_figure(figsize, **kwargs) -> Figure:
+    fig = Figure(figsize=figsize, **kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+# ─── publish_user_metrics ─────────────────────────────
+def render_metric_trends(
+    key: str,
+    label: str,
+    dates: list,
+    metrics: list,
+    series: dict,
+    user_labels: list,
+) -> bytes:
+    """
+    メトリクスごとの折れ線グラフ（縦に並べる）。
+    series: {metric: [ユーザーごとの日別値リスト, ...]}（user_labels と同順）
+    """
+    fig = _new_figure((12, 6 * len(metrics)))
+    axes = fig.subplots(len(metrics), 1)
+    marker_styles = ["o", "s", "^", "D", "v", "P", "X"]
+    for ax, (metric, text) in zip(axes, metrics):
+        for idx, (values, name) in enumerate(zip(series[metric], user_labels)):
+            marker = marker_styles[idx % len(marker_styles)]
+            ax.plot(dates, values, marker=marker, label=name)
+        ax.set_title(f"{text} の推移 ({label})", fontsize=24)
+        if key == "all":
+            # For long full-period plots, use up to 15 tick labels
+            interval = max(1, len(dates) // 15)
+            ax.xaxis.set_major_locator(mdates.DayLocator(interval=interval))
+        else:
+            ax.xaxis.set_major_locator(mdates.DayLocator())
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d"))
+        ax.tick_params(axis="x", rotation=45, labelsize=14)
+        ax.tick_params(axis="y", labelsize=14)
+        ax.grid(axis="y")
+        if metric != "score":
+            ax.set_ylim(bottom=0)
+            ax.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+        # clamp x-axis to exact data range to remove extra padding
+        ax.set_xlim(dates[0], dates[-1])
+        handles, labels = ax.get_legend_handles_labels()
+        ax.legend(
+            handles,
+            labels,
+            loc="upper center",
+            ncol=len(handles),
+            bbox_to_anchor=(0.5, 0.98),
+            fontsize=14,
+        )
+    fig.tight_layout()
+    return _png(fig)
+
+
+def render_metric_heatmaps(panels: list) -> bytes:
+    """
+    曜日×時間帯ヒートマップを縦に並べる。panels: [(タイトル, 7x24 配列), ...]
+    """
+    fig = _new_figure((8, 5 * len(panels)), constrained_layout=True)
+    axes = fig.subplots(len(panels), 1)
+    im = None
+    for ax, (title, grid) in zip(axes, panels):
+        grid = np.asarray(grid)
+        im = ax.imshow(grid, aspect="auto", cmap="Reds")
+        ax.set_title(title, fontsize=18)
+        ax.set_yticks(np.arange(7))
+        ax.set_yticklabels(WEEKDAY_LABELS, fontsize=12)
+        ax.set_xticks(np.arange(24))
+        ax.set_xticklabels([f"{h}:00" for h in range(24)], rotation=45, fontsize=10)
+        ax.set_xticks(np.arange(-0.5, 24, 1), minor=True)
+        ax.set_yticks(np.arange(-0.5, 7, 1), minor=True)
+        ax.grid(which="minor", color="gray", linestyle="-", linewidth=0.5)
+        ax.grid(False, which="major")
+        for (y, x), val in np.ndenumerate(grid):
+            ax.text(
+                x, y, str(val), ha="center", va="center", fontsize=10, color="black"
+            )
+    cbar = fig.colorbar(
+        im, ax=axes, orientation="horizontal", fraction=0.01, pad=0.01, location="top"
+    )
+    cbar.ax.xaxis.set_ticks_position("top")
+    cbar.ax.xaxis.set_label_position("top")
+    cbar.set_label("件数", fontsize=12)
+    return _png(fig)
+
+
+# ─── violation_trends ─────────────────────────────
+def render_violation_rule_counts(rules: list, values: list, period_name: str) -> bytes:
+    """ルール番号ごとの違反件数の棒グラフ。rules: ルール番号（文字列）、values: 件数"""
+    fig = _new_figure((10, 6))
+    ax = fig.subplots()
+    rule_nums = [int(r) for r in rules]
+    ax.bar(rule_nums, values, color="red")
+    # only horizontal grid lines for histogram
+    ax.grid(axis="y")
+    ax.set_xlabel("ガイドライン規約違反となったルール番号", fontsize=16)
+    ax.set_ylabel("件数", fontsize=16)
+    ax.tick_params(axis="y", labelsize=16)
+    ax.set_title(
+        f"ガイドライン規約違反となったルール番号の傾向 ({period_name})", fontsize=24
+    )
+    ax.set_xticks(rule_nums, rules, fontsize=16)
+    fig.tight_layout()
+    return _png(fig)
+
+
+def render_violation_time_series(
+    dates: list, lines: dict, period_name: str, all_period: bool
+) -> bytes:
+    """
+    ルールごとの日別違反件数の折れ線。lines: {rule: [dates と同順の件数]}
+    """
+    fig = _new_figure((12, 6))
+    ax = fig.subplots()
+    for rule, y in lines.items():
+        ax.plot(dates, y, marker="o", label=f"Rule {rule}")
+    ax.set_xlabel("日時", fontsize=16)
+    ax.set_ylabel("件数", fontsize=16)
+    ax.set_title(
+        f"ガイドライン規約違反となったルールの推移 ({period_name})", fontsize=24
+    )
+    ax.grid(axis="y")
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d"))
+    if all_period:
+        ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+    else:
+        ax.xaxis.set_major_locator(mdates.DayLocator(interval=1))
+    ax.tick_params(axis="x", rotation=45, labelsize=14)
+    ax.tick_params(axis="y", labelsize=16)
+    ax.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+    # Place legend inside the plot at top center, allowing multiple columns
+    if lines:
+        ax.legend(
+            loc="upper center",
+            bbox_to_anchor=(0.5, 0.9),
+            ncol=min(len(lines), 5),
+            fontsize=14,
+        )
+    if dates:
+        # Set x-axis limits to span exactly from first to last date (yesterday)
+        ax.set_xlim(dates[0], dates[-1])
+        ax.margins(x=0)
+        if all_period:
+            days_count = (dates[-1] - dates[0]).days + 1
+            ax.xaxis.set_major_locator(
+                mdates.DayLocator(interval=max(1, days_count // 15))
+            )
+    fig.tight_layout(pad=0.5)
+    return _png(fig)
+
+
+def render_violation_heatmap(grid, period_name: str) -> bytes:
+    """曜日×時間帯の違反件数ヒートマップ。grid: 7x24 配列"""
+    data = np.asarray(grid)
+    fig = _new_figure((12, 8))
+    ax = fig.subplots()
+    im = ax.imshow(data, aspect="auto", cmap="Reds")
+    # Set major ticks at the center of each cell
+    ax.set_xticks(
+        np.arange(24), [f"{h}:00" for h in range(24)], rotation=45, fontsize=12
+    )
+    ax.set_yticks(np.arange(7), WEEKDAY_LABELS, fontsize=12)
+    # Set minor ticks at cell boundaries and draw gridlines there
+    ax.set_xticks(np.arange(-0.5, 24, 1), minor=True)
+    ax.set_yticks(np.arange(-0.5, 7, 1), minor=True)
+    ax.grid(which="minor", color="gray", linestyle="-", linewidth=0.5)
+    ax.grid(False, which="major")
+    # Annotate each cell with its count, centered
+    vmax = data.max()
+    for y in range(data.shape[0]):
+        for x in range(data.shape[1]):
+            ax.text(
+                x,
+                y,
+                str(data[y, x]),
+                ha="center",
+                va="center",
+                color="black" if data[y, x] < vmax / 2 else "white",
+                fontsize=10,
+            )
+    cbar = fig.colorbar(
+        im,
+        ax=ax,
+        orientation="horizontal",
+        fraction=0.1,
+        pad=0.15,
+        aspect=40,
+        label="ガイドライン規約違反件数",
+    )
+    cbar.ax.tick_params(labelsize=14)
+    cbar.ax.xaxis.label.set_fontsize(14)
+    cbar.ax.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+    ax.set_xlabel("時間帯", fontsize=16)
+    ax.set_ylabel("曜日", fontsize=16)
+    ax.set_title(
+        f"ガイドライン規約違反ヒートマップ (曜日vs時間帯) ({period_name})", fontsize=24
+    )
+    fig.tight_layout()
+    return _png(fig)
+
+
+RENDERERS = {
+    "metric_trends": render_metric_trends,
+    "metric_heatmaps": render_metric_heatmaps,
+    "violation_rule_counts": render_violation_rule_counts,
+    "violation_time_series": render_violation_time_series,
+    "violation_heatmap": render_violation_heatmap,
+}
+
+
+def render(spec: ChartSpec) -> bytes:
+    """1 枚描画して PNG バイト列を返す（ワーカープロセスのエントリポイント）"""
+    return RENDERERS[spec.kind](**spec.params)
+
+
+# ─── プロセスプール ─────────────────────────────
+_pool = None
+_pool_lock = threading.Lock()
+# 一度プールが壊れたら、以降はプロセス終了までこのプロセスで描画する。
+# 作り直すとスレッドが動いている bot プロセスから fork することになり、
+# 他スレッドが握ったロックを子に持ち込んでデッドロックしうる
+_pool_broken = False
+
+
+def _get_pool():
+    """プールを返す。壊れた後は None（呼び出し側でインライン描画する）"""
+    global _pool
+    with _pool_lock:
+        if _pool_broken:
+            return None
+        if _pool is None:
+            # spawn / forkserver だと子プロセスが __main__（app.py）を再実行してしまうため fork で起動する。
+            # app.py は start_pool() でスレッドを立てる前に fork しておく
+            _pool = ProcessPoolExecutor(
+                max_workers=CHART_WORKERS,
+                mp_context=multiprocessing.get_context("fork"),
+            )
+            # fork コンテキストでは最初の submit で全ワーカーが起動する
+            _pool.submit(int).result()
+        return _pool
+
+
+def start_pool():
+    """
+    ワーカープロセスを今すぐ起動する。常駐プロセスではスケジューラ等のスレッドを
+    開始する前に呼ぶ（スレッドが持つロックを子プロセスに持ち込まないため）。
+    """
+    if CHART_WORKERS > 0:
+        _get_pool()
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown)
+
+
+def render_all(specs: list) -> list:
+    """
+    specs をプロセスプールで並列に描画し、同じ順序で PNG バイト列のリストを返す。
+    """
+    if not specs:
+        return []
+    pool = _get_pool() if CHART_WORKERS > 0 else None
+    if pool is None:
+        return [render(spec) for spec in specs]
+    try:
+        return list(pool.map(render, specs))
+    except BrokenProcessPool:
+        # ワーカーが落ちた（OOM 等）。プールは作り直さず、以降はこのプロセスで描画する
+        logger.exception("Chart worker pool broke; rendering inline from now on")
+        global _pool, _pool_broken
+        with _pool_lock:
+            _pool_broken = True
+            broken, _pool = _pool, None
+        if broken is not None:
+            broken.shutdown(wait=False, cancel_futures=True)
+        return [render(spec) for spec in specs]
+
+
+def save_png(png: bytes, path: str) -> str:
+    with open(path, "wb") as f:
+        f.write(png)
+    return path
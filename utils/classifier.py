@@ -2,7 +2,17 @@ import os
 import re
 import openai
 import json
+import hashlib
 import logging
+import sqlite3
+import threading
+import unicodedata
+from contextlib import contextmanager
+
+from .db import llm_cache_get, llm_cache_put, llm_cache_evict, llm_cache_size
+from .prefilter import prefilter
+from .llm_batcher import MicroBatcher
+from . import llm_client
 
 logger = logging.getLogger(__name__)
 
@@ -66,67 +76,311 @@ RULES_MAP = {
 }
 
 
+# ─── 判定結果キャッシュ（llm_cache） ─────────────────────────
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE", "1").lower() in ("1", "true", "yes")
+LLM_CACHE_TTL_DAYS = float(os.environ.get("LLM_CACHE_TTL_DAYS", "30"))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "50000"))
+# この件数の保存ごとに上限を超えた分を削除する
+_EVICT_EVERY = 500
+
+GUIDELINES_HASH = hashlib.sha256(GUIDELINES.encode("utf-8")).hexdigest()[:16]
+# プロンプトを変えたら上げる（その種別のキャッシュが無効になる）
+PROMPT_VERSIONS = {"classify": 1, "feedback": 1, "answer": 1, "analyze": 1}
+
+_cache_lock = threading.Lock()
+_cache_stats = {kind: {"hits": 0, "misses": 0} for kind in PROMPT_VERSIONS}
+_cache_puts = 0
+
+
+def _normalize(text: str) -> str:
+    """全角半角・連続空白の違いを吸収する（編集で空白だけ変わった投稿も同じキーになる）"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(kind: str, *texts) -> str:
+    """判定種別・プロンプト版・モデル名・ガイドラインのハッシュ・正規化した入力からキーを作る"""
+    h = hashlib.sha256()
+    parts = [kind, str(PROMPT_VERSIONS[kind]), MODEL, GUIDELINES_HASH]
+    parts += ["\0" if t is None else _normalize(t) for t in texts]
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def _cache_get(kind: str, key: str):
+    if not LLM_CACHE_ENABLED:
+        return None
+    try:
+        value = llm_cache_get(key, max_age=LLM_CACHE_TTL_DAYS * 86400)
+    except sqlite3.Error as e:
+        logger.warning(f"llm_cache lookup failed: {e}")
+        value = None
+    with _cache_lock:
+        _cache_stats[kind]["hits" if value is not None else "misses"] += 1
+    if value is not None:
+        logger.info(f"[LLM cache] {kind} hit")
+    return value
+
+
+def _cache_put(kind: str, key: str, value):
+    global _cache_puts
+    if not LLM_CACHE_ENABLED:
+        return
+    try:
+        llm_cache_put(key, kind, value)
+        with _cache_lock:
+            _cache_puts += 1
+            evict = _cache_puts % _EVICT_EVERY == 0
+        if evict:
+            evict_cache()
+    except sqlite3.Error as e:
+        logger.warning(f"llm_cache store failed: {e}")
+
+
+def evict_cache() -> int:
+    """TTL を過ぎた行と LLM_CACHE_MAX_ENTRIES を超えた分（LRU）を削除する"""
+    deleted = llm_cache_evict(
+        max_age=LLM_CACHE_TTL_DAYS * 86400, max_entries=LLM_CACHE_MAX_ENTRIES
+    )
+    if deleted:
+        logger.info(f"llm_cache evicted {deleted} entries")
+    return deleted
+
+
+def cache_stats() -> dict:
+    """判定種別ごとのヒット・ミス数とヒット率、キャッシュの行数"""
+    with _cache_lock:
+        kinds = {kind: dict(c) for kind, c in _cache_stats.items()}
+    for c in kinds.values():
+        total = c["hits"] + c["misses"]
+        c["hit_rate"] = c["hits"] / total if total else 0.0
+    hits = sum(c["hits"] for c in kinds.values())
+    total = hits + sum(c["misses"] for c in kinds.values())
+    return {
+        "kinds": kinds,
+        "hit_rate": hits / total if total else 0.0,
+        "entries": llm_cache_size(),
+    }
+
+
+# track_usage() の集計先（スレッドごとのスタック）
+_usage_local = threading.local()
+
+
+@contextmanager
+def track_usage():
+    """
+    このブロック内（同じスレッド）で行った LLM 呼び出しの回数とトークン数を集計する。
+    with track_usage() as usage: ... → usage = {"calls", "prompt_tokens", "completion_tokens"}
+    """
+    usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    stack = _usage_local.__dict__.setdefault("stack", [])
+    stack.append(usage)
+    try:
+        yield usage
+    finally:
+        stack.pop()
+
+
+def _chat_create(**create_args):
+    """llm_client 経由で chat.completions.create を呼び、トークン使用量を track_usage() に加算する"""
+    resp = llm_client.chat_create(**create_args)
+    tokens = getattr(resp, "usage", None)
+    for usage in getattr(_usage_local, "stack", ()):
+        usage["calls"] += 1
+        if tokens is not None:
+            usage["prompt_tokens"] += tokens.prompt_tokens or 0
+            usage["completion_tokens"] += tokens.completion_tokens or 0
+    return resp
+
+
+_CLASSIFY_SYSTEM = (
+    "あなたは研究室のSlackコミュニティ運営ボットです。以下はコミュニティ規約(番号付き)です。全文をよく読み、"
+    "投稿が規約違反かどうか、かつ、違反なら何番に違反しているかを番号で答えてください。\n\n"
+    f"{GUIDELINES}"
+)
+
+
 def classify_text(text: str) -> dict:
     """
     ガイドライン違反判定を LLM で行い、辞書で返す。
     {"violation": bool}
     モック fallback も含む。
+    LLM_BATCH=1 なら同時に来た他の投稿とまとめて 1 回の LLM 呼び出しで判定する。
     """
     # モック版: badword があれば違反
     if "badword" in text.lower():
         return {"violation": True}
     # LLM 判定（例: ChatGPT）
     if openai.api_key:
-        # システムプロンプトに規約を埋め込み、ユーザープロンプトで投稿を渡す
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "あなたは研究室のSlackコミュニティ運営ボットです。以下はコミュニティ規約(番号付き)です。全文をよく読み、"
-                    "投稿が規約違反かどうか、かつ、違反なら何番に違反しているかを番号で答えてください。\n\n"
-                    f"{GUIDELINES}"
-                ),
-            },
-            {
-                "role": "user",
-                "content": (
-                    f"次の投稿について:\n```{text}```\n"
-                    "1) 違反していますか？Yes/No\n"
-                    "2) 違反なら、違反した規約番号をカンマ区切りで教えてください。違反がない場合は、番号は一切返さないでください。"
-                    # f"次のSlack投稿がコミュニティ規約に違反しているか？ Yes か No で答えてください。\n```{text}```"
-                ),
-            },
-        ]
-        create_args = {
-            "model": MODEL,
-            "messages": messages,
-        }
-        logger.info(f"[LLM: {MODEL}] classify_text req: '{text[:80]}'")
-        # gpt-3.5-turbo 系で temperature=0 を使いたい場合
-        if not MODEL.startswith("o4-"):
-            create_args["temperature"] = 0
-
-        resp = openai.chat.completions.create(**create_args)
-        out = resp.choices[0].message.content.strip()
-        logger.info(f"[LLM: {MODEL}] classify_text resp: '{out[:80]}'")
-        # 返り値例:
-        # Yes
-        # 3,5
-        text_lower = out.lower()
-        violation = bool(re.search(r"\byes\b", text_lower))  # Yes/No 判定
-        # 違反ありの場合のみ番号を抽出、それ以外は空リスト
-        if violation:
-            # 全文から番号を抽出 → セット化して重複を除き、ソート
-            extracted = map(int, re.findall(r"\b[1-9]\d*\b", out))
-            valid_rules = sorted({n for n in extracted if 1 <= n <= NUM_GUIDELINES})
-        else:
-            valid_rules = []
-        return {"violation": violation, "rules": valid_rules}
+        # 前段フィルタで明らかに問題のない投稿は LLM に送らない
+        if not prefilter.should_check(text):
+            return {"violation": False, "rules": []}
+        key = cache_key("classify", text)
+        cached = _cache_get("classify", key)
+        if cached is not None:
+            return cached
+        try:
+            if LLM_BATCH_ENABLED:
+                result, usage = _get_batcher().submit(text).result()
+                _add_usage(usage)
+            else:
+                result = _classify_one(text)
+        except Exception as e:
+            # API 障害時はキーワード判定（上の badword チェック）の結果のまま違反なしとする
+            logger.warning(f"classify_text failed, using keyword fallback: {e}")
+            return {"violation": False, "rules": []}
+        _cache_put("classify", key, result)
+        return result
 
     # API キーがない場合のフォールバック
     return {"violation": False}
 
 
+def _classify_one(text: str) -> dict:
+    """1 投稿を LLM で違反判定する（キャッシュなし）"""
+    # システムプロンプトに規約を埋め込み、ユーザープロンプトで投稿を渡す
+    messages = [
+        {"role": "system", "content": _CLASSIFY_SYSTEM},
+        {
+            "role": "user",
+            "content": (
+                f"次の投稿について:\n```{text}```\n"
+                "1) 違反していますか？Yes/No\n"
+                "2) 違反なら、違反した規約番号をカンマ区切りで教えてください。違反がない場合は、番号は一切返さないでください。"
+                # f"次のSlack投稿がコミュニティ規約に違反しているか？ Yes か No で答えてください。\n```{text}```"
+            ),
+        },
+    ]
+    create_args = {
+        "model": MODEL,
+        "messages": messages,
+    }
+    logger.info(f"[LLM: {MODEL}] classify_text req: '{text[:80]}'")
+    # gpt-3.5-turbo 系で temperature=0 を使いたい場合
+    if not MODEL.startswith("o4-"):
+        create_args["temperature"] = 0
+
+    resp = _chat_create(**create_args)
+    out = resp.choices[0].message.content.strip()
+    logger.info(f"[LLM: {MODEL}] classify_text resp: '{out[:80]}'")
+    # 返り値例:
+    # Yes
+    # 3,5
+    text_lower = out.lower()
+    violation = bool(re.search(r"\byes\b", text_lower))  # Yes/No 判定
+    # 違反ありの場合のみ番号を抽出、それ以外は空リスト
+    if violation:
+        # 全文から番号を抽出 → セット化して重複を除き、ソート
+        extracted = map(int, re.findall(r"\b[1-9]\d*\b", out))
+        valid_rules = sorted({n for n in extracted if 1 <= n <= NUM_GUIDELINES})
+    else:
+        valid_rules = []
+    return {"violation": violation, "rules": valid_rules}
+
+
+# ─── 違反判定のマイクロバッチ ─────────────────────────
+LLM_BATCH_ENABLED = os.environ.get("LLM_BATCH", "0").lower() in ("1", "true", "yes")
+LLM_BATCH_MAX = int(os.environ.get("LLM_BATCH_MAX", "8"))
+LLM_BATCH_WAIT_MS = float(os.environ.get("LLM_BATCH_WAIT_MS", "50"))
+LLM_BATCH_DISPATCHERS = int(os.environ.get("LLM_BATCH_DISPATCHERS", "4"))
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def _get_batcher():
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(
+                _classify_batch_measured,
+                max_batch=LLM_BATCH_MAX,
+                max_wait=LLM_BATCH_WAIT_MS / 1000,
+                dispatchers=LLM_BATCH_DISPATCHERS,
+                name="classify-batch",
+            )
+        return _batcher
+
+
+def batch_stats() -> dict:
+    """違反判定バッチの集計（バッチ無効なら空）"""
+    return _batcher.stats() if _batcher is not None else {}
+
+
+def _add_usage(usage: dict):
+    """別スレッドで行った LLM 呼び出しの使用量を、このスレッドの track_usage() に加算する"""
+    for u in getattr(_usage_local, "stack", ()):
+        for k in u:
+            u[k] += usage[k]
+
+
+def _classify_batch_prompt(texts: list[str]) -> str:
+    posts = "\n".join(f"[{i}]\n```{t}```" for i, t in enumerate(texts, 1))
+    return (
+        f"次の {len(texts)} 件の投稿それぞれについて、規約違反かどうかと違反した規約番号を判定してください。\n\n"
+        f"{posts}\n\n"
+        '投稿番号をキー、違反した規約番号の整数リストを値にした JSON オブジェクト（例: {"1": [], "2": [3, 5]}）だけを、'
+        "全投稿分返してください。違反がない投稿の値は [] にしてください。"
+    )
+
+
+def classify_texts(texts: list[str]) -> list[dict]:
+    """
+    複数の投稿の違反判定を 1 回の LLM 呼び出しで行い、同じ順の結果リストを返す。
+    規約部分（システムプロンプト）のトークンを投稿間で共有する。
+    応答に含まれない・形式が違う投稿は 1 件ずつの classify 判定にフォールバックする。
+    """
+    if len(texts) == 1:
+        return [_classify_one(texts[0])]
+    create_args = {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": _CLASSIFY_SYSTEM},
+            {"role": "user", "content": _classify_batch_prompt(texts)},
+        ],
+        "response_format": {"type": "json_object"},
+    }
+    if not MODEL.startswith("o4-"):
+        create_args["temperature"] = 0
+
+    logger.info(f"[LLM: {MODEL}] classify_texts req: {len(texts)} posts")
+    parsed = {}
+    try:
+        resp = _chat_create(**create_args)
+        out = resp.choices[0].message.content.strip()
+        logger.info(f"[LLM: {MODEL}] classify_texts resp: '{out[:120]}'")
+        # 出力トークンを抑えるため、違反なしは []、違反ありは規約番号のリストで受け取る
+        for i, rules in json.loads(out).items():
+            if (
+                i.isdigit()
+                and 1 <= int(i) <= len(texts)
+                and isinstance(rules, list)
+                and all(isinstance(n, int) and not isinstance(n, bool) for n in rules)
+            ):
+                parsed[int(i) - 1] = {
+                    "violation": bool(rules),
+                    "rules": sorted({n for n in rules if 1 <= n <= NUM_GUIDELINES}),
+                }
+    except Exception as e:
+        logger.warning(f"classify_texts failed, falling back to per-post calls: {e}")
+    missing = [i for i in range(len(texts)) if i not in parsed]
+    if missing and parsed:
+        logger.warning(f"classify_texts: no valid result for {len(missing)} posts")
+    return [
+        parsed[i] if i in parsed else _classify_one(texts[i]) for i in range(len(texts))
+    ]
+
+
+def _classify_batch_measured(texts: list[str]) -> list[tuple[dict, dict]]:
+    """バッチ判定の結果に、LLM 使用量を件数で按分したものを添える"""
+    with track_usage() as usage:
+        results = classify_texts(texts)
+    share = {k: v / len(texts) for k, v in usage.items()}
+    return [(result, share) for result in results]
+
+
 '''
 def detect_positive_feedback(text: str) -> list:
     """
@@ -152,6 +406,11 @@ def detect_positive_feedback(text: str) -> list[str]:
     if not openai.api_key:
         return re.findall(r"<@([A-Z0-9]+)>", text)
 
+    key = cache_key("feedback", text)
+    cached = _cache_get("feedback", key)
+    if cached is not None:
+        return cached
+
     # LLM プロンプトを組み立て
     try:
         system = "あなたはSlackコミュニティ運営ボットです。"
@@ -172,13 +431,14 @@ def detect_positive_feedback(text: str) -> list[str]:
             create_args["temperature"] = 0
 
         logger.info(f"[LLM: {MODEL}] detect_positive_feedback req: '{text[:80]}'")
-        resp = openai.chat.completions.create(**create_args)
+        resp = _chat_create(**create_args)
         content = resp.choices[0].message.content.strip()
         logger.info(f"[LLM: {MODEL}] detect_positive_feedback resp: '{content[:80]}'")
 
         # LLMが["Uxxxx"]の形で返す場合
         ids = json.loads(content)
         if isinstance(ids, list):
+            _cache_put("feedback", key, ids)
             return ids
     except Exception as e:
         # print(f"LLM failed: {e}")  # 必要に応じてログ
@@ -211,6 +471,10 @@ def is_likely_answer(question: str, answer: str) -> bool:
     APIキーがない場合のフォールバックとして、20文字以上なら回答とみなす。
     """
     if openai.api_key:
+        key = cache_key("answer", question, answer)
+        cached = _cache_get("answer", key)
+        if cached is not None:
+            return cached
         messages = [
             {
                 "role": "system",
@@ -230,10 +494,149 @@ def is_likely_answer(question: str, answer: str) -> bool:
         logger.info(
             f"[LLM: {MODEL}] is_likely_answer req: question='{question[:80]}', answer='{answer[:80]}'"
         )
-        resp = openai.chat.completions.create(**create_args)
+        try:
+            resp = _chat_create(**create_args)
+        except Exception as e:
+            logger.warning(f"is_likely_answer failed, using length fallback: {e}")
+            return len(answer) >= 20
         ans = resp.choices[0].message.content.strip().lower()
         logger.info(f"[LLM: {MODEL}] is_likely_answer resp: '{ans[:80]}'")
 
-        return ans.startswith("yes")
+        is_answer = ans.startswith("yes")
+        _cache_put("answer", key, is_answer)
+        return is_answer
     # フォールバック
     return len(answer) >= 20
+
+
+_ANALYZE_SYSTEM = (
+    "あなたは研究室のSlackコミュニティ運営ボットです。以下はコミュニティ規約(番号付き)です。全文をよく読み、"
+    "投稿を判定して JSON だけを返してください。\n\n"
+    f"{GUIDELINES}"
+)
+
+
+def _analyze_prompt(text: str, parent_text: str | None) -> str:
+    prompt = (
+        f"次の投稿について:\n```{text}```\n"
+        "以下のキーを持つ JSON オブジェクトで答えてください。\n"
+        '- "violation": 規約違反なら true、違反でなければ false\n'
+        '- "rules": 違反した規約番号の整数リスト（違反がなければ []）\n'
+        '- "positive_feedback": 投稿が他ユーザーへの「感謝」や「称賛」などのポジティブなフィードバックを含む場合、'
+        "その対象としてメンションされたユーザーID（<@U123> の U123 部分）の文字列リスト。含まなければ []\n"
+    )
+    if parent_text is not None:
+        prompt += (
+            f"この投稿は次の質問へのスレッド返信です:\n```{parent_text}```\n"
+            '- "is_answer": この返信が質問に対する適切な回答なら true、そうでなければ false\n'
+        )
+    return prompt
+
+
+def _validate_analysis(obj, text: str, parent_text: str | None) -> dict:
+    """
+    analyze_message の LLM 出力を検証して正規化する。形式が違えば ValueError。
+    """
+    if not isinstance(obj, dict) or not isinstance(obj.get("violation"), bool):
+        raise ValueError(f"invalid analysis: {obj!r}")
+    rules = obj.get("rules", [])
+    targets = obj.get("positive_feedback", [])
+    if not isinstance(rules, list) or not all(
+        isinstance(n, int) and not isinstance(n, bool) for n in rules
+    ):
+        raise ValueError(f"invalid rules: {rules!r}")
+    if not isinstance(targets, list) or not all(isinstance(u, str) for u in targets):
+        raise ValueError(f"invalid positive_feedback: {targets!r}")
+    is_answer = None
+    if parent_text is not None:
+        is_answer = obj.get("is_answer")
+        if not isinstance(is_answer, bool):
+            raise ValueError(f"invalid is_answer: {is_answer!r}")
+
+    violation = obj["violation"]
+    mentioned = set(re.findall(r"<@([A-Z0-9]+)>", text))
+    return {
+        "violation": violation,
+        "rules": (
+            sorted({n for n in rules if 1 <= n <= NUM_GUIDELINES}) if violation else []
+        ),
+        # 投稿中にメンションされていない ID は捨てる。キーワードがなければ従来どおり対象なし
+        "positive_feedback": (
+            [u for u in dict.fromkeys(targets) if u in mentioned]
+            if any(kw in text for kw in POSITIVE_KEYWORDS)
+            else []
+        ),
+        "is_answer": is_answer,
+    }
+
+
+def _analyze_fallback(
+    text: str, parent_text: str | None, source: str = "fallback"
+) -> dict:
+    """
+    判定ごとの関数で analyze_message と同じ形の結果を作る。
+    source="prefilter" は前段フィルタで違反なしと決まった投稿（違反判定の LLM 呼び出しを省く）。
+    """
+    if source == "prefilter":
+        result = {"violation": False, "rules": []}
+    else:
+        result = classify_text(text)
+    violation = bool(result.get("violation"))
+    return {
+        "violation": violation,
+        "rules": result.get("rules", []),
+        "positive_feedback": [] if violation else detect_positive_feedback(text),
+        "is_answer": (
+            None
+            if violation or parent_text is None
+            else is_likely_answer(parent_text, text)
+        ),
+        "source": source,
+    }
+
+
+def analyze_message(text: str, parent_text: str = None) -> dict:
+    """
+    違反判定・ポジティブフィードバック対象・回答判定を 1 回の LLM 呼び出しでまとめて行う。
+    parent_text を渡したときだけ回答判定する（スレッド返信の親投稿本文）。
+
+    戻り値: {"violation": bool, "rules": [int], "positive_feedback": [user_id],
+             "is_answer": bool | None, "source": "combined" | "fallback" | "prefilter"}
+    JSON が壊れている・形式が違う・API エラーのときは classify_text などの個別判定にフォールバックする。
+    前段フィルタで違反なしと決まった投稿は、ポジティブFB・回答判定だけを個別に行う
+    （ポジティブFB はキーワードがなければ LLM を呼ばない）。
+    """
+    # モック版: badword があれば違反
+    if "badword" in text.lower() or not openai.api_key:
+        return _analyze_fallback(text, parent_text)
+    if not prefilter.should_check(text):
+        return _analyze_fallback(text, parent_text, source="prefilter")
+
+    key = cache_key("analyze", text, parent_text)
+    cached = _cache_get("analyze", key)
+    if cached is not None:
+        return cached
+
+    create_args = {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": _ANALYZE_SYSTEM},
+            {"role": "user", "content": _analyze_prompt(text, parent_text)},
+        ],
+        "response_format": {"type": "json_object"},
+    }
+    if not MODEL.startswith("o4-"):
+        create_args["temperature"] = 0
+
+    logger.info(f"[LLM: {MODEL}] analyze_message req: '{text[:80]}'")
+    try:
+        resp = _chat_create(**create_args)
+        out = resp.choices[0].message.content.strip()
+        logger.info(f"[LLM: {MODEL}] analyze_message resp: '{out[:120]}'")
+        analysis = _validate_analysis(json.loads(out), text, parent_text)
+    except Exception as e:
+        logger.warning(f"analyze_message failed, falling back to per-check calls: {e}")
+        return _analyze_fallback(text, parent_text)
+    analysis["source"] = "combined"
+    _cache_put("analyze", key, analysis)
+    return analysis
@@ -1,10 +1,14 @@
 import os
 import time
+import atexit
+import signal
 import datetime
 from datetime import timedelta
 import json
 import sqlite3
+import threading
 import logging
+from concurrent.futures import Future
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,9 +18,175 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 from dotenv import load_dotenv
+from .write_queue import WriteQueue
+from .live_scoreboard import LiveScoreboard
 
 load_dotenv()
 DB_PATH = os.environ.get("SCORES_DB_PATH", "scores.db")
+# 接続チューニング（WAL 前提。NORMAL でもコミット済みデータは電源断以外で失われない）
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+SQLITE_CACHED_STATEMENTS = 256
+# 書き込みの耐久性モード
+#   sync : 呼び出し元はコミット完了まで待つ（複数スレッドの書き込みは 1 トランザクションにまとめる）
+#   async: キューに積んだら即座に返る（record_event は行IDの Future を返す）
+DB_WRITE_MODE = os.environ.get("DB_WRITE_MODE", "sync")
+DB_WRITE_BATCH_SIZE = int(os.environ.get("DB_WRITE_BATCH_SIZE", "256"))
+DB_WRITE_MAX_LATENCY_MS = int(
+    os.environ.get("DB_WRITE_MAX_LATENCY_MS", "20" if DB_WRITE_MODE == "async" else "0")
+)
+
+# スレッドごとの接続キャッシュと、終了時に閉じるための全接続リスト
+_local = threading.local()
+_registry_lock = threading.Lock()
+_open_conns: list[sqlite3.Connection] = []
+# close_all() のたびに進め、他スレッドが閉じ済み接続を使い回さないようにする
+_generation = 0
+
+
+def _open_conn(db_path: str) -> sqlite3.Connection:
+    """
+    WAL モード・synchronous・busy_timeout を設定した SQLite 接続を開く。
+    """
+    conn = sqlite3.connect(
+        db_path,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=SQLITE_CACHED_STATEMENTS,
+        # 1 接続は 1 スレッドでしか使わないが、close_all() を別スレッドから呼べるように
+        check_same_thread=False,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    with _registry_lock:
+        _open_conns.append(conn)
+    return conn
+
+
+def get_conn(db_path: str = None) -> sqlite3.Connection:
+    """
+    プロセス共通の SQLite 接続を返す（スレッドごとに 1 接続を使い回す）。
+    呼び出し側で close() しないこと。書き込みは `with conn:` でトランザクションにする。
+
+    :param db_path: DB ファイルパス（未指定なら DB_PATH）
+    """
+    path = db_path or DB_PATH
+    conns = getattr(_local, "conns", None)
+    if conns is None or getattr(_local, "generation", None) != _generation:
+        conns = _local.conns = {}
+        _local.generation = _generation
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = _open_conn(path)
+    return conn
+
+
+def close_all():
+    """
+    get_conn() で開いた全接続を閉じる（プロセス終了時・テスト用）。
+    """
+    global _generation
+    with _registry_lock:
+        conns = list(_open_conns)
+        _open_conns.clear()
+        _generation += 1
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to close sqlite connection: {e}")
+
+
+atexit.register(close_all)
+
+
+# user_scores への加算を 1 文の UPSERT で行う（行が無ければ作成）
+_UPSERT_SCORE_SQL = """
+    INSERT INTO user_scores(
+        user_id, post_count, reaction_count, answer_count,
+        positive_feedback_count, violation_count
+    ) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        post_count = post_count + excluded.post_count,
+        reaction_count = reaction_count + excluded.reaction_count,
+        answer_count = answer_count + excluded.answer_count,
+        positive_feedback_count = positive_feedback_count + excluded.positive_feedback_count,
+        violation_count = violation_count + excluded.violation_count
+"""
+
+
+# events / user_scores への書き込みはライタースレッド 1 本に集約する
+_writer = WriteQueue(
+    get_conn,
+    _UPSERT_SCORE_SQL,
+    max_batch=DB_WRITE_BATCH_SIZE,
+    max_latency=DB_WRITE_MAX_LATENCY_MS / 1000,
+)
+atexit.register(_writer.stop)
+
+
+def exit_on_signals(signums=(signal.SIGTERM, signal.SIGINT)):
+    """
+    SIGTERM / SIGINT を受けたら SystemExit で終了し、atexit の後始末を走らせる（メインスレッドから呼ぶ）。
+    既定の SIGTERM（systemctl stop / docker stop）は atexit を飛ばすため、async モードで
+    キューに残った events・スコアの加算が失われる。
+    """
+
+    def _exit(signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}; flushing DB writes")
+        raise SystemExit(0)
+
+    for signum in signums:
+        signal.signal(signum, _exit)
+
+
+# /scoreboard today|daily|weekly 用のメモリ上のランキング（rebuild_live_scoreboard() で有効化）
+live_scoreboard = LiveScoreboard()
+
+
+def _add_to_live_scoreboard(
+    future: Future, user_id: str, event_type: str, ts_epoch, event_id=None
+):
+    """
+    書き込みがコミットされてから live_scoreboard に加算する（Future の完了時に呼ぶ）。
+    失敗した書き込みは数えない。event_id 未指定なら Future の結果（INSERT の行ID）を使う。
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    if event_id is None:
+        event_id = future.result()
+    elif isinstance(event_id, Future):
+        event_id = event_id.result()
+    live_scoreboard.add(user_id, event_type, ts_epoch, event_id=event_id)
+
+
+def _settle(future: Future):
+    """sync モードならコミット完了を待って結果を返し、async モードなら Future のまま返す。"""
+    if DB_WRITE_MODE == "async":
+        return future
+    return future.result()
+
+
+def flush_writes(timeout: float = None) -> bool:
+    """
+    キューに積まれた書き込みがすべてコミットされるまで待つ（集計前・終了前など）。
+    """
+    return _writer.flush(timeout)
+
+
+def write_stats() -> dict:
+    """
+    ライタースレッドの統計（キュー長、バッチ数、平均バッチサイズ、コミットまでの遅延など）。
+    """
+    return _writer.stats()
+
+
+def rebuild_live_scoreboard() -> dict:
+    """
+    未コミットの書き込みを反映してから、live_scoreboard を events から作り直す（起動時・定期照合）。
+    """
+    flush_writes()
+    return live_scoreboard.rebuild(get_conn())
 
 
 def update_score(
@@ -29,37 +199,16 @@ def update_score(
 ):
     """
     スコア(user_scores)を更新するユーティリティ関数。
-    """
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("INSERT OR IGNORE INTO user_scores(user_id) VALUES(?)", (user_id,))
-    if post:
-        cur.execute(
-            "UPDATE user_scores SET post_count = post_count + 1 WHERE user_id = ?",
-            (user_id,),
-        )
-    if reaction:
-        cur.execute(
-            "UPDATE user_scores SET reaction_count = reaction_count + 1 WHERE user_id = ?",
-            (user_id,),
-        )
-    if answer:
-        cur.execute(
-            "UPDATE user_scores SET answer_count = answer_count + 1 WHERE user_id = ?",
-            (user_id,),
-        )
-    if positive_feedback:
-        cur.execute(
-            "UPDATE user_scores SET positive_feedback_count = positive_feedback_count + 1 WHERE user_id = ?",
-            (user_id,),
-        )
-    if violation:
-        cur.execute(
-            "UPDATE user_scores SET violation_count = violation_count + 1 WHERE user_id = ?",
-            (user_id,),
-        )
-    conn.commit()
-    conn.close()
+    加算はライタースレッドでユーザーごとにまとめて適用される。
+    """
+    deltas = (
+        int(post),
+        int(reaction),
+        int(answer),
+        int(positive_feedback),
+        int(violation),
+    )
+    _settle(_writer.add_score(user_id, deltas))
 
 
 '''def record_reaction_event(user_id, reactor_id, reaction_name, ts_epoch):
@@ -93,23 +242,80 @@ def record_event(
     :param reactor_id: リアクションした人（通常イベントではNone）
     :param reaction_name: リアクション名（通常イベントではNone）
     :param violation_rule: ガイドライン違反と判定された時の該当するルール番号（通常イベントではNone）
+    :return: 行ID（DB_WRITE_MODE=async の場合は行IDの Future。mark_reaction_scored にそのまま渡せる）
     """
-    if ts_epoch is None:
-        ts_epoch = time.time()
+    # Slack の ts（文字列）もそのまま渡せるよう数値にそろえる
+    ts_epoch = time.time() if ts_epoch is None else float(ts_epoch)
 
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
+    future = _writer.insert(
         "INSERT INTO events (user_id, reactor_id, type, reaction_name, ts_epoch, violation_rule) VALUES (?, ?, ?, ?, ?, ?)",
         (user_id, reactor_id, event_type, reaction_name, ts_epoch, violation_rule),
     )
-    event_id = cur.lastrowid
-    conn.commit()
     logger.info(
         f"DB INSERT: user_id={user_id}, reactor_id={reactor_id}, type={event_type}, reaction_name={reaction_name}, ts_epoch={ts_epoch}"
     )
-    conn.close()
-    return event_id
+    # reaction は加点時（mark_reaction_scored）にスコアボードへ反映する
+    if event_type != "reaction":
+        future.add_done_callback(
+            lambda f: _add_to_live_scoreboard(f, user_id, event_type, ts_epoch)
+        )
+    return _settle(future)
+
+
+def save_pending_message(channel: str, event_ts: str, event: dict) -> bool:
+    """
+    受信した message イベントを pending_messages に保存する（コミットまで待つ）。
+    Slack の再送などで同じ (channel, event_ts) が既にあれば何もせず False を返す。
+    """
+    future = _writer.execute(
+        "INSERT OR IGNORE INTO pending_messages (channel, event_ts, event, received_at) VALUES (?, ?, ?, ?)",
+        (channel, event_ts, json.dumps(event, ensure_ascii=False), time.time()),
+    )
+    return future.result() > 0
+
+
+def finish_pending_message(
+    channel: str, event_ts: str, error: str = None, max_attempts: int = 1
+):
+    """
+    処理結果を記録する（コミットまで待つ）。error があれば attempts を進め、
+    max_attempts に達するまでは 'pending' のまま残して fetch_pending_messages で再処理させる。
+    """
+    if error is None:
+        sql = "UPDATE pending_messages SET status = 'done', attempts = attempts + 1, finished_at = ?, error = NULL WHERE channel = ? AND event_ts = ?"
+        params = (time.time(), channel, event_ts)
+    else:
+        sql = """
+            UPDATE pending_messages
+            SET attempts = attempts + 1,
+                status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END,
+                finished_at = ?, error = ?
+            WHERE channel = ? AND event_ts = ?
+        """
+        params = (max_attempts, time.time(), error, channel, event_ts)
+    _writer.execute(sql, params).result()
+
+
+def fetch_pending_messages(limit: int = 100) -> list:
+    """未処理の message イベントを受信順に返す: [(channel, event_ts, event dict), ...]"""
+    rows = (
+        get_conn()
+        .execute(
+            "SELECT channel, event_ts, event FROM pending_messages WHERE status = 'pending' ORDER BY id LIMIT ?",
+            (limit,),
+        )
+        .fetchall()
+    )
+    return [(channel, event_ts, json.loads(event)) for channel, event_ts, event in rows]
+
+
+def purge_pending_messages(days: int = 7) -> int:
+    """処理済み（done）で days 日より古い pending_messages を削除する。failed は調査用に残す。"""
+    future = _writer.execute(
+        "DELETE FROM pending_messages WHERE status = 'done' AND finished_at < ?",
+        (time.time() - days * 86400,),
+    )
+    return future.result()
 
 
 def is_positive_reaction(reaction_name: str):
@@ -117,14 +323,14 @@ def is_positive_reaction(reaction_name: str):
     指定リアクションがポジティブか（キャッシュ）DBから判定。
     戻り値: True(1), False(0), 未判定(None)
     """
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT is_positive FROM reaction_judgement WHERE reaction_name = ?",
-        (reaction_name,),
+    row = (
+        get_conn()
+        .execute(
+            "SELECT is_positive FROM reaction_judgement WHERE reaction_name = ?",
+            (reaction_name,),
+        )
+        .fetchone()
     )
-    row = cur.fetchone()
-    conn.close()
     if row is None:
         return None
     return bool(row[0])
@@ -134,23 +340,261 @@ def cache_positive_reaction(reaction_name: str, is_positive: bool):
     """
     リアクションに対するポジティブ/非ポジティブ判定をキャッシュ(DB)に記録
     """
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT OR REPLACE INTO reaction_judgement (reaction_name, is_positive, last_checked_ts) VALUES (?, ?, ?)",
-        (reaction_name, int(is_positive), time.time()),
+    conn = get_conn()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO reaction_judgement (reaction_name, is_positive, last_checked_ts) VALUES (?, ?, ?)",
+            (reaction_name, int(is_positive), time.time()),
+        )
+
+
+def llm_cache_get(key: str, max_age: float = None):
+    """
+    llm_cache から判定結果を返す（なければ、または max_age 秒より古ければ None）。
+    ヒットしたら last_used / hits をライタースレッドで更新する（呼び出し元は待たない）。
+    """
+    row = (
+        get_conn()
+        .execute("SELECT result, created_at FROM llm_cache WHERE key = ?", (key,))
+        .fetchone()
+    )
+    if row is None:
+        return None
+    now = time.time()
+    if max_age is not None and row[1] < now - max_age:
+        return None
+    _writer.execute(
+        "UPDATE llm_cache SET last_used = ?, hits = hits + 1 WHERE key = ?",
+        (now, key),
+    )
+    return json.loads(row[0])
+
+
+def llm_cache_put(key: str, kind: str, result):
+    """判定結果を llm_cache に保存する（同じキーは上書き）"""
+    now = time.time()
+    _settle(
+        _writer.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, kind, result, created_at, last_used, hits) VALUES (?, ?, ?, ?, ?, 0)",
+            (key, kind, json.dumps(result, ensure_ascii=False), now, now),
+        )
+    )
+
+
+def llm_cache_evict(max_age: float = None, max_entries: int = None) -> int:
+    """
+    llm_cache から作成後 max_age 秒を過ぎた行と、max_entries を超えた分を
+    last_used の古い順（LRU）に削除する。削除した行数を返す。
+    """
+    deleted = 0
+    if max_age is not None:
+        deleted += _writer.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - max_age,)
+        ).result()
+    if max_entries is not None:
+        deleted += _writer.execute(
+            """
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (max_entries,),
+        ).result()
+    return deleted
+
+
+def llm_cache_size() -> int:
+    return get_conn().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+def record_llm_call(
+    func: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    latency: float,
+    attempts: int,
+    outcome: str,
+):
+    """LLM 呼び出し 1 回分を llm_calls に記録する（ライタースレッドに積むだけで待たない）"""
+    return _writer.execute(
+        "INSERT INTO llm_calls (ts, func, model, prompt_tokens, completion_tokens, latency, attempts, outcome) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            time.time(),
+            func,
+            model,
+            prompt_tokens,
+            completion_tokens,
+            latency,
+            attempts,
+            outcome,
+        ),
+    )
+
+
+def fetch_llm_call_stats(since_ts: float, until_ts: float = None) -> list[dict]:
+    """
+    期間内の LLM 呼び出しを呼び出し元・モデルごとに集計し、トークン数の多い順に返す。
+    latencies は成功した呼び出しの所要時間（分位点の計算用）。
+    """
+    until_ts = time.time() if until_ts is None else until_ts
+    conn = get_conn()
+    rows = conn.execute(
+        """
+        SELECT func, model, COUNT(*), SUM(outcome != 'ok'),
+               SUM(prompt_tokens), SUM(completion_tokens), SUM(latency)
+        FROM llm_calls
+        WHERE ts >= ? AND ts < ?
+        GROUP BY func, model
+        ORDER BY SUM(prompt_tokens) + SUM(completion_tokens) DESC
+        """,
+        (since_ts, until_ts),
+    ).fetchall()
+    latencies = {}
+    for func, model, latency in conn.execute(
+        "SELECT func, model, latency FROM llm_calls WHERE ts >= ? AND ts < ? AND outcome = 'ok'",
+        (since_ts, until_ts),
+    ):
+        latencies.setdefault((func, model), []).append(latency)
+    return [
+        {
+            "func": func,
+            "model": model,
+            "calls": calls,
+            "failed": failed,
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_latency": total_latency,
+            "latencies": latencies.get((func, model), []),
+        }
+        for func, model, calls, failed, prompt, completion, total_latency in rows
+    ]
+
+
+def purge_llm_calls(days: int = 90) -> int:
+    """days 日より古い llm_calls を削除する"""
+    return _writer.execute(
+        "DELETE FROM llm_calls WHERE ts < ?", (time.time() - days * 86400,)
+    ).result()
+
+
+def upsert_slack_users(rows: list[tuple]):
+    """
+    slack_users に (user_id, name, is_bot, deleted, updated_at) をまとめて書き込む。
+    users.list の全件はこの 1 トランザクションで、イベントでの 1 件更新はライタースレッドで行う。
+    """
+    sql = "INSERT OR REPLACE INTO slack_users (user_id, name, is_bot, deleted, updated_at) VALUES (?, ?, ?, ?, ?)"
+    if len(rows) == 1:
+        return _settle(_writer.execute(sql, rows[0]))
+    conn = get_conn()
+    with conn:
+        conn.executemany(sql, rows)
+
+
+def upsert_slack_channels(rows: list[tuple]):
+    """slack_channels に (channel_id, name, is_archived, updated_at) をまとめて書き込む"""
+    sql = "INSERT OR REPLACE INTO slack_channels (channel_id, name, is_archived, updated_at) VALUES (?, ?, ?, ?)"
+    if len(rows) == 1:
+        return _settle(_writer.execute(sql, rows[0]))
+    conn = get_conn()
+    with conn:
+        conn.executemany(sql, rows)
+
+
+def fetch_slack_directory() -> tuple[list[tuple], list[tuple]]:
+    """
+    保存済みのディレクトリを返す。
+    戻り値: ([(user_id, name, updated_at), ...], [(channel_id, name, updated_at), ...])
+    """
+    conn = get_conn()
+    users = conn.execute("SELECT user_id, name, updated_at FROM slack_users").fetchall()
+    channels = conn.execute(
+        "SELECT channel_id, name, updated_at FROM slack_channels"
+    ).fetchall()
+    return users, channels
+
+
+def upsert_slack_post(ts, channel: str, user: str, text: str, thread_ts=None):
+    """
+    受信したメッセージを slack_posts に書き込む（ライタースレッド経由）。
+    同じ (channel, ts) が既にあれば作者・本文・thread_ts を上書きする（編集の反映）
+    """
+    return _settle(
+        _writer.execute(
+            """
+        INSERT INTO slack_posts (ts, channel, user, text, thread_ts) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (channel, ts) DO UPDATE SET
+            user = excluded.user, text = excluded.text, thread_ts = excluded.thread_ts
+        """,
+            (
+                float(ts),
+                channel,
+                user or "",
+                (text or "").strip(),
+                float(thread_ts or ts),
+            ),
+        )
+    )
+
+
+def fetch_slack_post(channel: str, ts) -> tuple | None:
+    """slack_posts の (channel, ts) の投稿の (user, text)。なければ None"""
+    return (
+        get_conn()
+        .execute(
+            "SELECT user, text FROM slack_posts WHERE channel = ? AND ts = ?",
+            (channel, float(ts)),
+        )
+        .fetchone()
+    )
+
+
+def delete_slack_post(channel: str, ts):
+    """削除されたメッセージを slack_posts から消す"""
+    return _settle(
+        _writer.execute(
+            "DELETE FROM slack_posts WHERE channel = ? AND ts = ?",
+            (channel, float(ts)),
+        )
+    )
+
+
+def open_ingest_window(source: str, started_at: float = None, last_seen: float = None):
+    """ingest_windows に区間を追加して id を返す（live は起動時に開き、touch_ingest_window で延ばす）"""
+    started_at = time.time() if started_at is None else started_at
+    return _writer.insert(
+        "INSERT INTO ingest_windows (source, started_at, last_seen) VALUES (?, ?, ?)",
+        (source, started_at, started_at if last_seen is None else last_seen),
+    ).result()
+
+
+def touch_ingest_window(window_id: int):
+    """live の区間の終わりを現在時刻に延ばす"""
+    return _settle(
+        _writer.execute(
+            "UPDATE ingest_windows SET last_seen = ? WHERE id = ?",
+            (time.time(), window_id),
+        )
+    )
+
+
+def fetch_ingest_windows(since: float) -> list[tuple]:
+    """since 以降に終わった取り込み済み区間 [(started_at, last_seen), ...]（開始順）"""
+    return (
+        get_conn()
+        .execute(
+            "SELECT started_at, last_seen FROM ingest_windows WHERE last_seen >= ? ORDER BY started_at",
+            (since,),
+        )
+        .fetchall()
     )
-    conn.commit()
-    conn.close()
 
 
 def get_unjudged_reactions():
     """
     reaction_judgementテーブルに未登録のリアクション名一覧を返す。
     """
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
+    cur = get_conn().execute(
         """
         SELECT DISTINCT reaction_name FROM events
         WHERE type='reaction'
@@ -159,7 +603,6 @@ def get_unjudged_reactions():
     """
     )
     rows = cur.fetchall()
-    conn.close()
     return [row[0] for row in rows if row[0]]
 
 
@@ -167,9 +610,7 @@ def get_unscored_positive_reactions():
     """
     reaction_judgementでポジティブと判定済み、かつscored=0のreactionイベントを返す
     """
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
+    cur = get_conn().execute(
         """
         SELECT events.id, events.user_id, events.reactor_id, events.reaction_name, events.ts_epoch
         FROM events
@@ -180,7 +621,6 @@ def get_unscored_positive_reactions():
     """
     )
     rows = cur.fetchall()
-    conn.close()
     # カラム順に注意
     return [
         {
@@ -194,15 +634,22 @@ def get_unscored_positive_reactions():
     ]
 
 
-def mark_reaction_scored(event_id: int):
+def mark_reaction_scored(
+    event_id: int | Future, user_id: str = None, ts_epoch: float = None
+):
     """
     イベントIDをscored=1にする
-    """
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("UPDATE events SET scored=1 WHERE id=?", (event_id,))
-    conn.commit()
-    conn.close()
+    event_id には record_event が返した Future も渡せる（書き込み時に行IDへ解決される）。
+    user_id（被リアクション者）を渡すと live_scoreboard にも加算する。
+    """
+    future = _writer.execute("UPDATE events SET scored=1 WHERE id=?", (event_id,))
+    if user_id is not None:
+        future.add_done_callback(
+            lambda f: _add_to_live_scoreboard(
+                f, user_id, "reaction", ts_epoch, event_id
+            )
+        )
+    _settle(future)
 
 
 def apply_reaction_scores(events):
@@ -210,18 +657,20 @@ def apply_reaction_scores(events):
     まとめてリアクション加点（eventsはget_positive_reaction_events()などの結果）。
     user_id（=リアクション付与された人）に対して加点し、scoredフラグを立てる。
     """
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    conn = get_conn()
+    with conn:
+        for event in events:
+            # 加点処理
+            conn.execute(
+                "UPDATE user_scores SET reaction_count = reaction_count + 1 WHERE user_id = ?",
+                (event["user_id"],),
+            )
+            # scoredフラグを立てる
+            conn.execute("UPDATE events SET scored=1 WHERE id=?", (event["id"],))
     for event in events:
-        # 加点処理
-        cur.execute(
-            "UPDATE user_scores SET reaction_count = reaction_count + 1 WHERE user_id = ?",
-            (event["user_id"],),
+        live_scoreboard.add(
+            event["user_id"], "reaction", event["ts_epoch"], event_id=event["id"]
         )
-        # scoredフラグを立てる
-        cur.execute("UPDATE events SET scored=1 WHERE id=?", (event["id"],))
-    conn.commit()
-    conn.close()
 
 
 def fetch_posts_for_faq(conn, channel, window_days=7):
@@ -262,47 +711,41 @@ def insert_extracted_item(
     extracted_itemsテーブルに新規アイテムを挿入する。
     post_idsはリスト、titleは文字列
     """
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    conn = get_conn()
     try:
         if created_at is None:
             created_at = datetime.datetime.utcnow().isoformat()
         item_json = {"post_ids": post_ids, "title": title}
-        cur.execute(
-            "INSERT INTO extracted_items (post_ids, title, created_at, answer, source_url) VALUES (?, ?, ?, ?, ?)",
-            (json.dumps(post_ids), title, created_at, answer, source_url),
-        )
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO extracted_items (post_ids, title, created_at, answer, source_url) VALUES (?, ?, ?, ?, ?)",
+                (json.dumps(post_ids), title, created_at, answer, source_url),
+            )
         item_id = cur.lastrowid
-        conn.commit()
         logger.info(f"Inserted extracted_item with id={item_id}, title={title}")
         return item_id
     except Exception as e:
         logger.error(f"Failed to insert extracted_item: {e}")
         raise
-    finally:
-        conn.close()
 
 
 def insert_extracted_item_type(item_id, type_name):
     """
     extracted_item_typesテーブルに新規タイプを挿入する。
     """
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    conn = get_conn()
     try:
-        cur.execute(
-            "INSERT INTO extracted_item_types (item_id, type) VALUES (?, ?)",
-            (item_id, type_name),
-        )
-        conn.commit()
+        with conn:
+            conn.execute(
+                "INSERT INTO extracted_item_types (item_id, type) VALUES (?, ?)",
+                (item_id, type_name),
+            )
         logger.info(
             f"Inserted extracted_item_type with item_id={item_id}, type_name={type_name}"
         )
     except Exception as e:
         logger.error(f"Failed to insert extracted_item_type: {e}")
         raise
-    finally:
-        conn.close()
 
 
 def insert_trend_topic(conn, label, topic_text, size, created_at=None):
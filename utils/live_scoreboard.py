@@ -0,0 +1,212 @@
+import heapq
+import time
+import logging
+import threading
+from datetime import datetime
+
+from .constants import WEIGHTS
+
+logger = logging.getLogger(__name__)
+
+# events.type → カウンタの添字（fetch_user_counts の列順: posts, reactions, answers, positive_fb, violations）
+_COLUMNS = {
+    "post": 0,
+    "reaction": 1,
+    "answer": 2,
+    "positive_feedback": 3,
+    "violation": 4,
+}
+_WEIGHTS = (
+    WEIGHTS["post"],
+    WEIGHTS["reaction"],
+    WEIGHTS["answer"],
+    WEIGHTS["positive_feedback"],
+    WEIGHTS["violation"],
+)
+
+
+def _local_midnight(now: float) -> float:
+    return (
+        datetime.fromtimestamp(now)
+        .replace(hour=0, minute=0, second=0, microsecond=0)
+        .timestamp()
+    )
+
+
+# /scoreboard の期間キー → その時点での集計開始時刻
+WINDOWS = {
+    "today": _local_midnight,
+    "daily": lambda now: now - 86400,
+    "weekly": lambda now: now - 7 * 86400,
+}
+
+
+class _Window:
+    """
+    1 つのローリング期間のユーザー別カウンタ。
+    期間内のイベントを時刻順のヒープで持ち、期間外になったものから差し引く（近似なしで SQL と一致）。
+    """
+
+    __slots__ = ("start_fn", "heap", "totals", "version", "cached")
+
+    def __init__(self, start_fn):
+        self.start_fn = start_fn
+        self.heap = []  # (ts, user_id, col)
+        # user_id → [posts, reactions, answers, positive_fb, violations]
+        self.totals = {}
+        self.version = 0
+        self.cached = None  # (version, limit, rows)
+
+    def add(self, ts: float, user_id: str, col: int, now: float):
+        if ts < self.start_fn(now):
+            return
+        heapq.heappush(self.heap, (ts, user_id, col))
+        self.totals.setdefault(user_id, [0] * len(_COLUMNS))[col] += 1
+        self.version += 1
+
+    def evict(self, now: float):
+        start = self.start_fn(now)
+        heap = self.heap
+        while heap and heap[0][0] < start:
+            _, user_id, col = heapq.heappop(heap)
+            counts = self.totals[user_id]
+            counts[col] -= 1
+            if not any(counts):
+                del self.totals[user_id]
+            self.version += 1
+
+    def top(self, limit: int) -> list:
+        if self.cached and self.cached[0] == self.version and self.cached[1] >= limit:
+            return self.cached[2][:limit]
+        rows = heapq.nlargest(
+            limit,
+            (
+                (uid, *counts, sum(c * w for c, w in zip(counts, _WEIGHTS)))
+                for uid, counts in self.totals.items()
+            ),
+            key=lambda r: r[6],
+        )
+        self.cached = (self.version, limit, rows)
+        return rows
+
+
+class LiveScoreboard:
+    """
+    today / daily / weekly のランキングをメモリ上で保持するスコアボード。
+    utils.db の record_event・mark_reaction_scored・apply_reaction_scores から逐次加算され、
+    起動時と定期的に events から作り直して SQL とのずれを解消する。
+    加算は書き込みのコミット後に events の行IDつきで行い、作り直しの途中に来た分は
+    行IDで SQL の結果と突き合わせてから反映する（取りこぼし・二重計上をしない）。
+    """
+
+    def __init__(self, windows: dict = None):
+        self.windows = dict(windows or WINDOWS)
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        # rebuild() 前は None（呼び出し側は SQL にフォールバックする）
+        self._state = None
+        # rebuild() の途中に来た加算 [(event_id, ts, user_id, col)]。作り直していない間は None
+        self._pending = None
+
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    def _new_state(self) -> dict:
+        return {key: _Window(fn) for key, fn in self.windows.items()}
+
+    def add(
+        self,
+        user_id: str,
+        event_type: str,
+        ts_epoch: float = None,
+        event_id: int = None,
+    ):
+        """
+        スコア対象のイベント 1 件を加算する。events へのコミット後に呼ぶこと
+        （reaction は加点済みのものだけ渡す）。event_id は events の行ID。
+        """
+        col = _COLUMNS.get(event_type)
+        if col is None or user_id is None:
+            return
+        # Slack の ts は文字列で渡されることがあるので数値にそろえる
+        ts = float(ts_epoch) if ts_epoch is not None else time.time()
+        now = time.time()
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((event_id, ts, user_id, col))
+            if self._state is None:
+                return
+            for w in self._state.values():
+                w.add(ts, user_id, col, now)
+
+    def top(self, key: str, limit: int = 5):
+        """
+        期間 key の上位 limit 件を fetch_user_counts と同じ形式で返す。
+        未構築・未知の期間なら None。
+        """
+        now = time.time()
+        with self._lock:
+            if self._state is None or key not in self._state:
+                return None
+            w = self._state[key]
+            w.evict(now)
+            return w.top(limit)
+
+    def rebuild(self, conn) -> dict:
+        """
+        events から全期間を作り直す。戻り値は期間ごとの作り直し前とのずれ（ユーザー数）。
+        """
+        with self._rebuild_lock:
+            return self._rebuild(conn)
+
+    def _rebuild(self, conn) -> dict:
+        # SELECT より前から加算を控えておき、SELECT に含まれなかった行だけを後で足す
+        with self._lock:
+            self._pending = []
+        try:
+            now = time.time()
+            since = min(fn(now) for fn in self.windows.values())
+            rows = conn.execute(
+                """
+                SELECT id, ts_epoch, user_id, type FROM events
+                WHERE ts_epoch >= ?
+                  AND type IN ('post', 'answer', 'positive_feedback', 'violation', 'reaction')
+                  AND (type != 'reaction' OR scored = 1)
+                """,
+                (since,),
+            ).fetchall()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        state = self._new_state()
+        seen = set()
+        for event_id, ts, user_id, event_type in rows:
+            seen.add(event_id)
+            col = _COLUMNS[event_type]
+            for w in state.values():
+                w.add(ts, user_id, col, now)
+
+        drift = {}
+        with self._lock:
+            now = time.time()
+            for event_id, ts, user_id, col in self._pending:
+                if event_id is None or event_id not in seen:
+                    for w in state.values():
+                        w.add(ts, user_id, col, now)
+            self._pending = None
+            old = self._state
+            self._state = state
+        if old is not None:
+            for key, w in state.items():
+                prev = old[key]
+                prev.evict(now)
+                users = set(w.totals) | set(prev.totals)
+                drift[key] = sum(
+                    1 for u in users if w.totals.get(u) != prev.totals.get(u)
+                )
+            if any(drift.values()):
+                logger.warning(f"Live scoreboard drift corrected: {drift}")
+        logger.info(f"Live scoreboard rebuilt from {len(rows)} events")
+        return drift
@@ -0,0 +1,106 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    複数スレッドから同時に来た判定依頼を、最大 max_wait 秒・max_batch 件までまとめて
+    batch_fn(items) -> results に 1 回で渡し、結果を各呼び出し元の Future に振り分ける。
+
+    バッチを組むのは 1 本のスレッドで、組んだバッチは dispatchers 本のスレッドから送る
+    （前のバッチの LLM 応答を待っている間も次のバッチを集められる）。
+
+    :param batch_fn: 入力リストを受け取り、同じ順・同じ長さの結果リストを返す関数
+    :param max_batch: 1 バッチの最大件数
+    :param max_wait: 最初の 1 件が来てから送るまでの最大待ち時間（秒）
+    :param dispatchers: バッチを送るスレッド数（同時に待てる LLM 呼び出し数）
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[list], list],
+        max_batch: int = 8,
+        max_wait: float = 0.05,
+        dispatchers: int = 4,
+        name: str = "llm-batch",
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self._q: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {
+            "items": 0,
+            "batches": 0,
+            "max_batch_size": 0,
+            "total_wait": 0.0,
+            "errors": 0,
+        }
+        self._senders = ThreadPoolExecutor(
+            max_workers=max(1, dispatchers), thread_name_prefix=name
+        )
+        threading.Thread(
+            target=self._run, name=f"{name}-collector", daemon=True
+        ).start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._q.put((item, future, time.perf_counter()))
+        return future
+
+    def _collect(self) -> list:
+        batch = [self._q.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            sent = time.perf_counter()
+            with self._lock:
+                s = self._stats
+                s["items"] += len(batch)
+                s["batches"] += 1
+                s["max_batch_size"] = max(s["max_batch_size"], len(batch))
+                s["total_wait"] += sum(sent - queued for _, _, queued in batch)
+            self._senders.submit(self._send, batch)
+
+    def _send(self, batch: list):
+        try:
+            results = self.batch_fn([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"batch_fn returned {len(results)} results for {len(batch)} items"
+                )
+        except Exception as e:
+            logger.exception(f"Batch of {len(batch)} failed")
+            with self._lock:
+                self._stats["errors"] += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        """まとめた件数・バッチ数・平均/最大バッチサイズ・まとめるための平均待ち時間"""
+        with self._lock:
+            s = dict(self._stats)
+        s["avg_batch_size"] = s["items"] / s["batches"] if s["batches"] else 0.0
+        s["avg_wait"] = s.pop("total_wait") / s["items"] if s["items"] else 0.0
+        s["queue_depth"] = self._q.qsize()
+        return s
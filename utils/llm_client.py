@@ -0,0 +1,242 @@
+"""
+OpenAI API 呼び出しの共通ラッパー（classifier / llm_judge / llm_helpers から使う）。
+
+- 1 回の呼び出しに締め切り（OPENAI_DEADLINE 秒）を設け、各試行は OPENAI_TIMEOUT 秒で打ち切る
+- 429・5xx・タイムアウト・接続エラーはジッター付き指数バックオフで再試行する
+- 再試行しても失敗する呼び出しが続いたらサーキットブレーカーを開き、OPENAI_BREAKER_COOLDOWN 秒の間は
+  API を呼ばずに LLMUnavailable を送出する（呼び出し側はキーワード・文字数などの従来判定に切り替える）
+- レイテンシ・失敗数を stats() で返し、呼び出しごとの記録は utils/llm_usage.py で llm_calls に残す
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+
+import openai
+
+from . import llm_usage
+
+logger = logging.getLogger(__name__)
+
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "20"))
+OPENAI_DEADLINE = float(os.getenv("OPENAI_DEADLINE", "45"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "8"))
+# 連続してこの回数失敗したらブレーカーを開く
+OPENAI_BREAKER_THRESHOLD = int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5"))
+OPENAI_BREAKER_COOLDOWN = float(os.getenv("OPENAI_BREAKER_COOLDOWN", "30"))
+
+
+class LLMUnavailable(Exception):
+    """ブレーカーが開いている、または再試行しても API 呼び出しが成功しなかった"""
+
+
+def _failure_kind(e: Exception) -> str | None:
+    """再試行すべきエラーなら種別名、そうでなければ None（400・認証エラーなど）"""
+    if isinstance(e, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(e, openai.APIConnectionError):
+        return "connection"
+    if isinstance(e, openai.RateLimitError):
+        return "rate_limit"
+    if isinstance(e, openai.APIStatusError) and e.status_code >= 500:
+        return "server"
+    return None
+
+
+def _retry_after(e: Exception) -> float | None:
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    closed → (連続 threshold 回失敗) → open → (cooldown 経過) → half-open で 1 回だけ試す
+    → 成功なら closed、失敗なら再び open。
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return "open"
+            return "half-open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record(self, ok: bool):
+        with self._lock:
+            probing, self._probing = self._probing, False
+            if ok:
+                if self._opened_at is not None:
+                    logger.info("OpenAI circuit breaker closed")
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if probing or (
+                self._opened_at is None and self._failures >= self.threshold
+            ):
+                self._opened_at = time.monotonic()
+                self.opens += 1
+                logger.warning(
+                    f"OpenAI circuit breaker opened after {self._failures} failures; "
+                    f"using fallbacks for {self.cooldown:.0f}s"
+                )
+
+
+breaker = CircuitBreaker(OPENAI_BREAKER_THRESHOLD, OPENAI_BREAKER_COOLDOWN)
+
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    "calls": 0,
+    "succeeded": 0,
+    "failed": 0,
+    "short_circuited": 0,
+    "retries": 0,
+    "timeout": 0,
+    "connection": 0,
+    "rate_limit": 0,
+    "server": 0,
+    "total_latency": 0.0,
+    "max_latency": 0.0,
+}
+
+
+def _get_client() -> openai.OpenAI:
+    """
+    共有クライアント（接続プールを使い回す）。SDK 側の再試行はここで行うので無効にする。
+    openai.api_key / openai.base_url が変わったら作り直す。
+    """
+    global _client, _client_key
+    key = (openai.api_key, str(openai.base_url or ""))
+    with _client_lock:
+        if _client is None or _client_key != key:
+            _client = openai.OpenAI(
+                api_key=openai.api_key, base_url=openai.base_url, max_retries=0
+            )
+            _client_key = key
+        return _client
+
+
+def _call(fn_name: str, create, deadline: float | None, **kwargs):
+    func = llm_usage.caller_name()
+    model = kwargs.get("model")
+    with _stats_lock:
+        _stats["calls"] += 1
+    if not breaker.allow():
+        with _stats_lock:
+            _stats["short_circuited"] += 1
+        llm_usage.record(func, model, None, 0.0, 0, "short_circuit")
+        raise LLMUnavailable(f"OpenAI circuit breaker is {breaker.state}")
+
+    started = time.monotonic()
+    give_up_at = started + (OPENAI_DEADLINE if deadline is None else deadline)
+    attempt = 0
+    while True:
+        remaining = give_up_at - time.monotonic()
+        try:
+            resp = create(**kwargs, timeout=max(0.1, min(OPENAI_TIMEOUT, remaining)))
+        except Exception as e:
+            kind = _failure_kind(e)
+            if kind is None:
+                # 入力や設定の誤りは再試行しても同じなので、ブレーカーには数えずそのまま送出
+                breaker.record(ok=True)
+                _finish(func, model, None, started, attempt + 1, "error")
+                raise
+            with _stats_lock:
+                _stats[kind] += 1
+            delay = _retry_after(e)
+            if delay is None:
+                delay = random.uniform(
+                    0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2**attempt)
+                )
+            attempt += 1
+            if attempt > OPENAI_MAX_RETRIES or time.monotonic() + delay >= give_up_at:
+                breaker.record(ok=False)
+                _finish(func, model, None, started, attempt, "unavailable")
+                raise LLMUnavailable(
+                    f"{fn_name} failed after {attempt} attempts: {e}"
+                ) from e
+            logger.warning(
+                f"{fn_name} {kind} error, retrying in {delay:.1f}s "
+                f"({attempt}/{OPENAI_MAX_RETRIES}): {e}"
+            )
+            with _stats_lock:
+                _stats["retries"] += 1
+            time.sleep(delay)
+            continue
+        breaker.record(ok=True)
+        _finish(func, model, resp, started, attempt + 1, "ok")
+        return resp
+
+
+def _finish(func, model, resp, started: float, attempts: int, outcome: str):
+    latency = time.monotonic() - started
+    with _stats_lock:
+        _stats["succeeded" if outcome == "ok" else "failed"] += 1
+        _stats["total_latency"] += latency
+        _stats["max_latency"] = max(_stats["max_latency"], latency)
+    llm_usage.record(func, model, resp, latency, attempts, outcome)
+
+
+def chat_create(deadline: float = None, **create_args):
+    """
+    chat.completions.create を締め切り・再試行・ブレーカー付きで呼ぶ。
+    失敗が続く・ブレーカーが開いているときは LLMUnavailable。
+    deadline: 再試行を含めた締め切り（秒）。省略時は OPENAI_DEADLINE
+    """
+    return _call(
+        "chat.completions.create",
+        _get_client().chat.completions.create,
+        deadline,
+        **create_args,
+    )
+
+
+def embeddings_create(deadline: float = None, **create_args):
+    """embeddings.create を chat_create と同じ扱いで呼ぶ"""
+    return _call(
+        "embeddings.create", _get_client().embeddings.create, deadline, **create_args
+    )
+
+
+def stats() -> dict:
+    """呼び出し数・成功/失敗数・ブレーカーで省いた数・エラー種別ごとの数・平均/最大レイテンシ"""
+    with _stats_lock:
+        s = dict(_stats)
+    done = s["succeeded"] + s["failed"]
+    s["avg_latency"] = s.pop("total_latency") / done if done else 0.0
+    s["failure_rate"] = (
+        (s["failed"] + s["short_circuited"]) / s["calls"] if s["calls"] else 0.0
+    )
+    s["breaker"] = breaker.state
+    s["breaker_opens"] = breaker.opens
+    return s
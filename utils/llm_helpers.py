@@ -12,6 +12,7 @@ logger = logging.getLogger(__name__)
 from dotenv import load_dotenv
 import openai
 from utils.db import fetch_thread_replies, fetch_post_text
+from utils import llm_client
 import requests
 from bs4 import BeautifulSoup
 import json
@@ -64,7 +65,7 @@ def embed_texts(texts: list[str]) -> list[list[float]]:
     Given a list of strings, returns their embeddings as a list of vectors.
     """
     logger.info(f"[LLM: {MODEL}] embed_texts for {len(texts)} texts")
-    resp = openai.embeddings.create(model=EMBED_MODEL, input=texts)
+    resp = llm_client.embeddings_create(model=EMBED_MODEL, input=texts)
     # New API returns a CreateEmbeddingResponse with .data list
     embeddings = [d.embedding for d in resp.data]
     return embeddings
@@ -95,7 +96,7 @@ def llm_summarize_cluster(texts: list[str]) -> str:
 
     try:
         logger.info(f"[LLM: {MODEL}] llm_summarize_cluster req: {len(texts)} texts")
-        resp = openai.chat.completions.create(**create_args)
+        resp = llm_client.chat_create(**create_args)
         # Log token usage if available
         usage = getattr(resp, "usage", None)
         if usage:
@@ -130,7 +131,7 @@ def llm_extract_topic(texts: list[str]) -> str:
     create_args = {"model": MODEL, "messages": messages}
     try:
         logger.info(f"[LLM: {MODEL}] llm_extract_topic req: {len(texts)} texts")
-        resp = openai.chat.completions.create(**create_args)
+        resp = llm_client.chat_create(**create_args)
         usage = getattr(resp, "usage", None)
         if usage:
             logger.info(
@@ -168,7 +169,7 @@ def llm_is_info_request(texts: list[str]) -> bool:
         {"role": "user", "content": prompt},
     ]
     try:
-        resp = openai.chat.completions.create(model=MODEL, messages=messages)
+        resp = llm_client.chat_create(model=MODEL, messages=messages)
         usage = getattr(resp, "usage", None)
         if usage:
             logger.info(
@@ -206,7 +207,7 @@ def llm_extract_info_request(texts: list[str]) -> str:
         {"role": "user", "content": prompt},
     ]
     try:
-        resp = openai.chat.completions.create(model=MODEL, messages=messages)
+        resp = llm_client.chat_create(model=MODEL, messages=messages)
         usage = getattr(resp, "usage", None)
         if usage:
             logger.info(
@@ -271,7 +272,7 @@ def rag_answer(
     create_args = {"model": MODEL, "messages": messages}
     # Call the LLM
     try:
-        resp_llm = openai.chat.completions.create(**create_args)
+        resp_llm = llm_client.chat_create(**create_args)
         usage = getattr(resp_llm, "usage", None)
         if usage:
             logger.info(
@@ -328,7 +329,7 @@ def thread_answer(post_ids: list[int], db) -> tuple[str, None]:
         logging.info(
             f"[LLM: {MODEL}] thread_answer req with {len(all_replies)} replies"
         )
-        resp = openai.chat.completions.create(**create_args)
+        resp = llm_client.chat_create(**create_args)
         # Log token usage if available
         usage = getattr(resp, "usage", None)
         if usage:
@@ -1,12 +1,14 @@
 import os
 import openai
 from utils.db import (
+    flush_writes,
     get_unjudged_reactions,
     cache_positive_reaction,
     get_unscored_positive_reactions,
     apply_reaction_scores,
 )
 from utils.slack_helpers import resolve_user
+from utils import llm_client
 import logging
 from dotenv import load_dotenv
 
@@ -47,7 +49,7 @@ def judge_positive_reaction(reaction_name: str) -> bool:
 
     try:
         logger.info(f"[LLM: {MODEL}] judge_positive_reaction req: ':{reaction_name}:'")
-        resp = openai.chat.completions.create(**create_args)
+        resp = llm_client.chat_create(**create_args)
         content = resp.choices[0].message.content.strip().lower()
         logger.info(
             f"[LLM: {MODEL}] judge_positive_reaction resp for ':{reaction_name}:': '{content}'"
@@ -62,6 +64,8 @@ def apply_all_positive_reactions():
     """
     キャッシュ内の未判定のリアクションをLLM判定し、ポジティブなら加点まで実施。
     """
+    # ハンドラから積まれた scored 更新を先に反映し、二重加点を防ぐ
+    flush_writes()
     unjudged = get_unjudged_reactions()
     logger.info(f"[LLM-batch: {MODEL}] unjudged reactions = {unjudged}")
     # まず LLM 判定とキャッシュ
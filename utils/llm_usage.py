@@ -0,0 +1,109 @@
+"""
+LLM 呼び出しの記録（llm_calls）と集計。
+
+utils/llm_client.py が呼び出しごとに record() し、/llm_stats コマンドと日次サマリーが
+summary() / format_summary() で呼び出し元ごとのトークン数・所要時間・失敗数を表示する。
+"""
+
+import os
+import sys
+import logging
+import sqlite3
+
+import numpy as np
+
+from .db import record_llm_call, fetch_llm_call_stats, purge_llm_calls
+
+logger = logging.getLogger(__name__)
+
+LLM_CALL_LOG = os.getenv("LLM_CALL_LOG", "1").lower() in ("1", "true", "yes")
+LLM_CALLS_RETENTION_DAYS = int(os.getenv("LLM_CALLS_RETENTION_DAYS", "90"))
+
+# 呼び出し元として記録しない薄いラッパー
+_WRAPPERS = {"_chat_create"}
+
+
+def caller_name() -> str:
+    """llm_client とラッパーを除いた直近の呼び出し元を 'モジュール.関数' で返す"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module not in (__name__, "utils.llm_client") and (
+            frame.f_code.co_name not in _WRAPPERS
+        ):
+            return f"{module.rsplit('.', 1)[-1]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+def record(func: str, model: str, resp, latency: float, attempts: int, outcome: str):
+    """1 呼び出し分を llm_calls に積む（書き込みは待たない）"""
+    if not LLM_CALL_LOG:
+        return
+    usage = getattr(resp, "usage", None)
+    try:
+        record_llm_call(
+            func,
+            model,
+            getattr(usage, "prompt_tokens", 0) or 0,
+            getattr(usage, "completion_tokens", 0) or 0,
+            latency,
+            attempts,
+            outcome,
+        )
+    except sqlite3.Error as e:
+        logger.warning(f"llm_calls record failed: {e}")
+
+
+def summary(since_ts: float, until_ts: float = None) -> dict:
+    """
+    期間内の呼び出しを呼び出し元ごとに集計する。
+    {"rows": [{func, model, calls, failed, tokens, share, avg_latency, p95_latency}, ...],
+     "calls", "failed", "prompt_tokens", "completion_tokens"}
+    """
+    rows = fetch_llm_call_stats(since_ts, until_ts)
+    total_tokens = sum(r["prompt_tokens"] + r["completion_tokens"] for r in rows)
+    for r in rows:
+        r["tokens"] = r["prompt_tokens"] + r["completion_tokens"]
+        r["share"] = r["tokens"] / total_tokens if total_tokens else 0.0
+        r["avg_latency"] = r.pop("total_latency") / r["calls"]
+        latencies = r.pop("latencies")
+        r["p95_latency"] = float(np.percentile(latencies, 95)) if latencies else 0.0
+    return {
+        "rows": rows,
+        "calls": sum(r["calls"] for r in rows),
+        "failed": sum(r["failed"] for r in rows),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in rows),
+        "completion_tokens": sum(r["completion_tokens"] for r in rows),
+    }
+
+
+def format_summary(s: dict, title: str) -> str:
+    """Slack 投稿用のテキスト（呼び出し元ごとの表はコードブロック）"""
+    if not s["calls"]:
+        return f"*{title}*\nLLM の呼び出しはありませんでした。"
+    lines = [
+        f"*{title}*",
+        f"呼び出し {s['calls']:,} 回（失敗 {s['failed']:,}） / "
+        f"トークン {s['prompt_tokens'] + s['completion_tokens']:,}"
+        f"（入力 {s['prompt_tokens']:,}・出力 {s['completion_tokens']:,}）",
+        "```",
+        f"{'func':<36} {'model':<14} {'calls':>6} {'fail':>5} {'tokens':>10} {'share':>6} {'avg':>6} {'p95':>6}",
+    ]
+    for r in s["rows"]:
+        lines.append(
+            f"{r['func'][:36]:<36} {(r['model'] or '-')[:14]:<14} {r['calls']:>6} {r['failed']:>5} "
+            f"{r['tokens']:>10,} {r['share']:>6.1%} {r['avg_latency']:>5.2f}s {r['p95_latency']:>5.2f}s"
+        )
+    lines.append("```")
+    return "\n".join(lines)
+
+
+def purge() -> int:
+    """保持期間（LLM_CALLS_RETENTION_DAYS）を過ぎた記録を削除する"""
+    deleted = purge_llm_calls(LLM_CALLS_RETENTION_DAYS)
+    if deleted:
+        logger.info(
+            f"Purged {deleted} llm_calls older than {LLM_CALLS_RETENTION_DAYS} days"
+        )
+    return deleted
@@ -0,0 +1,255 @@
+import time
+import queue
+import threading
+import logging
+from typing import Callable
+
+from .db import save_pending_message, finish_pending_message, fetch_pending_messages
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MessagePipeline:
+    """
+    message イベントの分類をリスナーから切り離すワーカープール。
+    リスナーは submit() で pending_messages に保存して有界キューに積むだけで戻り、
+    OpenAI・Slack API の呼び出しと events への記録は workers 本のワーカースレッドで行う。
+
+    キューが満杯のときはリスナーを待たせず、DB に残したまま後で sweep() が積み直す
+    （起動時の sweep() で前回処理しきれなかった分も拾う）。
+
+    :param handler: 1 イベントを処理する関数（例外を投げたら max_attempts まで再処理。
+        ただし handler が mark_committed() を呼んだ後の例外は、記録・通知の重複を避けるため再処理しない）
+    :param workers: ワーカースレッド数（0 ならリスナースレッドでそのまま処理）
+    :param max_queue: メモリ上のキューの上限
+    :param max_attempts: 失敗時に再処理する最大回数（超えたら 'failed' にして諦める）
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict], None],
+        workers: int = 4,
+        max_queue: int = 500,
+        max_attempts: int = 3,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._q: queue.Queue = queue.Queue(maxsize=max(1, max_queue))
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        # キュー内または処理中の (channel, event_ts)。sweep() で二重に積まないため
+        self._in_flight: set = set()
+        self._stats = {
+            "received": 0,
+            "duplicates": 0,
+            "overflowed": 0,
+            "swept": 0,
+            "processed": 0,
+            "failed": 0,
+            "not_retried": 0,
+            "max_depth": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+            "total_service": 0.0,
+        }
+        self._overflowing = False
+        # 処理中のイベントが mark_committed() 済みか（ワーカースレッドごと）
+        self._local = threading.local()
+
+    # ─── 起動・停止 ─────────────────────────────
+    def start(self):
+        with self._lock:
+            if self._threads or self.workers <= 0:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(
+                    target=self._run, name=f"message-worker-{i}", daemon=True
+                )
+                t.start()
+                self._threads.append(t)
+        logger.info(f"Message pipeline started with {self.workers} workers")
+
+    def stop(self, timeout: float = 10.0):
+        """
+        処理中のイベントを終えたらワーカーを止める。キューに残った分は DB に 'pending' のまま残り、
+        次回起動時の sweep() で処理される。
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            return
+        while True:
+            try:
+                self._q.get_nowait()
+            except queue.Empty:
+                break
+        for _ in threads:
+            self._q.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for t in threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+
+    # ─── 投入 ─────────────────────────────
+    def submit(self, channel: str, event_ts: str, event: dict) -> bool:
+        """
+        イベントを保存して処理キューに積む（リスナーから呼ぶ。分類の完了は待たない）。
+        再送などで既に受信済みなら False。
+        """
+        if not save_pending_message(channel, event_ts, event):
+            with self._lock:
+                self._stats["duplicates"] += 1
+            return False
+        with self._lock:
+            self._stats["received"] += 1
+        if self.workers <= 0:
+            self._process_inline(channel, event_ts, event)
+        else:
+            self._enqueue(channel, event_ts, event)
+        return True
+
+    def _process_inline(self, channel: str, event_ts: str, event: dict) -> bool:
+        key = (channel, event_ts)
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+        try:
+            self._process(channel, event_ts, event, time.perf_counter())
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+        return True
+
+    def _enqueue(self, channel: str, event_ts: str, event: dict) -> bool:
+        key = (channel, event_ts)
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+        try:
+            self._q.put_nowait((key, event, time.perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self._in_flight.discard(key)
+                self._stats["overflowed"] += 1
+                first = not self._overflowing
+                self._overflowing = True
+            if first:
+                logger.warning(
+                    f"Message queue full ({self._q.maxsize}); deferring to pending_messages"
+                )
+            return False
+        with self._lock:
+            depth = self._q.qsize()
+            if depth > self._stats["max_depth"]:
+                self._stats["max_depth"] = depth
+        return True
+
+    def sweep(self) -> int:
+        """
+        pending_messages に残っている未処理分を、キューの空きの分だけ積み直す。
+        起動時と定期ジョブから呼ぶ。積んだ件数を返す。
+        """
+        if self.workers <= 0:
+            # インラインモードでは取りこぼし分をここで順に処理する
+            return sum(
+                self._process_inline(channel, event_ts, event)
+                for channel, event_ts, event in fetch_pending_messages(limit=100)
+            )
+        room = self._q.maxsize - self._q.qsize()
+        if room <= 0:
+            return 0
+        with self._lock:
+            n_in_flight = len(self._in_flight)
+        queued = 0
+        for channel, event_ts, event in fetch_pending_messages(
+            limit=room + n_in_flight
+        ):
+            if self._enqueue(channel, event_ts, event):
+                queued += 1
+            if self._q.full():
+                break
+        with self._lock:
+            self._stats["swept"] += queued
+            if queued and self._overflowing and not self._q.full():
+                self._overflowing = False
+        if queued:
+            logger.info(f"Re-queued {queued} pending messages: {self.stats()}")
+        return queued
+
+    # ─── ワーカー ─────────────────────────────
+    def _run(self):
+        while True:
+            item = self._q.get()
+            if item is _STOP:
+                return
+            (channel, event_ts), event, enqueued_at = item
+            try:
+                self._process(channel, event_ts, event, enqueued_at)
+            finally:
+                with self._lock:
+                    self._in_flight.discard((channel, event_ts))
+
+    def mark_committed(self):
+        """
+        handler から呼ぶ。これ以降（events への記録・スコア加算・通知などの副作用）で失敗しても
+        再処理せず 'failed' にする（再処理すると記録や通知が重複するため）
+        """
+        self._local.committed = True
+
+    def _process(self, channel: str, event_ts: str, event: dict, enqueued_at: float):
+        started = time.perf_counter()
+        error = None
+        self._local.committed = False
+        try:
+            self.handler(event)
+        except Exception as e:
+            logger.exception(f"Message handler failed: channel={channel} ts={event_ts}")
+            error = f"{type(e).__name__}: {e}"
+        finished = time.perf_counter()
+        retry = not self._local.committed
+        if error and not retry:
+            logger.warning(
+                f"Not retrying message after side effects: channel={channel} ts={event_ts}"
+            )
+        try:
+            # 記録がコミットされてから in_flight から外す（sweep() が処理済みを積み直さないため）
+            finish_pending_message(
+                channel, event_ts, error, self.max_attempts if retry else 1
+            )
+        except Exception:
+            logger.exception(
+                f"Failed to record message status: channel={channel} ts={event_ts}"
+            )
+        with self._lock:
+            s = self._stats
+            s["failed" if error else "processed"] += 1
+            if error and not retry:
+                s["not_retried"] += 1
+            wait = started - enqueued_at
+            s["total_wait"] += wait
+            s["max_wait"] = max(s["max_wait"], wait)
+            s["total_service"] += finished - started
+
+    # ─── 統計 ─────────────────────────────
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def stats(self) -> dict:
+        """
+        バックプレッシャーの指標: キュー長・最大キュー長・処理中件数・溢れた件数・
+        キュー待ち時間（平均/最大）・1 件あたりの処理時間（平均）など。
+        """
+        with self._lock:
+            s = dict(self._stats)
+            s["in_flight"] = len(self._in_flight)
+        s["queue_depth"] = self.depth()
+        s["queue_capacity"] = self._q.maxsize
+        s["workers"] = self.workers
+        done = s["processed"] + s["failed"]
+        s["avg_wait"] = s.pop("total_wait") / done if done else 0.0
+        s["avg_service"] = s.pop("total_service") / done if done else 0.0
+        return s
@@ -0,0 +1,177 @@
+"""
+ガイドライン違反判定の前段フィルタ（TF-IDF + ロジスティック回帰）。
+
+明らかに問題のない投稿を LLM に送らずに済ませるための軽量モデル。違反リスクが
+しきい値未満の投稿は classify_text / analyze_message で違反なしとして扱う。
+学習・評価は train_prefilter.py で行い、成果物は PREFILTER_MODEL_PATH に保存する。
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+logger = logging.getLogger(__name__)
+
+PREFILTER_ENABLED = os.environ.get("PREFILTER", "0").lower() in ("1", "true", "yes")
+PREFILTER_MODEL_PATH = os.environ.get("PREFILTER_MODEL_PATH", "models/prefilter.joblib")
+# 未設定なら学習時に目標再現率から決めたしきい値を使う
+PREFILTER_THRESHOLD = os.environ.get("PREFILTER_THRESHOLD") or None
+
+
+def build_pipeline() -> Pipeline:
+    """
+    日本語を分かち書きせずに扱えるよう、文字 n-gram の TF-IDF を特徴量にする。
+    違反は少数なので class_weight="balanced" で重み付けする。
+    """
+    return Pipeline(
+        [
+            (
+                "tfidf",
+                TfidfVectorizer(
+                    analyzer="char_wb",
+                    ngram_range=(2, 4),
+                    min_df=2,
+                    max_features=200_000,
+                    sublinear_tf=True,
+                ),
+            ),
+            (
+                "clf",
+                LogisticRegression(class_weight="balanced", max_iter=1000, C=4.0),
+            ),
+        ]
+    )
+
+
+def load_dataset(conn) -> tuple[list[str], np.ndarray]:
+    """
+    slack_posts の本文と、同じ (ユーザー, ts) の violation イベントの有無からラベルを作る。
+    戻り値: (本文リスト, ラベル配列 1=違反)
+    """
+    rows = conn.execute(
+        """
+        SELECT p.text,
+               EXISTS (
+                   SELECT 1 FROM events AS e
+                   WHERE e.type = 'violation' AND e.ts_epoch = p.ts AND e.user_id = p.user
+               )
+        FROM slack_posts AS p
+        WHERE p.text != ''
+        """
+    ).fetchall()
+    return [r[0] for r in rows], np.array([r[1] for r in rows], dtype=np.int8)
+
+
+def make_scorer(pipeline: Pipeline):
+    """
+    学習済みパイプラインから 1 投稿の違反リスクを返す関数を作る。
+    TfidfVectorizer.transform は 1 件ずつ呼ぶと入力検証などで 1ms 近くかかるので、
+    語彙ごとの idf と係数を辞書にしておき、n-gram の数え上げと内積だけを Python で行う
+    （predict_proba と同じ値になる）。
+    """
+    vec = pipeline.named_steps["tfidf"]
+    clf = pipeline.named_steps["clf"]
+    analyzer = vec.build_analyzer()
+    idf, coef = vec.idf_, clf.coef_.ravel()
+    weights = {
+        term: (float(idf[i]), float(coef[i])) for term, i in vec.vocabulary_.items()
+    }
+    intercept = float(clf.intercept_[0])
+
+    def risk(text: str) -> float:
+        counts = {}
+        for gram in analyzer(text):
+            if gram in weights:
+                counts[gram] = counts.get(gram, 0) + 1
+        z = intercept
+        if counts:
+            dot = norm = 0.0
+            for gram, n in counts.items():
+                w_idf, w_coef = weights[gram]
+                v = (1.0 + math.log(n)) * w_idf  # sublinear_tf
+                dot += v * w_coef
+                norm += v * v
+            z += dot / math.sqrt(norm)
+        if z < -500:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(-z))
+
+    return risk
+
+
+class Prefilter:
+    """
+    学習済みモデルを遅延ロードして違反リスクを返す。モデルが無い・無効なら常に LLM に回す。
+    """
+
+    def __init__(self, path: str = PREFILTER_MODEL_PATH, enabled: bool = None):
+        self.path = path
+        self.enabled = PREFILTER_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._risk = None
+        self.threshold = None
+        self._stats = {"scored": 0, "forwarded": 0, "skipped": 0, "total_time": 0.0}
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.path):
+                logger.warning(f"Prefilter model not found: {self.path}; disabled")
+                self.enabled = False
+                return
+            artifact = joblib.load(self.path)
+            self._risk = make_scorer(artifact["pipeline"])
+            self.threshold = (
+                float(PREFILTER_THRESHOLD)
+                if PREFILTER_THRESHOLD is not None
+                else float(artifact["threshold"])
+            )
+            logger.info(
+                f"Prefilter loaded from {self.path} (trained {artifact.get('trained_at')}, "
+                f"threshold={self.threshold:.4f})"
+            )
+
+    def risk(self, text: str) -> float:
+        """違反リスク（0〜1 のロジスティック確率）"""
+        return self._risk(text)
+
+    def should_check(self, text: str) -> bool:
+        """LLM で違反判定すべきなら True（無効・未学習なら常に True）"""
+        if not self.enabled:
+            return True
+        if not self._loaded:
+            self._load()
+            if not self.enabled:
+                return True
+        started = time.perf_counter()
+        forward = self.risk(text) >= self.threshold
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            s = self._stats
+            s["scored"] += 1
+            s["forwarded" if forward else "skipped"] += 1
+            s["total_time"] += elapsed
+        return forward
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        s["avg_time"] = s.pop("total_time") / s["scored"] if s["scored"] else 0.0
+        s["skip_rate"] = s["skipped"] / s["scored"] if s["scored"] else 0.0
+        s["enabled"] = self.enabled
+        s["threshold"] = self.threshold
+        return s
+
+
+prefilter = Prefilter()
@@ -1,6 +1,8 @@
-import sqlite3
+import heapq
+from datetime import datetime, time as dt_time, timedelta
 from typing import Dict, List, Tuple
 from .constants import WEIGHTS
+from .db import get_conn
 
 
 def compute_score(counts: Dict[str, float]) -> float:
@@ -24,51 +26,203 @@ def compute_score(counts: Dict[str, float]) -> float:
     )
 
 
+def _split_whole_days(since: float, until: float) -> Tuple[str, str, float, float]:
+    """
+    [since, until) を「丸ごと含まれるローカル日 [first_day, end_day)」と、その前後の端数区間に分ける。
+    丸ごとの日が無ければ first_day == end_day（空範囲）で、端数区間は [since, until) 全体になる。
+
+    Returns: (first_day, end_day, day_start_ts, day_end_ts)
+      端数区間は [since, day_start_ts) と [day_end_ts, until)
+    """
+    first = datetime.fromtimestamp(since)
+    first_mid = datetime.combine(first.date(), dt_time.min)
+    if first_mid < first:
+        first_mid += timedelta(days=1)
+    end_mid = datetime.combine(datetime.fromtimestamp(until).date(), dt_time.min)
+    if first_mid >= end_mid:
+        return "", "", until, until
+    return (
+        first_mid.strftime("%Y-%m-%d"),
+        end_mid.strftime("%Y-%m-%d"),
+        first_mid.timestamp(),
+        end_mid.timestamp(),
+    )
+
+
+# 丸ごとの日は user_daily_counts から、前後の端数は events から数えて合算する
+USER_COUNTS_SQL = """
+    SELECT
+      user_id,
+      SUM(posts)       AS posts,
+      SUM(reactions)   AS reactions,
+      SUM(answers)     AS answers,
+      SUM(positive_fb) AS positive_fb,
+      SUM(violations)  AS violations,
+      (
+        SUM(posts) * ?
+      + SUM(reactions) * ?
+      + SUM(answers) * ?
+      + SUM(positive_fb) * ?
+      + SUM(violations) * ?
+      ) AS score
+    FROM (
+      SELECT user_id, posts, reactions_scored AS reactions, answers, positive_fb, violations
+      FROM user_daily_counts
+      WHERE day >= ? AND day < ?
+      UNION ALL
+      SELECT
+        user_id,
+        type='post',
+        type='reaction' AND scored=1,
+        type='answer',
+        type='positive_feedback',
+        type='violation'
+      FROM events
+      WHERE ts_epoch >= ? AND ts_epoch < ?
+      UNION ALL
+      SELECT
+        user_id,
+        type='post',
+        type='reaction' AND scored=1,
+        type='answer',
+        type='positive_feedback',
+        type='violation'
+      FROM events
+      WHERE ts_epoch >= ? AND ts_epoch < ?
+    )
+    GROUP BY user_id
+    ORDER BY score DESC
+    LIMIT ?
+"""
+
+
 def fetch_user_counts(
     db_path: str, since: float, until: float, limit: int = 5
 ) -> List[Tuple[str, int, int, int, int, int, float]]:
     """
-    SQLite の events テーブルから、指定期間のユーザーごとの各種カウントとスコアを取得する。
+    指定期間のユーザーごとの各種カウントとスコアを取得する。
+    期間に丸ごと含まれる日は日次ロールアップ user_daily_counts を、前後の端数だけ events を読む。
 
     Returns a list of tuples:
       (user_id, posts, reactions, answers, positive_fb, violations, score)
     """
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT
-          user_id,
-          SUM(CASE WHEN type='post'              THEN 1 ELSE 0 END)           AS posts,
-          SUM(CASE WHEN type='reaction' AND scored=1 THEN 1 ELSE 0 END)      AS reactions,
-          SUM(CASE WHEN type='answer'            THEN 1 ELSE 0 END)          AS answers,
-          SUM(CASE WHEN type='positive_feedback' THEN 1 ELSE 0 END)          AS positive_fb,
-          SUM(CASE WHEN type='violation'         THEN 1 ELSE 0 END)          AS violations,
-          (
-            SUM(CASE WHEN type='post'              THEN 1 ELSE 0 END) * ?
-          + SUM(CASE WHEN type='reaction' AND scored=1 THEN 1 ELSE 0 END) * ?
-          + SUM(CASE WHEN type='answer'            THEN 1 ELSE 0 END) * ?
-          + SUM(CASE WHEN type='positive_feedback' THEN 1 ELSE 0 END) * ?
-          + SUM(CASE WHEN type='violation'         THEN 1 ELSE 0 END) * ?
-          ) AS score
-        FROM events
-        WHERE ts_epoch >= ? AND ts_epoch < ?
-        GROUP BY user_id
-        ORDER BY score DESC
-        LIMIT ?
-    """,
+    first_day, end_day, day_start, day_end = _split_whole_days(since, until)
+    cur = get_conn(db_path).execute(
+        USER_COUNTS_SQL,
         (
             WEIGHTS["post"],
             WEIGHTS["reaction"],
             WEIGHTS["answer"],
             WEIGHTS["positive_feedback"],
             WEIGHTS["violation"],
+            first_day,
+            end_day,
             since,
+            day_start,
+            day_end,
             until,
             limit,
         ),
     )
     rows = cur.fetchall()
-    conn.close()
     # each row is (user_id, posts, reactions, answers, positive_fb, violations, score)
     return rows
+
+
+# ─── 複数期間の一括集計 ─────────────────────────────────
+_ROLLUP_ROWS_SQL = """
+    SELECT day, user_id, posts, reactions_scored, answers, positive_fb, violations
+    FROM user_daily_counts
+    WHERE day >= ? AND day < ?
+"""
+_EDGE_EVENTS_SQL = """
+    SELECT ts_epoch, user_id,
+           type='post', type='reaction' AND scored=1, type='answer',
+           type='positive_feedback', type='violation'
+    FROM events
+    WHERE ts_epoch >= ? AND ts_epoch < ?
+"""
+
+
+def _merge_intervals(intervals: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    merged = []
+    for start, end in sorted(iv for iv in intervals if iv[0] < iv[1]):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def fetch_leaderboards(
+    db_path: str, periods: List[Tuple[str, float, float]], limit: int = 5
+) -> Dict[str, List[Tuple[str, int, int, int, int, int, float]]]:
+    """
+    複数期間のランキングを 1 回の読み出しでまとめて集計する。
+    全期間の丸ごとの日を user_daily_counts から 1 回、端数区間の events を 1 回だけ読み、
+    各行を該当するすべての期間に振り分けてから期間ごとに上位 limit 件を返す。
+
+    :param periods: [(キー, since, until), ...]（キーの重複は ValueError）
+    :return: {キー: [(user_id, posts, reactions, answers, positive_fb, violations, score), ...]}
+      各期間の結果は fetch_user_counts(db_path, since, until, limit) と同じ
+    """
+    keys = [key for key, *_ in periods]
+    if len(set(keys)) != len(keys):
+        raise ValueError(f"fetch_leaderboards: duplicate period keys {keys}")
+    windows = []
+    for key, since, until in periods:
+        first_day, end_day, day_start, day_end = _split_whole_days(since, until)
+        windows.append(
+            (key, first_day, end_day, ((since, day_start), (day_end, until)))
+        )
+    totals = {key: {} for key, *_ in windows}
+
+    def add(key, user_id, counts):
+        acc = totals[key].get(user_id)
+        if acc is None:
+            totals[key][user_id] = list(counts)
+        else:
+            for i, c in enumerate(counts):
+                acc[i] += c
+
+    conn = get_conn(db_path)
+    day_ranges = [(w[1], w[2]) for w in windows if w[1] < w[2]]
+    if day_ranges:
+        lo = min(r[0] for r in day_ranges)
+        hi = max(r[1] for r in day_ranges)
+        for day, user_id, *counts in conn.execute(_ROLLUP_ROWS_SQL, (lo, hi)):
+            for key, first_day, end_day, _ in windows:
+                if first_day <= day < end_day:
+                    add(key, user_id, counts)
+
+    edges = _merge_intervals([iv for w in windows for iv in w[3]])
+    for start, end in edges:
+        for ts, user_id, *counts in conn.execute(_EDGE_EVENTS_SQL, (start, end)):
+            for key, _, _, intervals in windows:
+                if any(s <= ts < e for s, e in intervals):
+                    add(key, user_id, counts)
+
+    result = {}
+    for key, users in totals.items():
+        rows = []
+        for user_id, (
+            posts,
+            reactions,
+            answers,
+            positive_fb,
+            violations,
+        ) in users.items():
+            score = compute_score(
+                {
+                    "posts": posts,
+                    "reactions": reactions,
+                    "answers": answers,
+                    "positive_fb": positive_fb,
+                    "violations": violations,
+                }
+            )
+            rows.append(
+                (user_id, posts, reactions, answers, positive_fb, violations, score)
+            )
+        result[key] = heapq.nlargest(limit, rows, key=lambda r: r[6])
+    return result
@@ -0,0 +1,326 @@
+"""
+Slack のユーザー名・チャンネル名のディレクトリ（resolve_user / resolve_channel の実体）。
+
+- 起動時に slack_users / slack_channels（SQLite）から読み込み、すぐに名前を引けるようにする（load）
+- 続けて users.list / conversations.list をページ送りで全件取得し、メモリと SQLite を入れ替える（warm）
+- user_change / team_join / channel_rename などのイベントで 1 件ずつ更新する（update_user / update_channel）
+- メモリ上のエントリは SLACK_DIRECTORY_TTL_SEC 秒で期限切れになり、evict() で捨てる。
+  未登録・期限切れの ID だけ users.info / conversations.info で 1 件ずつ引く
+- prefetch() で渡した ID はバックグラウンドのスレッドで引いておく。同じ ID の依頼や、
+  引いている最中の同じ ID の参照は 1 回の問い合わせにまとめる
+"""
+
+import os
+import time
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+from slack_sdk.errors import SlackApiError
+
+from .db import upsert_slack_users, upsert_slack_channels, fetch_slack_directory
+
+logger = logging.getLogger(__name__)
+
+SLACK_DIRECTORY_TTL_SEC = float(os.getenv("SLACK_DIRECTORY_TTL_SEC", "172800"))
+# 取得に失敗した ID（削除済みユーザー・権限のないチャンネルなど）を再問い合わせしない時間
+_NEGATIVE_TTL_SEC = 300
+# users.list / conversations.list が 429 を返したときの最大再試行回数
+_MAX_RATE_LIMIT_RETRIES = 5
+
+
+def user_display_name(user: dict) -> str:
+    """display_name → real_name → name の順で最初に空でないもの（なければ user_id）"""
+    profile = user.get("profile") or {}
+    return (
+        profile.get("display_name")
+        or profile.get("real_name")
+        or user.get("name")
+        or user["id"]
+    )
+
+
+class SlackDirectory:
+    """
+    ユーザー・チャンネルの ID → 名前の対応表。
+    :param client: slack_sdk の WebClient
+    :param ttl: メモリ上のエントリの有効期間（秒）
+    """
+
+    def __init__(self, client, ttl: float = SLACK_DIRECTORY_TTL_SEC):
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # id -> (name, expires_at)
+        self._users: dict[str, tuple[str, float]] = {}
+        self._channels: dict[str, tuple[str, float]] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "api_lookups": 0,
+            "api_errors": 0,
+            "events": 0,
+            "evicted": 0,
+            "prefetched": 0,
+            "coalesced": 0,
+        }
+        # バックグラウンドで引いている (kind, id) -> 名前が入る Future
+        self._pending: dict[tuple[str, str], Future] = {}
+        self._queue: queue.Queue = queue.Queue()
+        self._resolver: threading.Thread | None = None
+
+    # ─── 参照 ─────────────────────────────
+    def _get(self, table: dict, key: str):
+        entry = table.get(key)
+        ok = entry is not None and entry[1] > time.time()
+        with self._lock:
+            self._stats["hits" if ok else "misses"] += 1
+        return entry[0] if ok else None
+
+    def _put(self, table: dict, key: str, name: str, expires_at: float):
+        with self._lock:
+            table[key] = (name, expires_at)
+
+    def _wait_pending(self, kind: str, key: str):
+        """同じ ID をバックグラウンドで引いている最中なら、その結果を待って返す"""
+        with self._lock:
+            future = self._pending.get((kind, key))
+            if future is not None:
+                self._stats["coalesced"] += 1
+        return future.result() if future is not None else None
+
+    def user_name(self, user_id: str) -> str:
+        """user_id の表示名。取得できなければ user_id をそのまま返す"""
+        name = self._get(self._users, user_id)
+        if name is None:
+            name = self._wait_pending("user", user_id)
+        return name if name is not None else self._fetch_user(user_id)
+
+    def channel_name(self, channel_id: str) -> str:
+        """channel_id のチャンネル名（# なし）。取得できなければ channel_id をそのまま返す"""
+        name = self._get(self._channels, channel_id)
+        if name is None:
+            name = self._wait_pending("channel", channel_id)
+        return name if name is not None else self._fetch_channel(channel_id)
+
+    def user_names(self, user_ids) -> dict[str, str]:
+        """複数の user_id をまとめて引く（重複は 1 回、未登録分はバックグラウンドの取得を待つ）"""
+        user_ids = list(dict.fromkeys(u for u in user_ids if u))
+        self.prefetch(user_ids=user_ids)
+        return {uid: self.user_name(uid) for uid in user_ids}
+
+    def _fetch_user(self, user_id: str) -> str:
+        try:
+            with self._lock:
+                self._stats["api_lookups"] += 1
+            return self.update_user(self.client.users_info(user=user_id)["user"])
+        except SlackApiError:
+            with self._lock:
+                self._stats["api_errors"] += 1
+            self._put(self._users, user_id, user_id, time.time() + _NEGATIVE_TTL_SEC)
+            return user_id
+
+    def _fetch_channel(self, channel_id: str) -> str:
+        try:
+            with self._lock:
+                self._stats["api_lookups"] += 1
+            res = self.client.conversations_info(channel=channel_id)
+            return self.update_channel(res["channel"])
+        except SlackApiError:
+            with self._lock:
+                self._stats["api_errors"] += 1
+            self._put(
+                self._channels, channel_id, channel_id, time.time() + _NEGATIVE_TTL_SEC
+            )
+            return channel_id
+
+    # ─── 先読み ─────────────────────────────
+    def prefetch(self, user_ids=(), channel_ids=()):
+        """
+        未登録・期限切れの ID をバックグラウンドで引いておく（呼び出し側は待たない）。
+        既に取得待ちの ID は積み直さない。
+        """
+        now = time.time()
+        items = [("user", u) for u in user_ids if u]
+        items += [("channel", c) for c in channel_ids if c]
+        with self._lock:
+            for item in items:
+                kind, key = item
+                entry = (self._users if kind == "user" else self._channels).get(key)
+                if item in self._pending or (entry is not None and entry[1] > now):
+                    continue
+                self._pending[item] = Future()
+                self._queue.put(item)
+                self._stats["prefetched"] += 1
+            if self._resolver is None and self._pending:
+                self._resolver = threading.Thread(
+                    target=self._resolve_loop, name="slack-directory", daemon=True
+                )
+                self._resolver.start()
+
+    def _resolve_loop(self):
+        while True:
+            kind, key = self._queue.get()
+            name = key
+            try:
+                if kind == "user":
+                    name = self._fetch_user(key)
+                else:
+                    name = self._fetch_channel(key)
+            except Exception:
+                logger.exception(f"Slack directory lookup failed: {kind}={key}")
+            finally:
+                with self._lock:
+                    future = self._pending.pop((kind, key))
+                future.set_result(name)
+
+    # ─── 更新 ─────────────────────────────
+    def update_user(self, user: dict) -> str:
+        """users.info / user_change / team_join の user オブジェクトで 1 件更新する"""
+        name = user_display_name(user)
+        now = time.time()
+        self._put(self._users, user["id"], name, now + self.ttl)
+        upsert_slack_users(
+            [
+                (
+                    user["id"],
+                    name,
+                    int(bool(user.get("is_bot"))),
+                    int(bool(user.get("deleted"))),
+                    now,
+                )
+            ]
+        )
+        return name
+
+    def update_channel(self, channel: dict) -> str:
+        """conversations.info / channel_rename / channel_created の channel オブジェクトで 1 件更新する"""
+        name = channel.get("name") or channel["id"]
+        now = time.time()
+        self._put(self._channels, channel["id"], name, now + self.ttl)
+        upsert_slack_channels(
+            [(channel["id"], name, int(bool(channel.get("is_archived"))), now)]
+        )
+        return name
+
+    def on_event(self, event: dict):
+        """ディレクトリに関わる Slack イベントを反映する"""
+        with self._lock:
+            self._stats["events"] += 1
+        if "user" in event and isinstance(event["user"], dict):
+            self.update_user(event["user"])
+        elif "channel" in event and isinstance(event["channel"], dict):
+            self.update_channel(event["channel"])
+
+    # ─── 一括読み込み ─────────────────────────────
+    def load(self) -> tuple[int, int]:
+        """SQLite に保存済みの有効期限内のエントリをメモリに読み込む（再起動直後用）"""
+        users, channels = fetch_slack_directory()
+        now = time.time()
+        with self._lock:
+            for uid, name, updated_at in users:
+                if updated_at + self.ttl > now:
+                    self._users[uid] = (name, updated_at + self.ttl)
+            for cid, name, updated_at in channels:
+                if updated_at + self.ttl > now:
+                    self._channels[cid] = (name, updated_at + self.ttl)
+            n_users, n_channels = len(self._users), len(self._channels)
+        logger.info(
+            f"Slack directory loaded from DB: {n_users} users, {n_channels} channels"
+        )
+        return n_users, n_channels
+
+    def _paginate(self, method, key: str, **kwargs):
+        """cursor でページ送りしながら res[key] の要素を返す（429 は Retry-After だけ待って再試行）"""
+        cursor = None
+        while True:
+            for attempt in range(_MAX_RATE_LIMIT_RETRIES + 1):
+                try:
+                    res = method(cursor=cursor, **kwargs)
+                    break
+                except SlackApiError as e:
+                    if (
+                        e.response.status_code != 429
+                        or attempt == _MAX_RATE_LIMIT_RETRIES
+                    ):
+                        raise
+                    time.sleep(float(e.response.headers.get("Retry-After", 1)))
+            yield from res.get(key) or []
+            cursor = (res.get("response_metadata") or {}).get("next_cursor")
+            if not cursor:
+                return
+
+    def warm(self) -> tuple[int, int]:
+        """
+        users.list / conversations.list で全件を取り直し、メモリと SQLite を更新する。
+        起動時と日次ジョブから呼ぶ。失敗しても既存のエントリはそのまま使う。
+        """
+        started = time.time()
+        try:
+            users = list(self._paginate(self.client.users_list, "members", limit=200))
+            channels = list(
+                self._paginate(
+                    self.client.conversations_list,
+                    "channels",
+                    types="public_channel,private_channel",
+                    exclude_archived=False,
+                    limit=1000,
+                )
+            )
+        except SlackApiError as e:
+            logger.warning(f"Slack directory warm-up failed: {e}")
+            return 0, 0
+        now = time.time()
+        user_rows = [
+            (
+                u["id"],
+                user_display_name(u),
+                int(bool(u.get("is_bot"))),
+                int(bool(u.get("deleted"))),
+                now,
+            )
+            for u in users
+        ]
+        channel_rows = [
+            (c["id"], c.get("name") or c["id"], int(bool(c.get("is_archived"))), now)
+            for c in channels
+        ]
+        if user_rows:
+            upsert_slack_users(user_rows)
+        if channel_rows:
+            upsert_slack_channels(channel_rows)
+        with self._lock:
+            for uid, name, *_ in user_rows:
+                self._users[uid] = (name, now + self.ttl)
+            for cid, name, *_ in channel_rows:
+                self._channels[cid] = (name, now + self.ttl)
+        logger.info(
+            f"Slack directory warmed: {len(user_rows)} users, {len(channel_rows)} channels "
+            f"in {time.time() - started:.1f}s"
+        )
+        return len(user_rows), len(channel_rows)
+
+    def evict(self) -> int:
+        """期限切れのエントリをメモリから捨てる（SQLite には残る）。捨てた件数を返す"""
+        now = time.time()
+        evicted = 0
+        with self._lock:
+            for table in (self._users, self._channels):
+                expired = [k for k, (_, exp) in table.items() if exp <= now]
+                for k in expired:
+                    del table[k]
+                evicted += len(expired)
+            self._stats["evicted"] += evicted
+        return evicted
+
+    def stats(self) -> dict:
+        """件数・ヒット率・API での個別取得数・先読みの待ち件数など"""
+        with self._lock:
+            s = dict(self._stats)
+            s["users"] = len(self._users)
+            s["channels"] = len(self._channels)
+            s["pending"] = len(self._pending)
+        lookups = s["hits"] + s["misses"]
+        s["hit_rate"] = s["hits"] / lookups if lookups else 0.0
+        return s
@@ -1,14 +1,209 @@
 import os
 import re
+import json
+import time
+import logging
+import threading
+from concurrent.futures import Future
+
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
+from .slack_directory import SlackDirectory
+
+logger = logging.getLogger(__name__)
+
+# Slack Web API のベース URL（負荷試験ではスタブサーバーに向ける）
+SLACK_API_URL = os.getenv("SLACK_API_URL", WebClient.BASE_URL)
+# レート上限の倍率（0 で無効。スタブ相手の負荷試験などで使う）
+SLACK_RATE_LIMIT_SCALE = float(os.getenv("SLACK_RATE_LIMIT_SCALE", "1"))
+
+# メソッドごとの毎分の呼び出し上限（Tier 2=20, Tier 3=50, Tier 4=100。
+# chat.postMessage はチャンネルあたり毎秒 1 なので全体で毎分 60 に抑える）
+SLACK_RATE_LIMITS = {
+    "users.list": 20,
+    "conversations.list": 20,
+    "conversations.history": 50,
+    "conversations.replies": 50,
+    "conversations.info": 50,
+    "files.getUploadURLExternal": 20,
+    "files.completeUploadExternal": 20,
+    "users.info": 100,
+    "chat.getPermalink": 100,
+    "chat.postMessage": 60,
+}
+_DEFAULT_RATE_LIMIT = 50
+# 上限まで使い切っていないときに続けて投げてよい回数（毎分の上限の 1/6 = 10 秒分）
+_BURST_DIVISOR = 6
+
+# 同じ引数なら結果を共有してよい参照系メソッド（single-flight の対象）
+COALESCED_METHODS = frozenset(
+    {"users.info", "conversations.info", "conversations.replies", "chat.getPermalink"}
+)
+
+
+class TokenBucket:
+    """毎秒 rate 回・最大 capacity 回まで続けて取れるトークンバケット"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """トークンを 1 つ予約し、足りなければ順番が来るまで待つ。待った秒数を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float):
+        """429 の Retry-After の間は誰にも渡さない"""
+        with self._lock:
+            self._tokens = min(self._tokens, 1 - seconds * self.rate)
+            self._updated = time.monotonic()
+
+
+class SlackRateLimiter:
+    """全 WebClient で共有する、API メソッドごとのトークンバケット"""
+
+    def __init__(self, limits: dict = None, scale: float = SLACK_RATE_LIMIT_SCALE):
+        self.limits = SLACK_RATE_LIMITS if limits is None else limits
+        self.scale = scale
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "throttled": 0, "wait_sec": 0.0, "rate_limited": 0}
+
+    def _bucket(self, method: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(method)
+            if bucket is None:
+                per_min = self.limits.get(method, _DEFAULT_RATE_LIMIT) * self.scale
+                bucket = TokenBucket(per_min / 60, max(1.0, per_min / _BURST_DIVISOR))
+                self._buckets[method] = bucket
+            return bucket
+
+    def acquire(self, method: str):
+        if self.scale <= 0:
+            return
+        wait = self._bucket(method).acquire()
+        with self._lock:
+            self._stats["calls"] += 1
+            if wait:
+                self._stats["throttled"] += 1
+                self._stats["wait_sec"] += wait
+
+    def rate_limited(self, method: str, retry_after: float):
+        with self._lock:
+            self._stats["rate_limited"] += 1
+        if self.scale > 0:
+            self._bucket(method).pause(retry_after)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+class SingleFlight:
+    """同じキーの呼び出しが重なったら 1 回だけ実行し、後から来た側はその結果（例外も）を待つ"""
+
+    def __init__(self):
+        self._calls: dict = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "shared": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self._stats["calls"] += 1
+            else:
+                self._stats["shared"] += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+rate_limiter = SlackRateLimiter()
+single_flight = SingleFlight()
+
+
+class RateLimitedWebClient(WebClient):
+    """
+    呼び出しのたびに共有の rate_limiter でトークンを取る WebClient。
+    COALESCED_METHODS は同じ引数の呼び出しが重なったら 1 回の API 呼び出しにまとめる
+    """
+
+    def api_call(self, api_method: str, **kwargs):
+        if api_method not in COALESCED_METHODS:
+            return self._limited_call(api_method, kwargs)
+        key = (
+            self.token,
+            self.base_url,
+            api_method,
+            json.dumps(
+                [kwargs.get(k) for k in ("params", "data", "json")],
+                sort_keys=True,
+                default=str,
+            ),
+        )
+        return single_flight.do(key, lambda: self._limited_call(api_method, kwargs))
+
+    def _limited_call(self, api_method: str, kwargs: dict):
+        rate_limiter.acquire(api_method)
+        try:
+            return super().api_call(api_method, **kwargs)
+        except SlackApiError as e:
+            if e.response is not None and e.response.status_code == 429:
+                retry_after = float(e.response.headers.get("Retry-After", 1))
+                logger.warning(f"Slack API rate limited: {api_method} ({retry_after}s)")
+                rate_limiter.rate_limited(api_method, retry_after)
+            raise
+
+
+def new_web_client(token: str = None) -> WebClient:
+    """SLACK_API_URL に向けた、レート制限付きの WebClient を作る（token 省略時は SLACK_BOT_TOKEN）"""
+    return RateLimitedWebClient(
+        token=token or os.getenv("SLACK_BOT_TOKEN"), base_url=SLACK_API_URL
+    )
+
+
+def slack_api_stats() -> dict:
+    """レート制限で待った回数・秒数と、single-flight でまとめた呼び出し数"""
+    return {"rate_limit": rate_limiter.stats(), "single_flight": single_flight.stats()}
+
+
+_MENTION_RE = re.compile(r"<@([UW][A-Z0-9]+)>")
+
 # Slack Web API クライアントの初期化
-slack_client = WebClient(token=os.getenv("SLACK_BOT_TOKEN"))
+slack_client = new_web_client()
 
-# キャッシュ用辞書
-USER_CACHE = {}
-CHANNEL_CACHE = {}
+# ユーザー名・チャンネル名のディレクトリ（SQLite に永続化、起動時に一括取得）
+directory = SlackDirectory(slack_client)
 
 
 def resolve_user(user_id: str) -> str:
@@ -17,20 +212,15 @@ def resolve_user(user_id: str) -> str:
     display_name → real_name → user.name の順で取得し、
     失敗時は user_id をそのまま返す。
     """
-    if user_id in USER_CACHE:
-        return USER_CACHE[user_id]
-    try:
-        res = slack_client.users_info(user=user_id)
-        profile = res["user"]["profile"]
-        name = (
-            profile.get("display_name")
-            or profile.get("real_name")
-            or res["user"]["name"]
-        )
-    except SlackApiError:
-        name = user_id
-    USER_CACHE[user_id] = name
-    return name
+    return directory.user_name(user_id)
+
+
+def resolve_users(user_ids) -> dict[str, str]:
+    """
+    複数の user_id をまとめて表示名に変換（{user_id: 表示名}）。
+    同じ ID は 1 回だけ引き、未登録分はバックグラウンドで並べて取得したものを待つ。
+    """
+    return directory.user_names(user_ids)
 
 
 def resolve_channel(channel_id: str) -> str:
@@ -38,26 +228,19 @@ def resolve_channel(channel_id: str) -> str:
     Slack channel_id をチャンネル名（#xxx）に変換。
     失敗時は channel_id をそのまま返す。
     """
-    if channel_id in CHANNEL_CACHE:
-        return CHANNEL_CACHE[channel_id]
-    try:
-        res = slack_client.conversations_info(channel=channel_id)
-        name = res["channel"]["name"]
-    except SlackApiError:
-        name = channel_id
-    CHANNEL_CACHE[channel_id] = name
-    return name
+    return directory.channel_name(channel_id)
+
+
+def mention_ids(text: str) -> list[str]:
+    """テキスト中の <@UXXXXXXX> の user_id を出現順に返す"""
+    return _MENTION_RE.findall(text or "")
 
 
 def humanize_mentions(text: str) -> str:
     """
     テキスト中の <@UXXXXXXX> を @display_name に置換。
-    複数メンションにも対応。
+    複数メンションにも対応（resolve_users でまとめて引く）。
+    通知・表示用で、分類には元のテキストを使う。
     """
-
-    def repl(match):
-        uid = match.group(1)
-        uname = resolve_user(uid)
-        return f"@{uname}"
-
-    return re.sub(r"<@([UW][A-Z0-9]+)>", repl, text)
+    names = resolve_users(mention_ids(text))
+    return _MENTION_RE.sub(lambda m: f"@{names[m.group(1)]}", text)
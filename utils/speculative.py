@@ -0,0 +1,144 @@
+"""
+メッセージ判定チェーンの投機実行。
+
+process_message の判定は「違反 → ポジティブFB → 回答」の順で、先の判定が決着したら後ろは不要になる。
+投機モードでは全判定を同時に投げ、順番どおりに結果を見て最初に決着した判定を採用する。
+後ろの判定は未開始なら取り消し、実行中なら結果を捨てる（そのトークンを余分なコストとして集計する）。
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple
+
+from .classifier import track_usage
+
+logger = logging.getLogger(__name__)
+
+# 投機実行用スレッド数（メッセージワーカー数 × 判定数 程度）
+LLM_SPECULATIVE_WORKERS = int(os.getenv("LLM_SPECULATIVE_WORKERS", "12"))
+
+
+class Check(NamedTuple):
+    """判定 1 つ。decides(result) が真ならそこで決着し、後ろの判定は使わない"""
+
+    name: str
+    fn: Callable[[], object]
+    decides: Callable[[object], bool]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    "messages": 0,
+    "calls": 0,
+    "wasted_calls": 0,
+    "cancelled": 0,
+    "prompt_tokens": 0,
+    "completion_tokens": 0,
+    "wasted_prompt_tokens": 0,
+    "wasted_completion_tokens": 0,
+    "total_latency": 0.0,
+}
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=LLM_SPECULATIVE_WORKERS, thread_name_prefix="llm-spec"
+            )
+        return _pool
+
+
+def _measured(fn):
+    with track_usage() as usage:
+        result = fn()
+    return result, usage
+
+
+def _add_usage(usage: dict, wasted: bool):
+    with _stats_lock:
+        _stats["calls"] += usage["calls"]
+        _stats["prompt_tokens"] += usage["prompt_tokens"]
+        _stats["completion_tokens"] += usage["completion_tokens"]
+        if wasted:
+            _stats["wasted_calls"] += usage["calls"]
+            _stats["wasted_prompt_tokens"] += usage["prompt_tokens"]
+            _stats["wasted_completion_tokens"] += usage["completion_tokens"]
+
+
+def _count_discarded(future):
+    """捨てた判定が終わったら、その分のトークンを無駄として数える"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    _, usage = future.result()
+    _add_usage(usage, wasted=True)
+    if usage["calls"]:
+        logger.info(
+            f"speculative check discarded: +{usage['prompt_tokens']}/{usage['completion_tokens']} tokens (prompt/completion)"
+        )
+
+
+def run_chain(checks: list[Check], speculative: bool = False) -> dict:
+    """
+    判定を順に評価し、{判定名: 結果} を返す（最初に決着した判定まで）。
+    speculative=True なら全判定を同時に実行して待ち時間を最も遅い 1 判定程度に縮める。
+    判定で例外が出た場合は、逐次実行と同じくその判定の位置で呼び出し元に送出する。
+    """
+    started = time.perf_counter()
+    results = {}
+    if not speculative:
+        for check in checks:
+            result, usage = _measured(check.fn)
+            _add_usage(usage, wasted=False)
+            results[check.name] = result
+            if check.decides(result):
+                break
+    else:
+        pool = _get_pool()
+        futures = [pool.submit(_measured, check.fn) for check in checks]
+        decided_at = len(checks)
+        try:
+            for i, (check, future) in enumerate(zip(checks, futures)):
+                result, usage = future.result()
+                _add_usage(usage, wasted=False)
+                results[check.name] = result
+                if check.decides(result):
+                    decided_at = i
+                    break
+        finally:
+            for future in futures[len(results) :]:
+                if future.cancel():
+                    with _stats_lock:
+                        _stats["cancelled"] += 1
+                else:
+                    future.add_done_callback(_count_discarded)
+        if decided_at < len(checks) - 1:
+            logger.info(
+                f"speculative chain decided at '{checks[decided_at].name}', "
+                f"discarding {[c.name for c in checks[decided_at + 1:]]}"
+            )
+    with _stats_lock:
+        _stats["messages"] += 1
+        _stats["total_latency"] += time.perf_counter() - started
+    return results
+
+
+def stats() -> dict:
+    """
+    判定チェーンの集計: メッセージ数、LLM 呼び出し数・トークン数と、そのうち投機実行で
+    捨てた分（wasted_*）、取り消せた判定数、1 メッセージあたりの平均待ち時間。
+    """
+    with _stats_lock:
+        s = dict(_stats)
+    s["avg_latency"] = s.pop("total_latency") / s["messages"] if s["messages"] else 0.0
+    total = s["prompt_tokens"] + s["completion_tokens"]
+    wasted = s["wasted_prompt_tokens"] + s["wasted_completion_tokens"]
+    # 投機実行で増えたトークンの割合（逐次実行なら 0）
+    s["extra_token_ratio"] = wasted / (total - wasted) if total > wasted else 0.0
+    return s
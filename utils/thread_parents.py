@@ -0,0 +1,103 @@
+"""
+スレッド親投稿（作者・本文）のキャッシュ。質問チャンネルのスレッド返信の回答判定で使う。
+
+- メモリ上の LRU（THREAD_PARENT_CACHE_SIZE 件まで）→ slack_posts → conversations.replies の順に引く
+- API で取得した親投稿は slack_posts にも書き込み、夜間のパイプラインと共有する
+- 親投稿が編集されたら invalidate() で捨て、次の参照で取り直す
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+from slack_sdk.errors import SlackApiError
+
+from .db import fetch_slack_post, upsert_slack_post
+
+logger = logging.getLogger(__name__)
+
+THREAD_PARENT_CACHE_SIZE = int(os.getenv("THREAD_PARENT_CACHE_SIZE", "1000"))
+
+
+class ThreadParentCache:
+    """
+    (channel, thread_ts) → {"user": ..., "text": ...} の LRU。
+    :param client: slack_sdk の WebClient（slack_posts にないときだけ使う）
+    :param maxsize: メモリに置く親投稿の最大件数
+    """
+
+    def __init__(self, client, maxsize: int = THREAD_PARENT_CACHE_SIZE):
+        self.client = client
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._parents: OrderedDict[tuple[str, float], dict] = OrderedDict()
+        self._stats = {
+            "hits": 0,
+            "db_hits": 0,
+            "api_fetches": 0,
+            "api_errors": 0,
+            "invalidated": 0,
+        }
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _put(self, key: tuple[str, float], parent: dict):
+        with self._lock:
+            self._parents[key] = parent
+            self._parents.move_to_end(key)
+            while len(self._parents) > self.maxsize:
+                self._parents.popitem(last=False)
+
+    def get(self, channel: str, thread_ts) -> dict:
+        """スレッド親の {"user", "text"}。取得できなければ {}"""
+        key = (channel, float(thread_ts))
+        with self._lock:
+            parent = self._parents.get(key)
+            if parent is not None:
+                self._parents.move_to_end(key)
+                self._stats["hits"] += 1
+                return parent
+
+        row = fetch_slack_post(channel, thread_ts)
+        if row is not None:
+            self._count("db_hits")
+            parent = {"user": row[0], "text": row[1]}
+            self._put(key, parent)
+            return parent
+
+        try:
+            self._count("api_fetches")
+            messages = self.client.conversations_replies(
+                channel=channel, ts=thread_ts, limit=1
+            )["messages"]
+        except SlackApiError as e:
+            self._count("api_errors")
+            logger.warning(f"failed to fetch thread parent {channel}/{thread_ts}: {e}")
+            return {}
+        if not messages:
+            return {}
+        parent = {"user": messages[0].get("user"), "text": messages[0].get("text", "")}
+        self._put(key, parent)
+        if parent["user"] and not messages[0].get("bot_id"):
+            upsert_slack_post(thread_ts, channel, parent["user"], parent["text"])
+        return parent
+
+    def invalidate(self, channel: str, ts) -> bool:
+        """(channel, ts) の投稿が編集・削除されたらキャッシュから捨てる。捨てたら True"""
+        with self._lock:
+            dropped = self._parents.pop((channel, float(ts)), None) is not None
+            if dropped:
+                self._stats["invalidated"] += 1
+        return dropped
+
+    def stats(self) -> dict:
+        """メモリ・slack_posts・API それぞれで引けた件数など"""
+        with self._lock:
+            s = dict(self._stats)
+            s["size"] = len(self._parents)
+        lookups = s["hits"] + s["db_hits"] + s["api_fetches"]
+        s["hit_rate"] = (s["hits"] + s["db_hits"]) / lookups if lookups else 0.0
+        return s
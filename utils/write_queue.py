@@ -0,0 +1,249 @@
+import time
+import queue
+import sqlite3
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# 書き込み操作の種類
+OP_INSERT = "insert"  # 1 行 INSERT。Future には lastrowid が入る
+OP_EXEC = "exec"  # 任意の 1 文。パラメータに Future（INSERT の行ID）を渡せる
+OP_SCORE = "score"  # user_scores への加算。バッチ内でユーザーごとにまとめて適用
+
+_SCORE_COLUMNS = (
+    "post_count",
+    "reaction_count",
+    "answer_count",
+    "positive_feedback_count",
+    "violation_count",
+)
+
+
+class _Op:
+    __slots__ = ("kind", "sql", "params", "future", "enqueued_at")
+
+    def __init__(self, kind, sql, params):
+        self.kind = kind
+        self.sql = sql
+        self.params = params
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class _Flush:
+    __slots__ = ("done",)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class WriteQueue:
+    """
+    Write-behind キュー。ハンドラスレッドは操作を積むだけで、単一のライタースレッドが
+    max_batch 件 / max_latency 秒ごとに 1 トランザクションでまとめてコミットする（group commit）。
+
+    :param conn_factory: ライタースレッド上で呼ばれ、SQLite 接続を返す関数
+    :param score_sql: user_scores 加算用 UPSERT 文（user_id + 5 カラム分の加算値）
+    :param max_batch: 1 トランザクションに含める最大操作数
+    :param max_latency: 最初の操作を受け取ってからコミットまで待つ最大秒数
+    """
+
+    def __init__(
+        self,
+        conn_factory: Callable[[], sqlite3.Connection],
+        score_sql: str,
+        max_batch: int = 256,
+        max_latency: float = 0.02,
+    ):
+        self._conn_factory = conn_factory
+        self._score_sql = score_sql
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._q: queue.Queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "committed": 0,
+            "failed": 0,
+            "batches": 0,
+            "max_batch": 0,
+            "total_latency": 0.0,
+            "max_latency": 0.0,
+        }
+
+    # ─── 投入 ─────────────────────────────
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="db-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _submit(self, op: _Op) -> Future:
+        self._ensure_started()
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+        self._q.put(op)
+        return op.future
+
+    def insert(self, sql: str, params: tuple) -> Future:
+        """INSERT を積む。Future の結果は行ID。"""
+        return self._submit(_Op(OP_INSERT, sql, params))
+
+    def execute(self, sql: str, params: tuple = ()) -> Future:
+        """任意の更新文を積む。params 内の Future は実行時に行IDへ解決される。"""
+        return self._submit(_Op(OP_EXEC, sql, params))
+
+    def add_score(self, user_id: str, deltas: tuple) -> Future:
+        """user_scores への加算 (post, reaction, answer, positive_fb, violation) を積む。"""
+        return self._submit(_Op(OP_SCORE, None, (user_id, deltas)))
+
+    def flush(self, timeout: float = None) -> bool:
+        """それまでに積まれた操作がすべてコミットされるまで待つ。"""
+        if self._thread is None:
+            return True
+        marker = _Flush()
+        self._q.put(marker)
+        return marker.done.wait(timeout)
+
+    def stop(self, timeout: float = 10.0):
+        """残りを書き出してライタースレッドを止める（プロセス終了時）。"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._q.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["queue_depth"] = self.depth()
+        done = s["committed"] + s["failed"]
+        s["avg_latency"] = s.pop("total_latency") / done if done else 0.0
+        s["avg_batch"] = s["committed"] / s["batches"] if s["batches"] else 0.0
+        return s
+
+    # ─── ライタースレッド ─────────────────────────────
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._q.get()
+            batch, markers = [], []
+            deadline = time.monotonic() + self.max_latency
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, _Flush):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.max_batch:
+                    break
+                # まず溜まっている分を待たずに取り、空なら締め切りまで待つ
+                try:
+                    item = self._q.get_nowait()
+                    continue
+                except queue.Empty:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or markers:
+                    break
+                try:
+                    item = self._q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._commit(batch)
+            for m in markers:
+                m.done.set()
+
+    def _commit(self, batch: list):
+        try:
+            conn = self._conn_factory()
+            with conn:
+                results = self._apply(conn, batch)
+        except Exception as e:
+            # まとめてのコミットに失敗したら 1 件ずつやり直し、失敗を該当操作に閉じ込める
+            logger.error(
+                f"DB write batch of {len(batch)} failed, retrying one by one: {e}"
+            )
+            self._commit_one_by_one(batch)
+            return
+        self._resolve(batch, results)
+
+    def _commit_one_by_one(self, batch: list):
+        for op in batch:
+            try:
+                conn = self._conn_factory()
+                with conn:
+                    results = self._apply(conn, [op])
+                self._resolve([op], results)
+            except Exception as e:
+                logger.error(f"DB write failed: kind={op.kind} sql={op.sql}: {e}")
+                op.future.set_exception(e)
+                self._record([op], failed=True)
+
+    def _apply(self, conn: sqlite3.Connection, batch: list) -> dict:
+        """バッチ内の操作を順に実行し、{Future: 結果} を返す（コミットは呼び出し側）。"""
+        results = {}
+        score_deltas: dict[str, list] = {}
+        for op in batch:
+            if op.kind == OP_SCORE:
+                user_id, deltas = op.params
+                acc = score_deltas.setdefault(user_id, [0] * len(_SCORE_COLUMNS))
+                for i, d in enumerate(deltas):
+                    acc[i] += d
+                results[op.future] = None
+                continue
+            params = tuple(self._resolve_param(p, results) for p in op.params)
+            cur = conn.execute(op.sql, params)
+            results[op.future] = cur.lastrowid if op.kind == OP_INSERT else cur.rowcount
+        if score_deltas:
+            conn.executemany(
+                self._score_sql,
+                [(uid, *deltas) for uid, deltas in score_deltas.items()],
+            )
+        return results
+
+    @staticmethod
+    def _resolve_param(p, results: dict):
+        if not isinstance(p, Future):
+            return p
+        # 同じバッチで先に INSERT された行なら、まだ Future は未確定なので仮の行IDを使う
+        if p in results:
+            return results[p]
+        return p.result()
+
+    def _resolve(self, batch: list, results: dict):
+        self._record(batch, failed=False)
+        for op in batch:
+            op.future.set_result(results.get(op.future))
+
+    def _record(self, ops: list, failed: bool):
+        now = time.perf_counter()
+        with self._stats_lock:
+            s = self._stats
+            if failed:
+                s["failed"] += len(ops)
+            else:
+                s["committed"] += len(ops)
+                s["batches"] += 1
+                s["max_batch"] = max(s["max_batch"], len(ops))
+            for op in ops:
+                lat = now - op.enqueued_at
+                s["total_latency"] += lat
+                s["max_latency"] = max(s["max_latency"], lat)
@@ -12,25 +12,27 @@ from dotenv import load_dotenv
 load_dotenv()  # カレントディレクトリの .env を読み込む
 import os
 import glob
-import sqlite3
-from collections import Counter, defaultdict
+import time
+from collections import Counter
 import datetime
 import zoneinfo
-from datetime import datetime, timedelta, timezone, date
-import japanize_matplotlib
-import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
+from dataclasses import dataclass
+from datetime import datetime, timedelta, date
+import numpy as np
 import requests
 import subprocess
 import boto3
 from botocore.exceptions import ClientError
+from utils.db import get_conn
+from utils.charts import ChartSpec, render, render_all, save_png
 
 # --- Configuration ---
 # All environment variables loaded here as module-level constants
 DB_PATH = os.getenv("SCORES_DB_PATH", "scores.db")
 NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 NOTION_PAGE_ID = os.getenv("NOTION_VIOLATION_PAGE_ID")
+# Notion API のベース URL（負荷試験ではスタブサーバーに向ける）
+NOTION_API_URL = os.getenv("NOTION_API_URL", "https://api.notion.com")
 # REMOTE_USER     = os.getenv("REMOTE_USER")
 # REMOTE_HOST     = os.getenv("REMOTE_HOST")
 # REMOTE_PATH     = os.getenv("REMOTE_PATH")
@@ -65,33 +67,117 @@ PERIOD_LABELS = {
 #    logger.info(f"Uploaded '{file_path}' to {REMOTE_HOST}:{REMOTE_PATH}")
 
 
+# Asia/Tokyo は夏時間がないので、固定オフセットで日付・曜日・時刻を求める
+JST = zoneinfo.ZoneInfo("Asia/Tokyo")
+_JST_OFFSET = 9 * 3600
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# 1970-01-01 は木曜（weekday=3）
+_EPOCH_WEEKDAY = 3
+
+
+@dataclass
+class PeriodViolations:
+    """1 期間分の集計結果"""
+
+    counts: Counter  # {rule: 件数}
+    time_series: dict  # {date_str: Counter({rule: 件数})}（違反のあった日のみ）
+    heatmap: np.ndarray  # 7x24（曜日 0=月曜 × 時 0-23）の件数
+
+
+class ViolationStats:
+    """
+    violation 行を 1 回のクエリで読み込み、JST の日・曜日・時刻をまとめて計算しておく。
+    period(since_ts) でルール別件数・日別推移・曜日×時間帯ヒートマップを同時に返すので、
+    週間・月間・全期間を同じ読み込み結果から集計できる。
+    """
+
+    def __init__(self, ts_epoch, rule_strs):
+        # ts_epoch が NULL の行は NaN（ルール別件数の全期間集計にだけ含める）
+        self.ts = np.asarray(ts_epoch, dtype=float).reshape(-1)
+        self.valid = ~np.isnan(self.ts)
+        local = np.where(self.valid, self.ts, 0.0) + _JST_OFFSET
+        self.day = np.floor_divide(local, 86400).astype(np.int64)
+        self.weekday = (self.day + _EPOCH_WEEKDAY) % 7
+        self.hour = (np.mod(local, 86400) // 3600).astype(np.int64)
+
+        # violation_rule は "1,3" のようなカンマ区切り。異なる文字列ごとに 1 回だけ分解し、
+        # 文字列 × ルールの件数行列にしておく
+        uniq, self.inv = np.unique(
+            np.asarray(rule_strs, dtype=str).reshape(-1), return_inverse=True
+        )
+        parsed = [[r.strip() for r in s.split(",") if r.strip()] for s in uniq.tolist()]
+        self.rules = sorted({r for rs in parsed for r in rs})
+        col = {r: i for i, r in enumerate(self.rules)}
+        self.rule_matrix = np.zeros((len(uniq), len(self.rules)), dtype=np.int64)
+        for i, rs in enumerate(parsed):
+            for r in rs:
+                self.rule_matrix[i, col[r]] += 1
+
+    @classmethod
+    def load(cls, db_path: str, since_ts: float = None) -> "ViolationStats":
+        sql = """
+            SELECT ts_epoch, violation_rule
+            FROM events
+            WHERE type = 'violation'
+              AND violation_rule IS NOT NULL
+              AND violation_rule != ''
+        """
+        params = ()
+        if since_ts is not None:
+            sql += " AND ts_epoch >= ?"
+            params = (since_ts,)
+        rows = get_conn(db_path).execute(sql, params).fetchall()
+        return cls([r[0] for r in rows], [r[1] for r in rows])
+
+    def __len__(self):
+        return len(self.ts)
+
+    def period(self, since_ts: float = None) -> PeriodViolations:
+        """ts_epoch >= since_ts（None なら全期間）の集計"""
+        n_strs = self.rule_matrix.shape[0]
+        mask = np.ones(len(self.ts), dtype=bool)
+        if since_ts is not None:
+            mask = self.ts >= since_ts
+
+        per_str = np.bincount(self.inv[mask], minlength=n_strs)
+        counts = Counter(
+            {r: int(c) for r, c in zip(self.rules, per_str @ self.rule_matrix) if c}
+        )
+
+        timed = mask & self.valid
+        days = self.day[timed]
+        time_series = {}
+        if days.size:
+            first = days.min()
+            n_days = int(days.max() - first) + 1
+            # 日 × 文字列の件数 → 日 × ルールの件数
+            per_day = np.bincount(
+                (days - first) * n_strs + self.inv[timed],
+                minlength=n_days * n_strs,
+            ).reshape(n_days, n_strs)
+            per_day_rule = per_day @ self.rule_matrix
+            for i in np.flatnonzero(per_day_rule.any(axis=1)):
+                day = date.fromordinal(_EPOCH_ORDINAL + int(first) + int(i))
+                time_series[day.isoformat()] = Counter(
+                    {r: int(c) for r, c in zip(self.rules, per_day_rule[i]) if c}
+                )
+
+        heatmap = np.bincount(
+            self.weekday[timed] * 24 + self.hour[timed], minlength=7 * 24
+        ).reshape(7, 24)
+        return PeriodViolations(counts, time_series, heatmap)
+
+    def periods(self, thresholds: dict) -> dict:
+        """{期間キー: since_ts} → {期間キー: PeriodViolations}"""
+        return {key: self.period(since) for key, since in thresholds.items()}
+
+
 def fetch_violation_counts(db_path: str, since_ts: float = None) -> Counter:
     """
     events テーブルから violation_rule カラムを読み込み、
     since_ts が指定されていれば ts_epoch >= since_ts の分だけ集計。
     """
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    sql = """
-        SELECT violation_rule
-        FROM events
-        WHERE type = 'violation'
-          AND violation_rule IS NOT NULL
-          AND violation_rule != ''
-    """
-    params = ()
-    if since_ts is not None:
-        sql += " AND ts_epoch >= ?"
-        params = (since_ts,)
-    cur.execute(sql, params)
-    counter = Counter()
-    for (rule_str,) in cur.fetchall():
-        for r in rule_str.split(","):
-            r = r.strip()
-            if r:
-                counter[r] += 1
-    conn.close()
-    return counter
+    return ViolationStats.load(db_path, since_ts).period(since_ts).counts
 
 
 def fetch_time_series_counts(db_path: str, since_ts: float = None) -> dict:
@@ -99,34 +185,7 @@ def fetch_time_series_counts(db_path: str, since_ts: float = None) -> dict:
     日付ごと、ルールごとの違反件数を取得。
     戻り値は {date_str: {rule: count}} の辞書。
     """
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    sql = """
-        SELECT ts_epoch, violation_rule
-        FROM events
-        WHERE type = 'violation'
-          AND violation_rule IS NOT NULL
-          AND violation_rule != ''
-    """
-    params = ()
-    if since_ts is not None:
-        sql += " AND ts_epoch >= ?"
-        params = (since_ts,)
-    cur.execute(sql, params)
-    data = defaultdict(lambda: Counter())
-    for ts_epoch, rule_str in cur.fetchall():
-        dt = (
-            datetime.fromtimestamp(ts_epoch, tz=timezone.utc)
-            .astimezone(zoneinfo.ZoneInfo("Asia/Tokyo"))
-            .date()
-        )
-        date_str = dt.isoformat()
-        for r in rule_str.split(","):
-            r = r.strip()
-            if r:
-                data[date_str][r] += 1
-    conn.close()
-    return data
+    return ViolationStats.load(db_path, since_ts).period(since_ts).time_series
 
 
 def fetch_weekday_hour_heatmap(db_path: str, since_ts: float = None) -> dict:
@@ -134,33 +193,11 @@ def fetch_weekday_hour_heatmap(db_path: str, since_ts: float = None) -> dict:
     曜日・時間帯ごとの違反件数を取得。
     戻り値は {(weekday, hour): count} の辞書。weekdayは0=月曜、hourは0-23。
     """
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    sql = """
-        SELECT ts_epoch
-        FROM events
-        WHERE type = 'violation'
-          AND violation_rule IS NOT NULL
-          AND violation_rule != ''
-    """
-    params = ()
-    if since_ts is not None:
-        sql += " AND ts_epoch >= ?"
-        params = (since_ts,)
-    cur.execute(sql, params)
-    heatmap = defaultdict(int)
-    for (ts_epoch,) in cur.fetchall():
-        dt = datetime.fromtimestamp(ts_epoch, tz=timezone.utc).astimezone(
-            zoneinfo.ZoneInfo("Asia/Tokyo")
-        )
-        weekday = dt.weekday()
-        hour = dt.hour
-        heatmap[(weekday, hour)] += 1
-    conn.close()
-    return heatmap
+    grid = ViolationStats.load(db_path, since_ts).period(since_ts).heatmap
+    return {(int(w), int(h)): int(grid[w, h]) for w, h in zip(*np.nonzero(grid))}
 
 
-def plot_violation_rule_counts(counts: Counter, period_name: str, output_path: str):
+def violation_rule_counts_spec(counts: Counter, period_name: str) -> ChartSpec:
     # Ensure X-axis shows all possible rule numbers from guidelines
     all_guidelines = load_guidelines(GUIDELINES_PATH)
     # Extract numeric rule IDs from guideline lines (skip header)
@@ -171,29 +208,14 @@ def plot_violation_rule_counts(counts: Counter, period_name: str, output_path: s
         if num.isdigit():
             all_rules.append(num)
     rules = sorted(all_rules, key=lambda x: int(x))
-    rule_nums = [int(r) for r in rules]
     values = [counts.get(r, 0) for r in rules]
-
-    plt.figure(figsize=(10, 6))
-    plt.bar(rule_nums, values, color="red")
-    # only horizontal grid lines for histogram
-    plt.grid(axis="y")
-    plt.xlabel("ガイドライン規約違反となったルール番号", fontsize=16)
-    plt.ylabel("件数", fontsize=16)
-    plt.yticks(fontsize=16)
-    plt.title(
-        f"ガイドライン規約違反となったルール番号の傾向 ({period_name})", fontsize=24
-    )
-    plt.xticks(rule_nums, rules, fontsize=16)
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
-    logger.info(
-        f"[{period_name}] ルール別発生件数グラフを '{output_path}' に保存しました。"
+    return ChartSpec(
+        "violation_rule_counts",
+        {"rules": rules, "values": values, "period_name": period_name},
     )
 
 
-def plot_time_series(data: dict, period_name: str, output_path: str):
+def time_series_spec(data: dict, period_name: str) -> ChartSpec:
     # data: {date_str: {rule: count}}
     # x軸は日付、y軸は件数。ルールごとに折れ線
     all_rules = set()
@@ -201,7 +223,7 @@ def plot_time_series(data: dict, period_name: str, output_path: str):
         all_rules.update(counts.keys())
     all_rules = sorted(all_rules, key=lambda x: int(x))
     # Determine date span: daily up to yesterday
-    yesterday = datetime.now(zoneinfo.ZoneInfo("Asia/Tokyo")).date() - timedelta(days=1)
+    yesterday = datetime.now(JST).date() - timedelta(days=1)
     if period_name == PERIOD_LABELS["weekly"]:
         # 過去7日間を固定で表示（昨日を含む7日分）
         dates = [yesterday - timedelta(days=i) for i in reversed(range(7))]
@@ -220,111 +242,46 @@ def plot_time_series(data: dict, period_name: str, output_path: str):
             ]
         else:
             dates = []
-    plt.figure(figsize=(12, 6))
-    for rule in all_rules:
-        y = [data[d.isoformat()].get(rule, 0) for d in dates]
-        plt.plot(dates, y, marker="o", label=f"Rule {rule}")
-    plt.xlabel("日時", fontsize=16)
-    plt.ylabel("件数", fontsize=16)
-    plt.title(f"ガイドライン規約違反となったルールの推移 ({period_name})", fontsize=24)
-    plt.grid(axis="y")
-    ax = plt.gca()
-    ax.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d"))
-    # X軸の目盛り設定：全期間は自動調整、その他は日ごと
-    if period_name == PERIOD_LABELS["all"]:
-        ax.xaxis.set_major_locator(mdates.AutoDateLocator())
-    else:
-        ax.xaxis.set_major_locator(mdates.DayLocator(interval=1))
-    plt.xticks(rotation=45, fontsize=14)
-    plt.yticks(fontsize=16)
-    ax.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
-    # Place legend inside the plot at top center, allowing multiple columns
-    plt.legend(
-        loc="upper center",
-        bbox_to_anchor=(0.5, 0.9),
-        ncol=min(len(all_rules), 5),
-        fontsize=14,
+    lines = {
+        rule: [data.get(d.isoformat(), {}).get(rule, 0) for d in dates]
+        for rule in all_rules
+    }
+    return ChartSpec(
+        "violation_time_series",
+        {
+            "dates": dates,
+            "lines": lines,
+            "period_name": period_name,
+            "all_period": period_name == PERIOD_LABELS["all"],
+        },
     )
-    ax = plt.gca()
-    # Set x-axis limits to span exactly from first to last date (yesterday)
-    ax.set_xlim(dates[0], dates[-1])
-    # Remove padding around the x-axis
-    ax.margins(x=0)
-    # X軸の目盛り設定：全期間は日数に応じてダイナミックに
-    if period_name == PERIOD_LABELS["all"]:
-        days_count = (dates[-1] - dates[0]).days + 1
-        ax.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, days_count // 15)))
-    plt.tight_layout(pad=0.5)
-    plt.savefig(output_path)
-    plt.close()
-    logger.info(f"[{period_name}] 時系列グラフを '{output_path}' に保存しました。")
 
 
-def plot_heatmap(heatmap: dict, period_name: str, output_path: str):
-    # heatmap: {(weekday, hour): count}
-    import numpy as np
-
-    data = np.zeros((7, 24), dtype=int)
-    for (weekday, hour), count in heatmap.items():
-        data[weekday, hour] = count
-    plt.figure(figsize=(12, 8))
-    im = plt.imshow(data, aspect="auto", cmap="Reds")
-    # im = plt.imshow(data, aspect='auto', cmap='terrain')
-
-    # Set major ticks at the center of each cell
-    plt.xticks(
-        ticks=np.arange(24),
-        labels=[f"{h}:00" for h in range(0, 24)],
-        rotation=45,
-        fontsize=12,
-    )
-    plt.yticks(
-        ticks=np.arange(7),
-        labels=["月", "火", "水", "木", "金", "土", "日"],
-        fontsize=12,
-    )
-    # Set minor ticks at cell boundaries
-    plt.gca().set_xticks(np.arange(-0.5, 24, 1), minor=True)
-    plt.gca().set_yticks(np.arange(-0.5, 7, 1), minor=True)
-    # Draw gridlines for minor ticks (cell boundaries)
-    plt.grid(which="minor", color="gray", linestyle="-", linewidth=0.5)
-    # Remove default major grid
-    plt.grid(False, which="major")
-
-    # Annotate each cell with its count, centered
-    for y in range(data.shape[0]):
-        for x in range(data.shape[1]):
-            plt.text(
-                x,
-                y,
-                str(data[y, x]),
-                ha="center",
-                va="center",
-                color="black" if data[y, x] < data.max() / 2 else "white",
-                fontsize=10,
-            )
+def heatmap_spec(heatmap, period_name: str) -> ChartSpec:
+    # heatmap: 7x24 配列、または {(weekday, hour): count}
+    if isinstance(heatmap, np.ndarray):
+        grid = heatmap
+    else:
+        grid = np.zeros((7, 24), dtype=int)
+        for (weekday, hour), count in heatmap.items():
+            grid[weekday, hour] = count
+    return ChartSpec("violation_heatmap", {"grid": grid, "period_name": period_name})
 
-    import matplotlib.ticker as ticker
 
-    cbar = plt.colorbar(
-        im,
-        orientation="horizontal",
-        fraction=0.1,
-        pad=0.15,
-        aspect=40,
-        label="ガイドライン規約違反件数",
-    )
-    cbar.ax.tick_params(labelsize=14)
-    cbar.ax.xaxis.label.set_fontsize(14)
-    cbar.ax.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
-    plt.xlabel("時間帯", fontsize=16)
-    plt.ylabel("曜日", fontsize=16)
-    plt.title(
-        f"ガイドライン規約違反ヒートマップ (曜日vs時間帯) ({period_name})", fontsize=24
+def plot_violation_rule_counts(counts: Counter, period_name: str, output_path: str):
+    save_png(render(violation_rule_counts_spec(counts, period_name)), output_path)
+    logger.info(
+        f"[{period_name}] ルール別発生件数グラフを '{output_path}' に保存しました。"
     )
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
+
+
+def plot_time_series(data: dict, period_name: str, output_path: str):
+    save_png(render(time_series_spec(data, period_name)), output_path)
+    logger.info(f"[{period_name}] 時系列グラフを '{output_path}' に保存しました。")
+
+
+def plot_heatmap(heatmap: dict, period_name: str, output_path: str):
+    save_png(render(heatmap_spec(heatmap, period_name)), output_path)
     logger.info(f"[{period_name}] ヒートマップを '{output_path}' に保存しました。")
 
 
@@ -356,7 +313,7 @@ def append_image_block_to_notion(page_id: str, image_url: str, caption: str = No
     """
     指定のNotionページに画像ブロックを追加する。
     """
-    url = "https://api.notion.com/v1/blocks/" + page_id + "/children"
+    url = f"{NOTION_API_URL}/v1/blocks/" + page_id + "/children"
     data = {
         "children": [
             {
@@ -384,11 +341,11 @@ def clear_page_children(page_id: str):
     """
     Delete all existing child blocks under the given Notion page.
     """
-    url = f"https://api.notion.com/v1/blocks/{page_id}/children?page_size=100"
+    url = f"{NOTION_API_URL}/v1/blocks/{page_id}/children?page_size=100"
     res = requests.get(url, headers=HEADERS)
     res.raise_for_status()
     for child in res.json().get("results", []):
-        del_url = f"https://api.notion.com/v1/blocks/{child['id']}"
+        del_url = f"{NOTION_API_URL}/v1/blocks/{child['id']}"
         requests.delete(del_url, headers=HEADERS).raise_for_status()
 
 
@@ -445,7 +402,7 @@ def append_guidelines_to_notion(page_id: str, guidelines: list[str]):
         )
 
     # 2. Append new blocks
-    url = f"https://api.notion.com/v1/blocks/{page_id}/children"
+    url = f"{NOTION_API_URL}/v1/blocks/{page_id}/children"
     res = requests.patch(url, headers=HEADERS, json={"children": children})
     if res.status_code != 200:
         raise RuntimeError(
@@ -461,7 +418,7 @@ def append_update_timestamp(page_id: str):
     """
     now = datetime.now(zoneinfo.ZoneInfo("Asia/Tokyo"))
     ts_str = now.strftime("%Y-%m-%d %H:%M")
-    url = f"https://api.notion.com/v1/blocks/{page_id}/children"
+    url = f"{NOTION_API_URL}/v1/blocks/{page_id}/children"
     data = {
         "children": [
             {
@@ -528,7 +485,7 @@ def append_image_grid_to_notion(page_id: str, blocks: list[tuple[str, str]]):
             "type": "column_list",
             "column_list": {"children": columns},
         }
-        url_api = f"https://api.notion.com/v1/blocks/{page_id}/children"
+        url_api = f"{NOTION_API_URL}/v1/blocks/{page_id}/children"
         requests.patch(
             url_api, headers=HEADERS, json={"children": [column_list_block]}
         ).raise_for_status()
@@ -547,28 +504,29 @@ def main():
 
     periods = ["weekly", "monthly", "all"]
     all_blocks = []
+    # 期間ごとに集計して描画指示を作り、描画は全期間まとめてプロセスプールで行う
+    specs, outputs = [], []
+    # violation 行は 1 回だけ読み込み、3 期間をそこから集計する
+    now = time.time()
+    stats = ViolationStats.load(DB_PATH)
+    by_period = stats.periods(
+        {
+            "weekly": now - 7 * 24 * 3600,
+            "monthly": now - 30 * 24 * 3600,
+            "all": None,
+        }
+    )
     for period in periods:
-        # 期間のしきい値を計算
-        since_ts = None
-        if period == "weekly":
-            since_ts = __import__("time").time() - 7 * 24 * 3600
-        elif period == "monthly":
-            since_ts = __import__("time").time() - 30 * 24 * 3600
+        result = by_period[period]
 
         # 1. ルール別集計
-        counts = fetch_violation_counts(DB_PATH, since_ts)
+        counts = result.counts
         if not counts:
             logger.info(f"[{period}] 違反データが見つかりませんでした。")
             # 画像生成・アップロードはスキップ、空白画像を入れない
             continue
         logger.info(f"[{period}] ルール別発生件数: {dict(counts)}")
 
-        # 2. 時系列集計
-        time_series = fetch_time_series_counts(DB_PATH, since_ts)
-
-        # 3. 曜日・時間帯ヒートマップ
-        heatmap = fetch_weekday_hour_heatmap(DB_PATH, since_ts)
-
         # 画像ファイル名（タイムスタンプ付き）
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         base_name = f"violation_trends_{period}_{timestamp}"
@@ -576,11 +534,24 @@ def main():
         ts_path = f"{base_name}_timeseries.png"
         heatmap_path = f"{base_name}_heatmap.png"
 
-        # プロット作成
+        # プロット指示
         label = PERIOD_LABELS.get(period, period)
-        plot_violation_rule_counts(counts, label, hist_path)
-        plot_time_series(time_series, label, ts_path)
-        plot_heatmap(heatmap, label, heatmap_path)
+        specs += [
+            violation_rule_counts_spec(counts, label),
+            # 2. 時系列集計
+            time_series_spec(result.time_series, label),
+            # 3. 曜日・時間帯ヒートマップ
+            heatmap_spec(result.heatmap, label),
+        ]
+        outputs.append((period, label, hist_path, ts_path, heatmap_path))
+
+    pngs = iter(render_all(specs))
+    for period, label, hist_path, ts_path, heatmap_path in outputs:
+        for path in (hist_path, ts_path, heatmap_path):
+            save_png(next(pngs), path)
+        logger.info(
+            f"[{label}] グラフを '{hist_path}', '{ts_path}', '{heatmap_path}' に保存しました。"
+        )
 
         # 古いファイルをリモートサーバーから削除（同じ期間のもの）
         # try: